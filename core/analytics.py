@@ -0,0 +1,177 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import (
+    GRADE_POINTS, Course, CourseGradeCount, CourseGradeSummary, Grade, ProgramGradeSummary, StudentGradeSummary,
+)
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def _tenths(grade):
+    points = GRADE_POINTS.get(grade)
+    return None if points is None else round(points * 10)
+
+
+def _apply_totals(model, field, deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta != [0, 0]}
+    if not deltas:
+        return
+    rows = {
+        getattr(row, f'{field}_id'): row
+        for row in model.objects.select_for_update().filter(**{f'{field}_id__in': deltas})
+    }
+    changed, created, emptied = [], [], []
+    for key, (graded, points) in deltas.items():
+        row = rows.get(key)
+        if row is None:
+            # A removal with no row means its owner is being cascade-deleted
+            if graded <= 0:
+                continue
+            row = model(**{f'{field}_id': key})
+            created.append(row)
+        elif row.graded + graded <= 0:
+            emptied.append(row.pk)
+            continue
+        else:
+            changed.append(row)
+        row.graded = row.graded + graded
+        row.quality_points = max(row.quality_points + points, 0)
+    model.objects.filter(pk__in=emptied).delete()
+    model.objects.bulk_update(changed, ['graded', 'quality_points'])
+    model.objects.bulk_create(
+        created, update_conflicts=True, unique_fields=[field], update_fields=['graded', 'quality_points'],
+    )
+
+
+def _apply_counts(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    course_ids = {course_id for course_id, _ in deltas}
+    rows = {
+        (row.course_id, row.grade): row
+        for row in CourseGradeCount.objects.select_for_update().filter(course_id__in=course_ids)
+    }
+    changed, created, emptied = [], [], []
+    for (course_id, grade), delta in deltas.items():
+        row = rows.get((course_id, grade))
+        if row is None:
+            if delta <= 0:
+                continue
+            row = CourseGradeCount(course_id=course_id, grade=grade)
+            created.append(row)
+        elif row.count + delta <= 0:
+            emptied.append(row.pk)
+            continue
+        else:
+            changed.append(row)
+        row.count += delta
+    CourseGradeCount.objects.filter(pk__in=emptied).delete()
+    CourseGradeCount.objects.bulk_update(changed, ['count'])
+    CourseGradeCount.objects.bulk_create(
+        created, update_conflicts=True, unique_fields=['course', 'grade'], update_fields=['count'],
+    )
+
+
+def apply_grade_changes(removed=(), added=()):
+    """Fold grade changes into the materialised aggregates.
+
+    `removed` and `added` are iterables of (student_id, course_id, grade); an update is
+    the old grade removed and the new one added. Grades off the GPA scale are ignored."""
+    students = defaultdict(lambda: [0, 0])
+    courses = defaultdict(lambda: [0, 0])
+    counts = defaultdict(int)
+    for sign, grades in ((-1, removed), (1, added)):
+        for student_id, course_id, grade in grades:
+            points = _tenths(grade)
+            if points is None:
+                continue
+            for totals in (students[student_id], courses[course_id]):
+                totals[0] += sign
+                totals[1] += sign * points
+            counts[(course_id, grade)] += sign
+    if not courses:
+        return
+    programs = defaultdict(lambda: [0, 0])
+    for course_id, program_id in Course.objects.filter(id__in=courses).values_list('id', 'program_id'):
+        programs[program_id][0] += courses[course_id][0]
+        programs[program_id][1] += courses[course_id][1]
+    with transaction.atomic():
+        _apply_totals(StudentGradeSummary, 'student', students)
+        _apply_totals(CourseGradeSummary, 'course', courses)
+        _apply_totals(ProgramGradeSummary, 'program', programs)
+        _apply_counts(counts)
+
+
+def rebuild_grade_aggregates():
+    """Recompute every aggregate from the Grade table, e.g. after courses move between programs."""
+    with transaction.atomic():
+        for model in (StudentGradeSummary, CourseGradeSummary, ProgramGradeSummary, CourseGradeCount):
+            model.objects.all().delete()
+        chunk = []
+        for row in Grade.objects.values_list('student_id', 'course_id', 'grade').iterator(chunk_size=REBUILD_CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) >= REBUILD_CHUNK_SIZE:
+                apply_grade_changes(added=chunk)
+                chunk = []
+        apply_grade_changes(added=chunk)
+
+
+def grade_distributions(course_ids):
+    """{course_id: [(grade, count), ...]} in GPA-scale order, for one page of courses."""
+    order = {grade: i for i, grade in enumerate(GRADE_POINTS)}
+    distributions = defaultdict(list)
+    rows = CourseGradeCount.objects.filter(course_id__in=course_ids, count__gt=0).values_list(
+        'course_id', 'grade', 'count'
+    )
+    for course_id, grade, count in sorted(rows, key=lambda row: (row[0], order.get(row[1], len(order)))):
+        distributions[course_id].append((grade, count))
+    return distributions
+
+
+EXPORT_SCOPES = ('students', 'courses', 'programs')
+
+
+def export_rows(scope, chunk_size=2000):
+    """Yield CSV rows (header first) for one report scope, straight from the aggregates."""
+    if scope == 'students':
+        yield ['student_id', 'username', 'program', 'graded_courses', 'gpa']
+        summaries = StudentGradeSummary.objects.select_related('student__user', 'student__program').only(
+            'graded', 'quality_points', 'student__id', 'student__user__username', 'student__program__program_name',
+        ).order_by('id')
+        for summary in summaries.iterator(chunk_size=chunk_size):
+            program = summary.student.program
+            yield [
+                summary.student.id, summary.student.user.username, program.program_name if program else '',
+                summary.graded, summary.average,
+            ]
+    elif scope == 'courses':
+        yield ['course_id', 'course', 'program', 'graded', 'average'] + list(GRADE_POINTS)
+        summaries = CourseGradeSummary.objects.select_related('course__program').only(
+            'graded', 'quality_points', 'course__id', 'course__course_name', 'course__program__program_name',
+        ).order_by('id')
+        batch = []
+        for summary in summaries.iterator(chunk_size=chunk_size):
+            batch.append(summary)
+            if len(batch) >= chunk_size:
+                yield from _course_rows(batch)
+                batch = []
+        yield from _course_rows(batch)
+    elif scope == 'programs':
+        yield ['program_id', 'program', 'graded', 'average']
+        for summary in ProgramGradeSummary.objects.select_related('program').order_by('program__program_name'):
+            yield [summary.program.id, summary.program.program_name, summary.graded, summary.average]
+    else:
+        raise ValueError(f"Unknown export scope: {scope}")
+
+
+def _course_rows(summaries):
+    distributions = grade_distributions([summary.course_id for summary in summaries])
+    for summary in summaries:
+        counts = dict(distributions.get(summary.course_id, ()))
+        yield [
+            summary.course.id, summary.course.course_name, summary.course.program.program_name,
+            summary.graded, summary.average,
+        ] + [counts.get(grade, 0) for grade in GRADE_POINTS]
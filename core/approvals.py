@@ -0,0 +1,146 @@
+import random
+import string
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .models import Notification, Student, StudentRequest
+from .stats import invalidate_dashboard_stats
+from .usernames import base_username_for, next_free_username, taken_usernames
+
+APPROVAL_MESSAGE = (
+    "Your student account has been approved. Username: {username}. "
+    "Please contact the admin to obtain your password."
+)
+
+# Below this many passwords a process pool costs more to start than it saves
+PARALLEL_HASH_THRESHOLD = 8
+
+
+@dataclass
+class RequestOutcome:
+    request_id: int
+    status: str
+    username: str = ''
+    error: str = ''
+
+
+def generate_password():
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+
+
+def _init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def hashing_pool(max_workers=None):
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
+
+
+def hash_passwords(passwords, max_workers=1, pool=None):
+    """Hash raw passwords with the configured hasher, in this process by default.
+
+    Management commands pass max_workers (None for one process per CPU) or a pool from
+    hashing_pool() to hash large batches across processes; web requests never do."""
+    passwords = list(passwords)
+    if pool is None and (len(passwords) < PARALLEL_HASH_THRESHOLD or max_workers == 1):
+        return [make_password(password) for password in passwords]
+    if pool is not None:
+        return list(pool.map(make_password, passwords, chunksize=16))
+    with hashing_pool(max_workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=16))
+
+
+def _approve_batch(student_requests, password_hashes):
+    bases = [base_username_for(req) for req in student_requests]
+    taken = taken_usernames(bases)
+    usernames = []
+    for base in bases:
+        # Names handed out earlier in the batch count as taken for the later requests
+        username = next_free_username(base, taken)
+        taken.add(username)
+        usernames.append(username)
+
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(username=username, email=req.email, password=password_hash)
+            for req, username, password_hash in zip(student_requests, usernames, password_hashes)
+        ])
+        # Not every backend returns primary keys from bulk_create, so read the users back
+        users = User.objects.in_bulk(usernames, field_name='username')
+        Student.objects.bulk_create([
+            Student(
+                user=users[username],
+                first_name=req.first_name,
+                last_name=req.last_name,
+                phone=req.phone,
+                date_of_birth=req.date_of_birth,
+                address=req.address,
+            )
+            for req, username in zip(student_requests, usernames)
+        ])
+        Notification.objects.bulk_create([
+            Notification(user=users[username], message=APPROVAL_MESSAGE.format(username=username))
+            for username in usernames
+        ])
+        StudentRequest.objects.filter(id__in=[req.id for req in student_requests]).delete()
+    # bulk_create sends no post_save for the new students
+    invalidate_dashboard_stats()
+    return [
+        RequestOutcome(request_id=req.id, status='approved', username=username)
+        for req, username in zip(student_requests, usernames)
+    ]
+
+
+def approve_requests(request_ids=None, batch_size=500, max_workers=1, attempts=3):
+    """Approve the given StudentRequest ids, or every pending request when request_ids is None.
+
+    Each batch is written with bulk_create in a single transaction; a batch that loses a
+    username race with a concurrent approval is rolled back and re-allocated.
+    """
+    queryset = StudentRequest.objects.order_by('id')
+    if request_ids is not None:
+        request_ids = [int(request_id) for request_id in request_ids]
+        queryset = queryset.filter(id__in=request_ids)
+    student_requests = list(queryset)
+    found = {req.id for req in student_requests}
+    outcomes = [
+        RequestOutcome(request_id=request_id, status='missing', error="Request not found.")
+        for request_id in (request_ids or []) if request_id not in found
+    ]
+
+    password_hashes = hash_passwords([generate_password() for _ in student_requests], max_workers)
+    for offset in range(0, len(student_requests), batch_size):
+        batch = student_requests[offset:offset + batch_size]
+        hashes = password_hashes[offset:offset + batch_size]
+        for attempt in range(attempts):
+            try:
+                outcomes.extend(_approve_batch(batch, hashes))
+                break
+            except IntegrityError as e:
+                if attempt == attempts - 1:
+                    outcomes.extend(
+                        RequestOutcome(request_id=req.id, status='failed', error=str(e)) for req in batch
+                    )
+    return outcomes
+
+
+def reject_requests(request_ids=None):
+    queryset = StudentRequest.objects.all()
+    if request_ids is not None:
+        request_ids = [int(request_id) for request_id in request_ids]
+        queryset = queryset.filter(id__in=request_ids)
+    rejected = set(queryset.values_list('id', flat=True))
+    queryset.delete()
+    outcomes = [RequestOutcome(request_id=request_id, status='rejected') for request_id in sorted(rejected)]
+    outcomes.extend(
+        RequestOutcome(request_id=request_id, status='missing', error="Request not found.")
+        for request_id in (request_ids or []) if request_id not in rejected
+    )
+    return outcomes
@@ -0,0 +1,315 @@
+import datetime
+import gc
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import DAYS_OF_WEEK, Course, Enrollment, Notification, Program, Student, StudentRequest
+from .usernames import base_username
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+SEED_BATCH_SIZE = 5000
+
+# Data volumes for the generator. 'full' is the production-sized profile; 'small' keeps
+# the same shape (enrollments and notifications per student) at a size CI can afford.
+SCALES = {
+    'full': {'programs': 40, 'courses': 2000, 'students': 50000, 'enrollments': 500000,
+             'notifications': 1000000, 'requests': 5000},
+    'small': {'programs': 10, 'courses': 200, 'students': 2000, 'enrollments': 20000,
+              'notifications': 40000, 'requests': 500},
+    'tiny': {'programs': 2, 'courses': 20, 'students': 20, 'enrollments': 100,
+             'notifications': 200, 'requests': 20},
+}
+
+# Distinct weekly slots a program's courses are spread over; a program with more courses
+# than slots reuses them, so the course list has some clashes to flag.
+WEEKDAYS = [day for day, _ in DAYS_OF_WEEK[:5]]
+SLOTS = [(day, datetime.time(hour)) for hour in range(8, 18) for day in WEEKDAYS]
+
+
+def _bulk(model, objects):
+    model.objects.bulk_create(objects, batch_size=SEED_BATCH_SIZE)
+
+
+def seed(scale='small', seed=0, log=None):
+    """Populate an empty database with a realistic volume of programs, courses, students,
+    enrollments, notifications and pending requests, plus the fixed accounts the
+    benchmarks log in as. Rows are written with bulk_create, so no signals run."""
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    password = make_password(BENCHMARK_PASSWORD)
+
+    def step(message):
+        if log:
+            log(message)
+
+    with transaction.atomic():
+        step("Programs and courses")
+        _bulk(Program, [Program(program_name=f"Program {n:03d}") for n in range(sizes['programs'])])
+        program_ids = list(Program.objects.order_by('id').values_list('id', flat=True))
+        courses = []
+        for n in range(sizes['courses']):
+            day, start = SLOTS[(n // len(program_ids)) % len(SLOTS)]
+            courses.append(Course(
+                course_name=f"Course {n:05d}", program_id=program_ids[n % len(program_ids)],
+                day_of_week=day, start_time=start, end_time=start.replace(minute=50),
+                semester='Semester 1' if n % 2 else 'Semester 2',
+            ))
+        _bulk(Course, courses)
+        courses_by_program = {}
+        for course in Course.objects.order_by('id').values('id', 'program_id', 'day_of_week', 'start_time', 'end_time'):
+            courses_by_program.setdefault(course['program_id'], []).append(course)
+
+        step("Users and students")
+        _bulk(User, [User(username='bench_admin', email='bench_admin@example.com', password=password, is_staff=True)])
+        _bulk(User, [
+            User(username=f"student{n:06d}", email=f"student{n:06d}@example.com", password=password)
+            for n in range(sizes['students'])
+        ] + [User(username='bench_new', email='bench_new@example.com', password=password)])
+        user_ids = dict(User.objects.filter(is_staff=False).values_list('username', 'id'))
+        _bulk(Student, [
+            Student(
+                user_id=user_id, first_name="Bench", last_name=username, phone='0000000000',
+                date_of_birth=datetime.date(2000, 1, 1), address="1 Benchmark Road",
+                # bench_new has no program yet: it is the account that registers for one
+                program_id=None if username == 'bench_new' else program_ids[user_id % len(program_ids)],
+            )
+            for username, user_id in user_ids.items()
+        ])
+
+        step("Enrollments")
+        students = list(Student.objects.exclude(program=None).order_by('id').values_list('id', 'program_id'))
+        per_student = max(sizes['enrollments'] // len(students), 1)
+        batch = []
+        for student_id, program_id in students:
+            # Courses in distinct slots, so a student's own timetable never clashes
+            seen_slots, picked = set(), []
+            for course in rng.sample(courses_by_program[program_id], len(courses_by_program[program_id])):
+                slot = (course['day_of_week'], course['start_time'])
+                if slot not in seen_slots:
+                    seen_slots.add(slot)
+                    picked.append(course)
+                if len(picked) == per_student:
+                    break
+            batch.extend(
+                Enrollment(
+                    student_id=student_id, course_id=course['id'], day_of_week=course['day_of_week'],
+                    start_time=course['start_time'], end_time=course['end_time'],
+                )
+                for course in picked
+            )
+            if len(batch) >= SEED_BATCH_SIZE:
+                _bulk(Enrollment, batch)
+                batch = []
+        _bulk(Enrollment, batch)
+
+        step("Notifications")
+        per_user = max(sizes['notifications'] // len(user_ids), 1)
+        batch = []
+        for user_id in user_ids.values():
+            batch.extend(
+                Notification(user_id=user_id, message=f"Notification {n}", read=n >= per_user // 4)
+                for n in range(per_user)
+            )
+            if len(batch) >= SEED_BATCH_SIZE:
+                _bulk(Notification, batch)
+                batch = []
+        _bulk(Notification, batch)
+
+        step("Student requests")
+        # bulk_create skips the pre_save receiver that sets username_base
+        date_of_birth = datetime.date(2001, 1, 1)
+        _bulk(StudentRequest, [
+            StudentRequest(
+                first_name="Applicant", last_name=f"{n:06d}", email=f"applicant{n:06d}@example.com",
+                phone='0000000000', date_of_birth=date_of_birth, address="2 Benchmark Road",
+                username_base=base_username("Applicant", f"{n:06d}", date_of_birth),
+            )
+            for n in range(sizes['requests'])
+        ])
+    cache.clear()
+
+
+def is_seeded():
+    return User.objects.filter(username='bench_admin').exists()
+
+
+@dataclass
+class Benchmark:
+    name: str
+    url_name: str
+    method: str = 'get'
+    user: str | None = None
+    expected_status: int = 200
+
+    def url(self, context):
+        if self.url_name == 'enroll_course':
+            return reverse(self.url_name, args=[context['enroll_course_id']])
+        return reverse(self.url_name)
+
+    def data(self, context):
+        if self.url_name == 'login':
+            return {'username': context['student'].username, 'password': BENCHMARK_PASSWORD}
+        if self.url_name == 'register_program':
+            return {'program': context['program_id']}
+        return None
+
+
+# The hot request paths. Writes (login, enroll, register) run in a transaction that is
+# rolled back after each request, so every iteration sees the same data.
+BENCHMARKS = [
+    Benchmark('login', 'login', method='post', expected_status=302),
+    Benchmark('student_dashboard', 'student_dashboard', user='student'),
+    Benchmark('timetable', 'timetable', user='student'),
+    Benchmark('courses', 'courses', user='student'),
+    Benchmark('enroll_course', 'enroll_course', method='post', user='student', expected_status=302),
+    Benchmark('register_program', 'register_program', method='post', user='new_student', expected_status=302),
+    Benchmark('student_requests', 'student_request_list', user='admin'),
+    Benchmark('admin_dashboard', 'admin_dashboard', user='admin'),
+]
+
+
+@dataclass
+class Result:
+    name: str
+    queries: int
+    median_ms: float
+    p95_ms: float
+    peak_kib: float
+
+
+def benchmark_context():
+    """The accounts and ids the benchmarks use, picked from the seeded data."""
+    student = Student.objects.select_related('user').exclude(program=None).filter(
+        user__username__startswith='student',
+    ).order_by('id').first()
+    enrolled = Enrollment.objects.filter(student=student)
+    taken_slots = set(enrolled.values_list('day_of_week', 'start_time'))
+    # A course of the student's program in a free slot, so enrolling takes the full write path
+    enroll_course_id = next(
+        course.id for course in Course.objects.filter(program=student.program).exclude(
+            id__in=enrolled.values('course_id'),
+        ).order_by('id')
+        if (course.day_of_week, course.start_time) not in taken_slots
+    )
+    return {
+        'student': student.user,
+        'new_student': User.objects.get(username='bench_new'),
+        'admin': User.objects.get(username='bench_admin'),
+        'program_id': student.program_id,
+        'enroll_course_id': enroll_course_id,
+    }
+
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _request(client, benchmark, url, data):
+    try:
+        with transaction.atomic():
+            response = getattr(client, benchmark.method)(url, data)
+            if benchmark.method != 'get':
+                raise _Rollback(response)
+    except _Rollback as rollback:
+        response = rollback.args[0]
+    if response.status_code != benchmark.expected_status:
+        raise AssertionError(
+            f"{benchmark.name}: expected HTTP {benchmark.expected_status}, got {response.status_code}"
+        )
+    return response
+
+
+def run_benchmark(benchmark, context, iterations=20, warmup=2):
+    """Time one request path: query count and peak traced memory from a single request,
+    latency from `iterations` untraced ones after `warmup` requests to fill caches."""
+    client = Client()
+    if benchmark.user:
+        client.force_login(context[benchmark.user])
+    url, data = benchmark.url(context), benchmark.data(context)
+    for _ in range(warmup):
+        _request(client, benchmark, url, data)
+
+    with CaptureQueriesContext(connection) as queries:
+        _request(client, benchmark, url, data)
+    # Transaction control isn't work the view asked for: it depends on the rollback wrapper
+    # and on the database's transaction mode (SQLite logs BEGIN IMMEDIATE, for one)
+    query_count = sum(
+        1 for query in queries.captured_queries if not query['sql'].startswith(TRANSACTION_STATEMENTS)
+    )
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _request(client, benchmark, url, data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        _request(client, benchmark, url, data)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return Result(
+        name=benchmark.name,
+        queries=query_count,
+        median_ms=round(statistics.median(timings), 3),
+        p95_ms=round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        peak_kib=round(peak / 1024, 1),
+    )
+
+
+def run_benchmarks(names=None, iterations=20, warmup=2):
+    context = benchmark_context()
+    return [
+        run_benchmark(benchmark, context, iterations=iterations, warmup=warmup)
+        for benchmark in BENCHMARKS
+        if names is None or benchmark.name in names
+    ]
+
+
+def save_baseline(path, results, scale):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'scale': scale, 'results': {r.name: asdict(r) for r in results}}, f, indent=2)
+        f.write('\n')
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=0.25, query_threshold=0):
+    """Regressions against a baseline: more queries than allowed, or peak memory grown
+    by more than `threshold` (a fraction). Both are deterministic for a given seed and
+    scale; latency is not compared, as the baseline and the run may be on different
+    machines. Paths missing from the baseline are skipped."""
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.queries > base['queries'] + query_threshold:
+            regressions.append(f"{result.name}: {result.queries} queries (baseline {base['queries']})")
+        limit = base['peak_kib'] * (1 + threshold)
+        if result.peak_kib > limit:
+            regressions.append(
+                f"{result.name}: peak_kib {result.peak_kib}KiB (baseline {base['peak_kib']}KiB, limit {limit:.1f}KiB)"
+            )
+    return regressions
@@ -0,0 +1,141 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Broadcast, Enrollment, Notification, Student
+from .notifications import invalidate_unread_count
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CHUNK_SIZE = 1000
+# A running delivery records a heartbeat with every chunk; one silent for this long
+# belongs to a process that died, and may be reclaimed
+DEFAULT_STALE_SECONDS = 600
+
+# Deliveries run outside the request cycle; two workers keep a burst of broadcasts
+# from competing with request threads for the database
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='broadcast')
+
+
+def _recipient_rows(broadcast):
+    # (row id, user id) for everyone enrolled in the course or registered in the program
+    if broadcast.course_id:
+        return Enrollment.objects.filter(course_id=broadcast.course_id).values_list('id', 'student__user_id')
+    return Student.objects.filter(program_id=broadcast.program_id).values_list('id', 'user_id')
+
+
+def recipient_count(broadcast):
+    if broadcast.course_id:
+        return Enrollment.objects.filter(course_id=broadcast.course_id).values('student').distinct().count()
+    return Student.objects.filter(program_id=broadcast.program_id).count()
+
+
+def recipient_chunks(broadcast, chunk_size=BROADCAST_CHUNK_SIZE, after=0):
+    """Yield (last row id, recipient user ids) per chunk of rows after `after`, paging
+    by row id so no cursor stays open while the chunks are being written."""
+    rows = _recipient_rows(broadcast)
+    last_id = after
+    seen = set()
+    while True:
+        chunk = list(rows.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        user_ids = [user_id for _, user_id in chunk if user_id not in seen]
+        seen.update(user_ids)
+        if user_ids:
+            yield last_id, user_ids
+
+
+def start_broadcast(message, created_by, course=None, program=None):
+    """Record a broadcast and queue its delivery once the row is committed."""
+    broadcast = Broadcast.objects.create(
+        message=message, created_by=created_by, course=course, program=program
+    )
+    transaction.on_commit(lambda: _executor.submit(_run_delivery, broadcast.id))
+    return broadcast
+
+
+def _run_delivery(broadcast_id):
+    close_old_connections()
+    try:
+        deliver_broadcast(broadcast_id)
+    except Exception:
+        logger.exception("Broadcast %s failed", broadcast_id)
+    finally:
+        # Worker threads own their connections; do not leave them open between jobs
+        connection.close()
+
+
+def _flush(broadcast, last_id, notifications):
+    with transaction.atomic():
+        Notification.objects.bulk_create(notifications)
+        Broadcast.objects.filter(id=broadcast.id).update(
+            sent=F('sent') + len(notifications), last_recipient_id=last_id, updated_at=timezone.now()
+        )
+    # bulk_create sends no post_save, so drop the recipients' cached unread counts here
+    invalidate_unread_count(*(notification.user_id for notification in notifications))
+
+
+def stale_cutoff():
+    seconds = getattr(settings, 'BROADCAST_STALE_SECONDS', DEFAULT_STALE_SECONDS)
+    return timezone.now() - timedelta(seconds=seconds)
+
+
+def deliver_broadcast(broadcast_id, chunk_size=BROADCAST_CHUNK_SIZE, stale_before=None):
+    """Fan a broadcast out as Notification rows in chunked bulk_create batches,
+    recording progress on the Broadcast after each chunk.
+
+    Only a pending broadcast is claimed, or, given `stale_before`, one whose last
+    heartbeat is older than that: a delivery whose process died. A reclaimed delivery
+    resumes after the last committed chunk. Returns whether the broadcast was claimed."""
+    claimable = Broadcast.objects.filter(id=broadcast_id)
+    if stale_before is None:
+        claimable = claimable.filter(status='pending')
+    else:
+        claimable = claimable.filter(status__in=['pending', 'running'], updated_at__lt=stale_before)
+    if not claimable.update(status='running', updated_at=timezone.now()):
+        return False
+    broadcast = Broadcast.objects.get(id=broadcast_id)
+    if broadcast.course_id is None and broadcast.program_id is None:
+        # The target was deleted (SET_NULL) after queueing; program_id=None would match
+        # every student without a program, so send nothing
+        Broadcast.objects.filter(id=broadcast.id).update(
+            status='failed', error="The course or program was deleted before delivery.",
+            finished_at=timezone.now(),
+        )
+        return True
+    try:
+        Broadcast.objects.filter(id=broadcast.id).update(total_recipients=recipient_count(broadcast))
+        for last_id, user_ids in recipient_chunks(broadcast, chunk_size, after=broadcast.last_recipient_id):
+            _flush(broadcast, last_id, [Notification(user_id=user_id, message=broadcast.message) for user_id in user_ids])
+    except Exception as e:
+        Broadcast.objects.filter(id=broadcast.id).update(
+            status='failed', error=str(e), finished_at=timezone.now()
+        )
+        raise
+    Broadcast.objects.filter(id=broadcast.id).update(status='done', finished_at=timezone.now())
+    return True
+
+
+def resume_stale_broadcasts(chunk_size=BROADCAST_CHUNK_SIZE):
+    """Deliver, in this process, every broadcast left pending or running by a process
+    that died, each resuming after its last committed chunk. Returns the ids of the
+    broadcasts this call delivered; one that fails again is left marked failed."""
+    cutoff = stale_cutoff()
+    stale = Broadcast.objects.filter(
+        status__in=['pending', 'running'], updated_at__lt=cutoff
+    ).order_by('id').values_list('id', flat=True)
+    delivered = []
+    for broadcast_id in list(stale):
+        try:
+            if deliver_broadcast(broadcast_id, chunk_size, stale_before=cutoff):
+                delivered.append(broadcast_id)
+        except Exception:
+            logger.exception("Broadcast %s failed", broadcast_id)
+    return delivered
@@ -0,0 +1,148 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from .models import Enrollment
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def can_access_document(user, document):
+    # Staff may fetch any document; students only those of courses they are enrolled in
+    return user.is_staff or Enrollment.objects.filter(
+        student__user=user, course_id=document.course_id
+    ).exists()
+
+
+class _RangeFile:
+    """Read-only view of `length` bytes of an open file starting at its current position.
+
+    It deliberately has no fileno/tell/seek, so FileResponse and wsgi.file_wrapper
+    stream it in blocks instead of sending the file to EOF."""
+
+    def __init__(self, file, length):
+        self._file = file
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _file_etag(stat):
+    return quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single satisfiable byte range, None when the
+    header is absent or not a single range (serve the whole file), or False when it is
+    unsatisfiable."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    if size == 0:
+        # An empty file has no bytes to satisfy any range, suffix ranges included
+        return False
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _range_is_fresh(request, etag, last_modified):
+    """If-Range: only honour Range when the client's validator still matches."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return etag in parse_etags(if_range)
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _accel_response(document, content_type):
+    backend = getattr(settings, 'DOCUMENT_SENDFILE_BACKEND', '')
+    if backend == 'nginx':
+        prefix = getattr(settings, 'DOCUMENT_ACCEL_REDIRECT_PREFIX', '/protected/')
+        response = HttpResponse(content_type=content_type)
+        # nginx decodes the URI before looking the file up, so quote names with spaces or %
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(document.document.name)
+        return response
+    if backend == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = document.document.path
+        return response
+    return None
+
+
+def serve_document(request, document):
+    """Serve a CourseDocument file with conditional GET and single Range support.
+
+    Behind nginx/Apache (DOCUMENT_SENDFILE_BACKEND) the proxy is told to send the file
+    itself. Otherwise a FileResponse is returned; whole files and open-ended ranges keep
+    the real file object so the WSGI server can use sendfile.
+    """
+    # Content-addressed blobs are named by hash, so prefer the name it was uploaded under
+    filename = document.original_name or os.path.basename(document.document.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accel = _accel_response(document, content_type)
+    if accel is not None:
+        return accel
+
+    path = document.document.path
+    stat = os.stat(path)
+    etag = _file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    size = stat.st_size
+    byte_range = None
+    if _range_is_fresh(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE', ''), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, filename=filename)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        if end == size - 1:
+            response = FileResponse(file, status=206, content_type=content_type, filename=filename)
+        else:
+            response = FileResponse(
+                _RangeFile(file, end - start + 1), status=206, content_type=content_type, filename=filename
+            )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
@@ -0,0 +1,124 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .models import Course, Enrollment
+from .schedule import ScheduleIndex, invalidate_schedule_index
+from .stats import invalidate_dashboard_stats
+from .timetable import invalidate_timetable
+
+
+@dataclass
+class EnrollmentResult:
+    enrolled: list = field(default_factory=list)
+    conflicts: list = field(default_factory=list)
+    already_enrolled: list = field(default_factory=list)
+
+
+def plan_enrollments(index, courses):
+    """Split courses into (to_enroll, conflicts, already_enrolled) without touching the DB.
+
+    index is the student's ScheduleIndex and is updated in place: courses accepted
+    earlier in the same call count as taken slots for the later ones.
+    """
+    to_enroll, conflicts, already_enrolled = [], [], []
+    for course in courses:
+        if course.id in index.course_ids:
+            already_enrolled.append(course)
+        elif index.conflicts_with(course):
+            conflicts.append(course)
+        else:
+            index.add_course(course)
+            to_enroll.append(course)
+    return to_enroll, conflicts, already_enrolled
+
+
+def _build_enrollment(student, course):
+    # bulk_create skips Enrollment.save, so copy the schedule from the course here
+    return Enrollment(
+        student=student,
+        course=course,
+        day_of_week=course.day_of_week,
+        start_time=course.start_time,
+        end_time=course.end_time,
+    )
+
+
+def enroll_in_courses(student, courses):
+    # Always plan against the database rather than the cached index
+    index = ScheduleIndex.for_student(student)
+    to_enroll, conflicts, already_enrolled = plan_enrollments(index, courses)
+    with transaction.atomic():
+        # A concurrent request may have enrolled the student in one of these since the plan
+        # was made: report those as already enrolled. The unique (student, course)
+        # constraint turns any that slip in after this check into a no-op.
+        if to_enroll:
+            taken = set(Enrollment.objects.filter(
+                student=student, course__in=to_enroll,
+            ).values_list('course_id', flat=True))
+            already_enrolled += [course for course in to_enroll if course.id in taken]
+            to_enroll = [course for course in to_enroll if course.id not in taken]
+        Enrollment.objects.bulk_create(
+            [_build_enrollment(student, course) for course in to_enroll], ignore_conflicts=True,
+        )
+    # bulk_create sends no signals, so invalidate the caches that depend on enrollments here
+    invalidate_schedule_index(student.id)
+    invalidate_timetable(student.id)
+    invalidate_dashboard_stats()
+    return EnrollmentResult(enrolled=to_enroll, conflicts=conflicts, already_enrolled=already_enrolled)
+
+
+def register_program(student, program):
+    """Assign the program to the student and enroll them in all of its courses in one transaction."""
+    courses = Course.objects.filter(program=program).order_by('id')
+    with transaction.atomic():
+        student.program = program
+        student.save(update_fields=['program'])
+        return enroll_in_courses(student, courses)
+
+
+def enroll_cohort(students, courses, batch_size=500):
+    """Enroll many students in the same courses, one existing-enrollment query and one
+    bulk_create per batch of students. Returns a dict of student id -> EnrollmentResult.
+    """
+    courses = list(courses)
+    students = list(students)
+    results = {}
+    for offset in range(0, len(students), batch_size):
+        batch = students[offset:offset + batch_size]
+        indexes = defaultdict(ScheduleIndex)
+        existing = Enrollment.objects.filter(student__in=batch).values_list(
+            'student_id', 'course_id', 'day_of_week', 'start_time', 'end_time'
+        )
+        for student_id, course_id, day, start, end in existing:
+            indexes[student_id].add(day, start, end, course_id=course_id)
+        new_enrollments = []
+        for student in batch:
+            to_enroll, conflicts, already_enrolled = plan_enrollments(indexes[student.id], courses)
+            new_enrollments.extend(_build_enrollment(student, course) for course in to_enroll)
+            results[student.id] = EnrollmentResult(
+                enrolled=to_enroll, conflicts=conflicts, already_enrolled=already_enrolled
+            )
+        with transaction.atomic():
+            # Pairs enrolled since the existing rows were read are skipped, not reported as new
+            planned = {(enrollment.student_id, enrollment.course_id) for enrollment in new_enrollments}
+            taken = set()
+            if planned:
+                taken = planned & set(Enrollment.objects.filter(
+                    student__in=batch, course__in=courses,
+                ).values_list('student_id', 'course_id'))
+            for student_id, course_id in taken:
+                result = results[student_id]
+                course = next(course for course in result.enrolled if course.id == course_id)
+                result.enrolled.remove(course)
+                result.already_enrolled.append(course)
+            new_enrollments = [
+                enrollment for enrollment in new_enrollments
+                if (enrollment.student_id, enrollment.course_id) not in taken
+            ]
+            Enrollment.objects.bulk_create(new_enrollments, batch_size=batch_size, ignore_conflicts=True)
+        invalidate_schedule_index(*(student.id for student in batch))
+        invalidate_timetable(*(student.id for student in batch))
+    invalidate_dashboard_stats()
+    return results
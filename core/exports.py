@@ -0,0 +1,120 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef
+
+from .models import Course, Enrollment, Grade, Student
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ('csv', 'json')
+
+# kind -> (model, [(column, field path)], program filter path, semester filter path).
+# The first field must be the primary key: rows are fetched in id-ordered chunks.
+EXPORTS = {
+    'students': (Student, [
+        ('id', 'id'),
+        ('username', 'user__username'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('email', 'user__email'),
+        ('phone', 'phone'),
+        ('date_of_birth', 'date_of_birth'),
+        ('program', 'program__program_name'),
+    ], 'program_id', None),
+    'courses': (Course, [
+        ('id', 'id'),
+        ('course_name', 'course_name'),
+        ('program', 'program__program_name'),
+        ('day_of_week', 'day_of_week'),
+        ('start_time', 'start_time'),
+        ('end_time', 'end_time'),
+        ('semester', 'semester'),
+    ], 'program_id', 'semester'),
+    'enrollments': (Enrollment, [
+        ('id', 'id'),
+        ('username', 'student__user__username'),
+        ('course_id', 'course_id'),
+        ('course_name', 'course__course_name'),
+        ('program', 'course__program__program_name'),
+        ('semester', 'course__semester'),
+        ('day_of_week', 'day_of_week'),
+        ('start_time', 'start_time'),
+        ('end_time', 'end_time'),
+    ], 'course__program_id', 'course__semester'),
+    'grades': (Grade, [
+        ('id', 'id'),
+        ('username', 'student__user__username'),
+        ('course_id', 'course_id'),
+        ('course_name', 'course__course_name'),
+        ('program', 'course__program__program_name'),
+        ('semester', 'course__semester'),
+        ('grade', 'grade'),
+    ], 'course__program_id', 'course__semester'),
+}
+
+
+def export_queryset(kind, program=None, semester=None):
+    model, columns, program_path, semester_path = EXPORTS[kind]
+    queryset = model.objects.all()
+    if program:
+        queryset = queryset.filter(**{program_path: program})
+    if semester:
+        if semester_path:
+            queryset = queryset.filter(**{semester_path: semester})
+        else:
+            # Students have no semester of their own: keep those enrolled in one that term
+            queryset = queryset.filter(Exists(
+                Enrollment.objects.filter(student=OuterRef('pk'), course__semester=semester)
+            ))
+    return queryset.values_list(*(path for _, path in columns))
+
+
+def iter_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the rows of an id-first values_list queryset in keyset-paginated chunks.
+
+    Unlike a single iterator() query this keeps memory flat on MySQL too, whose client
+    library buffers a whole result set."""
+    last_id = None
+    while True:
+        chunk = queryset.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def export_columns(kind):
+    return [column for column, _ in EXPORTS[kind][1]]
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(header, rows):
+    """A JSON array of objects, emitted one object at a time."""
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def stream_export(kind, export_format='csv', program=None, semester=None, chunk_size=EXPORT_CHUNK_SIZE):
+    rows = iter_rows(export_queryset(kind, program=program, semester=semester), chunk_size=chunk_size)
+    stream = stream_json if export_format == 'json' else stream_csv
+    return stream(export_columns(kind), rows)
@@ -1,5 +1,6 @@
 from django import forms
-from .models import StudentRequest, Course, Grade, Enrollment
+from .grades import normalize_grade
+from .models import StudentRequest, Student, Course, Grade, Enrollment, Program, Broadcast, RosterImport, DAYS_OF_WEEK, GRADE_POINTS, SEMESTER_CHOICES
 
 class StudentRequestForm(forms.ModelForm):
     class Meta:
@@ -37,6 +38,40 @@ class GradeForm(forms.ModelForm):
             'grade': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Student.__str__ reads user.username; join it instead of one query per option
+        self.fields['student'].queryset = Student.objects.for_picker()
+
+    def validate_unique(self):
+        # Re-grading overwrites the existing grade (see core.grades.upsert_grades)
+        pass
+
+    def clean_grade(self):
+        grade = normalize_grade(self.cleaned_data['grade'])
+        if grade is None:
+            raise forms.ValidationError(f"Enter one of: {', '.join(GRADE_POINTS)}.")
+        return grade
+
+    def clean(self):
+        cleaned_data = super().clean()
+        student, course = cleaned_data.get('student'), cleaned_data.get('course')
+        if student and course and not Enrollment.objects.filter(student=student, course=course).exists():
+            raise forms.ValidationError(f"{student} is not enrolled in {course}.")
+        return cleaned_data
+
+class GradeImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="CSV or XLSX with columns username, course_id and grade (course_id is not needed for a single course).",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control-file', 'accept': '.csv,.xlsx'}),
+    )
+    course = forms.ModelChoiceField(
+        queryset=Course.objects.order_by('course_name'),
+        required=False,
+        empty_label="Course from the course_id column",
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
 class EnrollmentForm(forms.ModelForm):
     class Meta:
         model = Enrollment
@@ -44,4 +79,65 @@ class EnrollmentForm(forms.ModelForm):
         widgets = {
             'student': forms.Select(attrs={'class': 'form-control'}),
             'course': forms.Select(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+class RosterImportForm(forms.Form):
+    kind = forms.ChoiceField(
+        choices=RosterImport.KIND_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    file = forms.FileField(
+        help_text="UTF-8 CSV with a header row.",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control-file', 'accept': '.csv'}),
+    )
+
+class CourseFilterForm(forms.Form):
+    program = forms.ModelChoiceField(
+        queryset=Program.objects.order_by('program_name'),
+        required=False,
+        empty_label="All programs",
+        widget=forms.Select(attrs={'class': 'form-control mr-2'}),
+    )
+    semester = forms.ChoiceField(
+        choices=[('', 'All semesters')] + SEMESTER_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control mr-2'}),
+    )
+    day_of_week = forms.ChoiceField(
+        choices=[('', 'All days')] + DAYS_OF_WEEK,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control mr-2'}),
+    )
+
+    def filter(self, queryset):
+        if not self.is_valid():
+            return queryset
+        for field in ('program', 'semester', 'day_of_week'):
+            if self.cleaned_data[field]:
+                queryset = queryset.filter(**{field: self.cleaned_data[field]})
+        return queryset
+
+class BroadcastForm(forms.ModelForm):
+    class Meta:
+        model = Broadcast
+        fields = ['course', 'program', 'message']
+        widgets = {
+            'course': forms.Select(attrs={'class': 'form-control'}),
+            'program': forms.Select(attrs={'class': 'form-control'}),
+            'message': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Courses are searched through course_search a page at a time; render only the
+        # chosen one instead of every course as an option
+        field = self.fields['course']
+        value = str(self['course'].value() or '')
+        chosen = field.queryset.for_picker().filter(id=value) if value.isdigit() else []
+        field.widget.choices = [('', field.empty_label)] + [(course.id, course.course_name) for course in chosen]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if bool(cleaned_data.get('course')) == bool(cleaned_data.get('program')):
+            raise forms.ValidationError("Choose either a course or a program.")
+        return cleaned_data
@@ -0,0 +1,207 @@
+import csv
+import io
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .models import GRADE_POINTS, Course, Enrollment, Grade, Student
+from .analytics import apply_grade_changes
+from .stats import invalidate_dashboard_stats
+
+try:
+    from openpyxl import load_workbook
+except ImportError:  # openpyxl is optional; only CSV imports are accepted without it
+    load_workbook = None
+
+VALIDATION_CHUNK_SIZE = 500
+UPSERT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+
+
+class GradeImportError(Exception):
+    pass
+
+
+@dataclass
+class GradeImportResult:
+    saved: int = 0
+    errors: list = field(default_factory=list)
+    error_count: int = 0
+
+    def add_error(self, row, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row, message))
+
+
+def normalize_grade(value):
+    grade = (value or '').strip().upper()
+    return grade if grade in GRADE_POINTS else None
+
+
+def _csv_rows(uploaded_file):
+    # TextIOWrapper decodes lazily, so the file is never read into memory whole
+    reader = csv.reader(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''))
+    yield from reader
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    # Spreadsheets store ids as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _xlsx_rows(uploaded_file):
+    if load_workbook is None:
+        raise GradeImportError("XLSX files need openpyxl installed; upload a CSV instead.")
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        for values in workbook.active.iter_rows(values_only=True):
+            yield [_cell_text(value) for value in values]
+    finally:
+        workbook.close()
+
+
+def _data_rows(header, rows):
+    try:
+        for number, values in enumerate(rows, start=2):
+            if any(value.strip() for value in values):
+                yield number, dict(zip(header, (value.strip() for value in values)))
+    except UnicodeDecodeError:
+        raise GradeImportError("CSV files must be UTF-8 encoded.")
+
+
+def read_rows(uploaded_file):
+    """Return the lower-cased header and an iterator of (row number, {column: value})
+    over the data rows of a CSV or XLSX upload."""
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(uploaded_file)
+    elif extension == '.xlsx':
+        rows = _xlsx_rows(uploaded_file)
+    else:
+        raise GradeImportError("Upload a .csv or .xlsx file.")
+    try:
+        header = [column.strip().lower() for column in next(rows)]
+    except StopIteration:
+        raise GradeImportError("The file is empty.")
+    except UnicodeDecodeError:
+        raise GradeImportError("CSV files must be UTF-8 encoded.")
+    return header, _data_rows(header, rows)
+
+
+def _validate_chunk(chunk, course, grades, seen, result):
+    usernames = {row.get('username', '') for _, row in chunk}
+    student_ids = dict(
+        Student.objects.filter(user__username__in=usernames).values_list('user__username', 'id')
+    )
+    course_ids = set()
+    if course is None:
+        course_ids = {int(row['course_id']) for _, row in chunk if row.get('course_id', '').isdigit()}
+        course_ids = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+    enrolled = set(Enrollment.objects.filter(
+        student_id__in=student_ids.values(),
+        course_id__in=[course.id] if course is not None else course_ids,
+    ).values_list('student_id', 'course_id'))
+
+    for number, row in chunk:
+        username = row.get('username', '')
+        student_id = student_ids.get(username)
+        if student_id is None:
+            result.add_error(number, f"Unknown student '{username}'.")
+            continue
+        if course is not None:
+            course_id = course.id
+        else:
+            raw = row.get('course_id', '')
+            if not raw.isdigit() or int(raw) not in course_ids:
+                result.add_error(number, f"Unknown course '{raw}'.")
+                continue
+            course_id = int(raw)
+        if (student_id, course_id) not in enrolled:
+            result.add_error(number, f"{username} is not enrolled in course {course_id}.")
+            continue
+        grade = normalize_grade(row.get('grade'))
+        if grade is None:
+            result.add_error(number, f"Invalid grade '{row.get('grade', '')}'.")
+            continue
+        key = (student_id, course_id)
+        if key in seen:
+            result.add_error(number, f"Duplicate of row {seen[key]}.")
+            continue
+        seen[key] = number
+        grades[key] = grade
+
+
+def validate_rows(header, rows, course=None, chunk_size=VALIDATION_CHUNK_SIZE):
+    """Check every row against students and enrollments, a chunk of rows per lookup.
+
+    Returns ({(student_id, course_id): grade}, GradeImportResult); nothing is written."""
+    required = {'username', 'grade'} if course is not None else {'username', 'course_id', 'grade'}
+    missing = required - set(header)
+    if missing:
+        raise GradeImportError(f"Missing column(s): {', '.join(sorted(missing))}.")
+    grades, seen, result = {}, {}, GradeImportResult()
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _validate_chunk(chunk, course, grades, seen, result)
+            chunk = []
+    if chunk:
+        _validate_chunk(chunk, course, grades, seen, result)
+    return grades, result
+
+
+def _existing_grades(grades):
+    """Current (student_id, course_id, grade) rows for the keys of `grades`, locked until
+    the caller's transaction ends so a concurrent upsert cannot change them between this
+    read and the write, which would feed stale grades to the aggregates."""
+    by_student = defaultdict(set)
+    for student_id, course_id in grades:
+        by_student[student_id].add(course_id)
+    student_ids = list(by_student)
+    existing = []
+    for offset in range(0, len(student_ids), UPSERT_BATCH_SIZE):
+        batch = student_ids[offset:offset + UPSERT_BATCH_SIZE]
+        course_ids = set().union(*(by_student[student_id] for student_id in batch))
+        rows = Grade.objects.select_for_update().filter(student_id__in=batch, course_id__in=course_ids).values_list(
+            'student_id', 'course_id', 'grade'
+        )
+        existing.extend(row for row in rows if row[1] in by_student[row[0]])
+    return existing
+
+
+def upsert_grades(grades):
+    """Insert or overwrite grades given as {(student_id, course_id): grade}, in one transaction."""
+    objects = [
+        Grade(student_id=student_id, course_id=course_id, grade=grade)
+        for (student_id, course_id), grade in grades.items()
+    ]
+    with transaction.atomic():
+        replaced = _existing_grades(grades)
+        Grade.objects.bulk_create(
+            objects, batch_size=UPSERT_BATCH_SIZE,
+            update_conflicts=True, unique_fields=['student', 'course'], update_fields=['grade'],
+        )
+        # bulk_create sends no signals, so feed the aggregates here
+        apply_grade_changes(
+            removed=replaced,
+            added=[(obj.student_id, obj.course_id, obj.grade) for obj in objects],
+        )
+    invalidate_dashboard_stats()
+    return len(objects)
+
+
+def import_grades(uploaded_file, course=None):
+    """Validate a whole upload and, only if every row is valid, save it in one transaction."""
+    header, rows = read_rows(uploaded_file)
+    grades, result = validate_rows(header, rows, course=course)
+    if not result.error_count:
+        result.saved = upsert_grades(grades)
+    return result
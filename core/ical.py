@@ -0,0 +1,125 @@
+import datetime
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import DAYS_OF_WEEK, Enrollment, Student
+from .replicas import primary_reads
+from .timetable import TIMETABLE_CACHE_TIMEOUT, invalidate_timetable, timetable_version
+
+# (month, day) bounds of each semester within an academic year starting in the autumn
+DEFAULT_SEMESTER_DATES = {
+    'Semester 1': ((9, 1), (12, 20)),
+    'Semester 2': ((1, 15), (5, 31)),
+}
+
+WEEKDAYS = {day: index for index, (day, _) in enumerate(DAYS_OF_WEEK)}
+RRULE_DAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+
+def reset_calendar_token(student):
+    """Give the student a new feed token; any previous subscription URL stops working."""
+    student.calendar_token = secrets.token_urlsafe(32)
+    student.save(update_fields=['calendar_token'])
+    # The timetable page shows the subscription URL, so its ETag has to move on too
+    invalidate_timetable(student.id)
+    return student.calendar_token
+
+
+def student_for_token(token):
+    return Student.objects.filter(calendar_token=token).only('id').first()
+
+
+def semester_bounds(semester, today):
+    dates = getattr(settings, 'SEMESTER_DATES', DEFAULT_SEMESTER_DATES)
+    (start_month, start_day), (end_month, end_day) = dates[semester]
+    # Academic years start in the autumn; spring semesters belong to the following calendar year
+    year = today.year if today.month >= 7 else today.year - 1
+    if start_month < 7:
+        year += 1
+    start = datetime.date(year, start_month, start_day)
+    end = datetime.date(year if end_month >= start_month else year + 1, end_month, end_day)
+    return start, end
+
+
+def _escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    # RFC 5545 3.1: lines longer than 75 octets continue on the next line after a space
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts, chunk = [], b''
+    for char in line:
+        char_bytes = char.encode('utf-8')
+        if len(chunk) + len(char_bytes) > (75 if not parts else 74):
+            parts.append(chunk.decode('utf-8'))
+            chunk = b''
+        chunk += char_bytes
+    parts.append(chunk.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def _stamp(value):
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def build_calendar(student, generated_at=None):
+    generated_at = generated_at or timezone.now()
+    dtstamp = _stamp(generated_at.astimezone(datetime.timezone.utc)) + 'Z'
+    today = timezone.localdate(generated_at)
+    host = getattr(settings, 'CALENDAR_UID_DOMAIN', 'whiteboard')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Whiteboard//Timetable//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:Timetable',
+        f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+    ]
+    enrollments = Enrollment.objects.for_student(student).select_related('course').only(
+        'id', 'day_of_week', 'start_time', 'end_time', 'course__course_name', 'course__semester',
+    ).order_by('id')
+    for enrollment in enrollments:
+        weekday = WEEKDAYS.get(enrollment.day_of_week)
+        if weekday is None or enrollment.start_time is None or enrollment.end_time is None:
+            continue
+        start, end = semester_bounds(enrollment.course.semester, today)
+        first = start + datetime.timedelta(days=(weekday - start.weekday()) % 7)
+        # Times are floating local times, as entered on the course
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:enrollment-{enrollment.id}@{host}',
+            f'DTSTAMP:{dtstamp}',
+            f'DTSTART:{_stamp(datetime.datetime.combine(first, enrollment.start_time))}',
+            f'DTEND:{_stamp(datetime.datetime.combine(first, enrollment.end_time))}',
+            f'RRULE:FREQ=WEEKLY;BYDAY={RRULE_DAYS[weekday]};UNTIL={_stamp(datetime.datetime.combine(end, datetime.time.max.replace(microsecond=0)))}',
+            _fold(f'SUMMARY:{_escape(enrollment.course.course_name)}'),
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def _feed_key(student_id, version):
+    return f'timetable-ics:{student_id}:{version}'
+
+
+def get_calendar(student):
+    """Return (version, generated_at, body), rebuilding only when the student's enrollments changed."""
+    version = timetable_version(student.id)
+    key = _feed_key(student.id, version)
+    cached = cache.get(key)
+    if cached is None:
+        generated_at = timezone.now().replace(microsecond=0)
+        with primary_reads():
+            cached = (generated_at, build_calendar(student, generated_at))
+        cache.set(key, cached, TIMETABLE_CACHE_TIMEOUT)
+    return (version,) + cached
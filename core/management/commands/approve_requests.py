@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.approvals import approve_requests, reject_requests
+
+
+class Command(BaseCommand):
+    help = "Approve or reject pending student requests in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('request_ids', nargs='*', type=int, help="StudentRequest ids to process")
+        parser.add_argument('--all', action='store_true', help="Process every pending request")
+        parser.add_argument('--reject', action='store_true', help="Reject instead of approve")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None, help="Password hashing processes")
+
+    def handle(self, *args, **options):
+        if options['all'] == bool(options['request_ids']):
+            raise CommandError("Pass request ids or --all, but not both.")
+        request_ids = None if options['all'] else options['request_ids']
+        if options['reject']:
+            outcomes = reject_requests(request_ids)
+        else:
+            outcomes = approve_requests(
+                request_ids, batch_size=options['batch_size'], max_workers=options['workers']
+            )
+        for outcome in outcomes:
+            line = f"{outcome.request_id}\t{outcome.status}\t{outcome.username or outcome.error}"
+            if outcome.error:
+                self.stderr.write(line)
+            else:
+                self.stdout.write(line)
+        failed = sum(1 for outcome in outcomes if outcome.error)
+        self.stdout.write(self.style.SUCCESS(f"{len(outcomes) - failed} processed, {failed} failed."))
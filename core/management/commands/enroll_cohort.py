@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.enrollment import enroll_cohort
+from core.models import Course, Program, Student
+from core.stats import invalidate_dashboard_stats
+
+
+class Command(BaseCommand):
+    help = "Enroll a cohort of students in every course of a program."
+
+    def add_arguments(self, parser):
+        parser.add_argument('program', help="Program id or exact program name")
+        parser.add_argument(
+            '--student', action='append', dest='usernames', default=[],
+            help="Username to register in the program (repeatable). Defaults to all students already in it.",
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        program = self._get_program(options['program'])
+        courses = Course.objects.filter(program=program).order_by('id')
+        # Registration and enrollment commit together: a failure leaves no student
+        # moved into the program without its courses
+        with transaction.atomic():
+            if options['usernames']:
+                students = list(
+                    Student.objects.filter(user__username__in=options['usernames']).select_related('user')
+                )
+                missing = set(options['usernames']) - {s.user.username for s in students}
+                if missing:
+                    raise CommandError(f"Unknown students: {', '.join(sorted(missing))}")
+                Student.objects.filter(id__in=[s.id for s in students]).update(program=program)
+            else:
+                students = list(Student.objects.filter(program=program).order_by('id'))
+            results = enroll_cohort(students, courses, batch_size=options['batch_size'])
+        invalidate_dashboard_stats()
+        enrolled = sum(len(r.enrolled) for r in results.values())
+        conflicts = sum(len(r.conflicts) for r in results.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{program.program_name}: {len(students)} students, {enrolled} enrollments created, "
+            f"{conflicts} skipped due to timetable conflicts."
+        ))
+
+    def _get_program(self, value):
+        lookup = {'id': value} if value.isdigit() else {'program_name': value}
+        try:
+            return Program.objects.get(**lookup)
+        except Program.DoesNotExist:
+            raise CommandError(f"Program not found: {value}")
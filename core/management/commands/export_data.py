@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORTS, stream_export
+from core.models import SEMESTER_CHOICES, Program
+
+
+class Command(BaseCommand):
+    help = "Stream students, courses, enrollments or grades as CSV or JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--program', help="Program id or exact program name")
+        parser.add_argument('--semester', choices=[value for value, _ in SEMESTER_CHOICES])
+        parser.add_argument('--output', '-o', help="File to write to instead of stdout")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        program = self._get_program(options['program']) if options['program'] else None
+        chunks = stream_export(
+            options['kind'], options['export_format'],
+            program=program.id if program else None,
+            semester=options['semester'],
+            chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+    def _get_program(self, value):
+        lookup = {'id': value} if value.isdigit() else {'program_name': value}
+        try:
+            return Program.objects.get(**lookup)
+        except Program.DoesNotExist:
+            raise CommandError(f"Program not found: {value}")
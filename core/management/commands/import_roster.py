@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rosters import ROSTER_CHUNK_SIZE, ROSTERS, create_roster_import, run_roster_import
+
+
+class Command(BaseCommand):
+    help = "Import a CSV roster of students or courses in chunked transactions, resuming unfinished imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(ROSTERS))
+        parser.add_argument('path', help="CSV file with a header row")
+        parser.add_argument('--chunk-size', type=int, default=ROSTER_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=None, help="Password hashing processes")
+        parser.add_argument(
+            '--restart', action='store_true',
+            help="Start from the first row even if an earlier import of this file did not finish",
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.isfile(path):
+            raise CommandError(f"No such file: {path}")
+        roster_import = create_roster_import(options['kind'], path, restart=options['restart'])
+        if roster_import.rows_processed:
+            self.stdout.write(f"Resuming import #{roster_import.id} after row {roster_import.rows_processed}.")
+
+        def progress(current):
+            self.stdout.write(
+                f"{current.rows_processed} rows: {current.created_count} created, {current.error_count} errors"
+            )
+
+        # Run from the command line even if a crashed run left the import marked running
+        roster_import = run_roster_import(
+            roster_import, chunk_size=options['chunk_size'], max_workers=options['workers'],
+            claim_running=True, progress=progress,
+        )
+        for line, message in roster_import.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if roster_import.status != 'done':
+            raise CommandError(f"Import #{roster_import.id} {roster_import.status}: {roster_import.last_error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{roster_import.created_count} {roster_import.kind} created from "
+            f"{roster_import.rows_processed} rows, {roster_import.error_count} rows skipped."
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.models import CourseDocument
+from core.processing import process_document
+
+
+class Command(BaseCommand):
+    help = "Extract metadata, text and thumbnails for course documents that have not been processed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Reprocess every document")
+        parser.add_argument('--retry-failed', action='store_true', help="Include documents that failed before")
+
+    def handle(self, *args, **options):
+        documents = CourseDocument.objects.order_by('id')
+        if not options['all']:
+            statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+            documents = documents.filter(processing_status__in=statuses)
+        processed = failed = 0
+        for document_id in documents.values_list('id', flat=True):
+            try:
+                process_document(document_id)
+                processed += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Document {document_id}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"{processed} documents processed, {failed} failed."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.notifications import RETENTION_DAYS, purge_read_notifications
+
+
+class Command(BaseCommand):
+    help = "Delete read notifications older than the retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        deleted = purge_read_notifications(options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} read notifications older than {options['days']} days."
+        ))
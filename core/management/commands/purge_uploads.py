@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.uploads import STALE_UPLOAD_HOURS, purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Finish or delete abandoned chunked uploads and remove stray part files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=STALE_UPLOAD_HOURS)
+
+    def handle(self, *args, **options):
+        finished, sessions, parts = purge_stale_uploads(options['hours'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished {finished} uploads, deleted {sessions} abandoned upload sessions "
+            f"and {parts} stray part files older than {options['hours']} hours."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.analytics import rebuild_grade_aggregates
+from core.models import CourseGradeSummary, StudentGradeSummary
+
+
+class Command(BaseCommand):
+    help = "Recompute GPA and grade-distribution aggregates from the Grade table."
+
+    def handle(self, *args, **options):
+        rebuild_grade_aggregates()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt aggregates for {StudentGradeSummary.objects.count()} students "
+            f"and {CourseGradeSummary.objects.count()} courses."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.broadcasts import BROADCAST_CHUNK_SIZE, resume_stale_broadcasts
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver broadcasts left pending or running by a process that died, "
+        "resuming each after its last committed chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BROADCAST_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        delivered = resume_stale_broadcasts(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Resumed {len(delivered)} stale broadcasts."))
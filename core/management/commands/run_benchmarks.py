@@ -0,0 +1,80 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from core.benchmarks import BENCHMARKS, SCALES, compare, is_seeded, load_baseline, run_benchmarks, save_baseline, seed
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and measure latency, query count and memory of the hot "
+        "views, failing if query count or memory regress past the saved baseline. Latency is "
+        "reported but not gated on, as it depends on the machine. The database is the one "
+        "the test runner would use (DATABASES['default']['TEST']), with TEST MIRROR aliases "
+        "such as the read replica pointed at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the data generator")
+        parser.add_argument('--only', action='append', choices=[b.name for b in BENCHMARKS],
+                            help="Run only this benchmark (repeatable)")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Write these results as the new baseline instead of comparing")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed growth of peak memory, as a fraction")
+        parser.add_argument('--query-threshold', type=int, default=0,
+                            help="Allowed number of extra queries per request")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the seeded database between runs (needs a file-backed TEST NAME on SQLite)")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if not options['save_baseline']:
+            try:
+                baseline = load_baseline(options['baseline'])
+            except FileNotFoundError:
+                raise CommandError(f"No baseline at {options['baseline']}; run with --save-baseline first.")
+            if baseline['scale'] != options['scale']:
+                raise CommandError(f"The baseline was recorded at scale '{baseline['scale']}'.")
+
+        setup_test_environment()
+        # As the test runner does: replica-routed views must read the seeded database too
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options['keepdb'],
+            aliases={DEFAULT_DB_ALIAS}, serialized_aliases=set(),
+        )
+        try:
+            if not is_seeded():
+                seed(options['scale'], seed=options['seed'], log=lambda step: self.stdout.write(f"Seeding: {step}"))
+            results = run_benchmarks(options['only'], iterations=options['iterations'], warmup=options['warmup'])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write(f"{'benchmark':<20} {'queries':>8} {'median ms':>10} {'p95 ms':>10} {'peak KiB':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result.name:<20} {result.queries:>8} {result.median_ms:>10.2f} "
+                f"{result.p95_ms:>10.2f} {result.peak_kib:>10.1f}"
+            )
+
+        if options['save_baseline']:
+            Path(options['baseline']).parent.mkdir(parents=True, exist_ok=True)
+            save_baseline(options['baseline'], results, options['scale'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}."))
+            return
+        regressions = compare(
+            results, baseline['results'], threshold=options['threshold'], query_threshold=options['query_threshold'],
+        )
+        if regressions:
+            raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
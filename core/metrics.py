@@ -0,0 +1,220 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+
+_IN_LIST = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def sql_shape(sql):
+    """The statement with literals and IN-list lengths erased, so the same query run for
+    different rows (the N of an N+1) maps to one shape."""
+    return _LITERAL.sub('?', _IN_LIST.sub('IN (...)', sql))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Per-process aggregates. Gunicorn runs one worker per pod here, so a scrape of a
+    pod sees everything that pod served.
+
+    A streamed body generated while it is sent (StreamingHttpResponse) is included in
+    its view's wall time, queries and database time. A FileResponse is recorded when
+    the view returns: sending the file runs no queries, and wrapping it would stop
+    wsgi.file_wrapper from sending it, so its times leave out the transfer."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.db_durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+        self.n_plus_one = Counter()
+
+    def record(self, view, duration, recorder=None, n_plus_one=False):
+        with self.lock:
+            self.durations[view].observe(duration)
+            if recorder is not None:
+                self.queries[view].observe(recorder.count)
+                self.db_durations[view].observe(recorder.duration)
+            if n_plus_one:
+                self.n_plus_one[view] += 1
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """Execute wrapper counting the queries, database time and SQL shapes of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated_shapes(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+@contextmanager
+def recording(recorder):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+class RecordedStream:
+    """Streaming content that keeps a request's recorder installed while the body is
+    generated, and calls `finish` once the server closes the response."""
+
+    def __init__(self, content, recorder, finish):
+        self.recorder = recorder
+        self.finish = finish
+        self.generator = self.generate(content)
+
+    def generate(self, content):
+        if self.recorder is None:
+            yield from content
+        else:
+            with recording(self.recorder):
+                yield from content
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.generator)
+
+    def close(self):
+        self.generator.close()
+        self.finish()
+
+
+def view_label(match):
+    if match is None:
+        return 'unresolved'
+    if match.view_name:
+        return match.view_name
+    func = getattr(match.func, 'view_class', match.func)
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+class MetricsMiddleware:
+    """Record wall time per view for every request and, for a sampled fraction
+    (METRICS_SAMPLE_RATE), its query count and database time. A sampled request that
+    repeats one SQL shape METRICS_N_PLUS_ONE_THRESHOLD times or more is logged as a
+    likely N+1."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == '/metrics':
+            return self.get_response(request)
+        sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        recorder = QueryRecorder() if sample_rate and random.random() < sample_rate else None
+        start = time.perf_counter()
+        if recorder is None:
+            response = self.get_response(request)
+        else:
+            with recording(recorder):
+                response = self.get_response(request)
+        view = view_label(request.resolver_match)
+        if response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            # The body runs its queries as the server sends it, after this returns
+            response.streaming_content = RecordedStream(
+                response.streaming_content, recorder, lambda: self.record(view, start, recorder),
+            )
+        else:
+            self.record(view, start, recorder)
+        return response
+
+    def record(self, view, start, recorder):
+        duration = time.perf_counter() - start
+        repeated = []
+        if recorder is not None:
+            threshold = getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+            repeated = recorder.repeated_shapes(threshold)
+            for shape, n in repeated:
+                logger.warning("Possible N+1 in %s: %d x %s", view, n, shape)
+        registry.record(view, duration, recorder, n_plus_one=bool(repeated))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, help_text, histograms):
+    yield f'# HELP {name} {help_text}'
+    yield f'# TYPE {name} histogram'
+    for view, histogram in sorted(histograms.items()):
+        label = f'view="{_escape(view)}"'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{label},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{label}}} {histogram.sum}'
+        yield f'{name}_count{{{label}}} {histogram.count}'
+
+
+def render_metrics():
+    """The registry in the Prometheus text exposition format."""
+    with registry.lock:
+        lines = [
+            *_histogram_lines('whiteboard_request_duration_seconds', "Wall time per view.", registry.durations),
+            *_histogram_lines('whiteboard_db_queries', "Database queries per sampled request.", registry.queries),
+            *_histogram_lines('whiteboard_db_duration_seconds', "Database time per sampled request.",
+                              registry.db_durations),
+            '# HELP whiteboard_n_plus_one_requests_total Sampled requests that repeated one SQL shape.',
+            '# TYPE whiteboard_n_plus_one_requests_total counter',
+            *(f'whiteboard_n_plus_one_requests_total{{view="{_escape(view)}"}} {n}'
+              for view, n in sorted(registry.n_plus_one.items())),
+        ]
+    lines += [
+        '# HELP whiteboard_metrics_sample_rate Fraction of requests whose queries are recorded.',
+        '# TYPE whiteboard_metrics_sample_rate gauge',
+        f"whiteboard_metrics_sample_rate {getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)}",
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_document_blobs_and_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursedocument',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='coursedocument',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='coursedocument',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coursedocument',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='coursedocument',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coursedocument',
+            name='text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='coursedocument',
+            name='thumbnail',
+            field=models.FileField(blank=True, upload_to='thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_document_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course', 'Course'), ('program', 'Program'), ('document', 'Document')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('course_id', models.BigIntegerField(blank=True, null=True)),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='searchentry_kind_object_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE core_searchentry_fts USING fts5(
+        title, body,
+        content='core_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER core_searchentry_ai AFTER INSERT ON core_searchentry BEGIN
+        INSERT INTO core_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER core_searchentry_ad AFTER DELETE ON core_searchentry BEGIN
+        INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER core_searchentry_au AFTER UPDATE ON core_searchentry BEGIN
+        INSERT INTO core_searchentry_fts(core_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO core_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    "INSERT INTO core_searchentry_fts(core_searchentry_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS core_searchentry_au",
+    "DROP TRIGGER IF EXISTS core_searchentry_ad",
+    "DROP TRIGGER IF EXISTS core_searchentry_ai",
+    "DROP TABLE IF EXISTS core_searchentry_fts",
+]
+
+# MATCH() must name exactly the columns of one FULLTEXT index, hence a second one for autocomplete
+MYSQL_FORWARD = [
+    "ALTER TABLE core_searchentry ADD FULLTEXT INDEX searchentry_fulltext (title, body)",
+    "ALTER TABLE core_searchentry ADD FULLTEXT INDEX searchentry_title_fulltext (title)",
+]
+
+MYSQL_REVERSE = [
+    "ALTER TABLE core_searchentry DROP INDEX searchentry_title_fulltext",
+    "ALTER TABLE core_searchentry DROP INDEX searchentry_fulltext",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_search_entry'),
+    ]
+
+    operations = [
+        # Full-text index over SearchEntry: FTS5 on SQLite, a FULLTEXT index on MySQL.
+        # Other backends fall back to LIKE queries in core.search.
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'mysql': MYSQL_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'mysql': MYSQL_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_search_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='calendar_token',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:31
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# Snapshot of core.models.GRADE_POINTS, in tenths
+GRADE_TENTHS = {
+    'A+': 40, 'A': 40, 'A-': 37, 'B+': 33, 'B': 30, 'B-': 27,
+    'C+': 23, 'C': 20, 'C-': 17, 'D+': 13, 'D': 10, 'F': 0,
+}
+
+
+def backfill(apps, schema_editor):
+    Grade = apps.get_model('core', 'Grade')
+    Course = apps.get_model('core', 'Course')
+    students, courses, counts = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0]), defaultdict(int)
+    for student_id, course_id, grade in Grade.objects.values_list('student_id', 'course_id', 'grade').iterator():
+        points = GRADE_TENTHS.get(grade)
+        if points is None:
+            continue
+        for totals in (students[student_id], courses[course_id]):
+            totals[0] += 1
+            totals[1] += points
+        counts[(course_id, grade)] += 1
+    programs = defaultdict(lambda: [0, 0])
+    for course_id, program_id in Course.objects.filter(id__in=courses).values_list('id', 'program_id'):
+        programs[program_id][0] += courses[course_id][0]
+        programs[program_id][1] += courses[course_id][1]
+    for model_name, field, totals in (
+        ('StudentGradeSummary', 'student_id', students),
+        ('CourseGradeSummary', 'course_id', courses),
+        ('ProgramGradeSummary', 'program_id', programs),
+    ):
+        model = apps.get_model('core', model_name)
+        model.objects.bulk_create(
+            [model(**{field: key}, graded=graded, quality_points=points) for key, (graded, points) in totals.items()],
+            batch_size=1000,
+        )
+    CourseGradeCount = apps.get_model('core', 'CourseGradeCount')
+    CourseGradeCount.objects.bulk_create(
+        [CourseGradeCount(course_id=course_id, grade=grade, count=count) for (course_id, grade), count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_student_calendar_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseGradeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graded', models.PositiveIntegerField(default=0)),
+                ('quality_points', models.PositiveIntegerField(default=0)),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='grade_summary', to='core.course')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProgramGradeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graded', models.PositiveIntegerField(default=0)),
+                ('quality_points', models.PositiveIntegerField(default=0)),
+                ('program', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='grade_summary', to='core.program')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentGradeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graded', models.PositiveIntegerField(default=0)),
+                ('quality_points', models.PositiveIntegerField(default=0)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='grade_summary', to='core.student')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseGradeCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.CharField(max_length=2)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grade_counts', to='core.course')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('course', 'grade'), name='coursegradecount_course_grade_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def remove_duplicate_enrollments(apps, schema_editor):
+    # Keep the first enrollment of each (student, course) so the unique constraint can be added
+    Enrollment = apps.get_model('core', 'Enrollment')
+    duplicates = Enrollment.objects.values('student_id', 'course_id').annotate(
+        first_id=Min('id'), last_id=Max('id'),
+    ).filter(first_id__lt=models.F('last_id'))
+    for row in list(duplicates):
+        Enrollment.objects.filter(student_id=row['student_id'], course_id=row['course_id']).exclude(
+            id=row['first_id'],
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_roster_import'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['program', 'semester'], name='course_program_semester_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['semester'], name='course_semester_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['student', 'day_of_week', 'start_time', 'end_time', 'course'], name='enrollment_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='notification_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['user'], name='notification_unread_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_enrollments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='enrollment_student_course_uniq'),
+        ),
+    ]
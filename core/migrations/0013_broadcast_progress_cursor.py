@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_enrollment_unique_and_hot_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcast',
+            name='last_recipient_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcast',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
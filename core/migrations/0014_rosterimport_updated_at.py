@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_broadcast_progress_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rosterimport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
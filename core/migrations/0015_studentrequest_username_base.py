@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # Snapshot of core.usernames.base_username
+    StudentRequest = apps.get_model('core', 'StudentRequest')
+    requests = list(StudentRequest.objects.only('first_name', 'last_name', 'date_of_birth'))
+    for req in requests:
+        last_initial = req.last_name[0].lower() if req.last_name else ''
+        req.username_base = f"{req.first_name.lower().replace(' ', '')}{last_initial}{req.date_of_birth.month:02d}"
+    StudentRequest.objects.bulk_update(requests, ['username_base'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_rosterimport_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentrequest',
+            name='username_base',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
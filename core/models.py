@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -18,6 +20,55 @@ SEMESTER_CHOICES = [
     ('Semester 2', 'Semester 2'),
 ]
 
+# Grade points of each letter grade on the GPA scale
+GRADE_POINTS = {
+    'A+': 4.0, 'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0,
+    'F': 0.0,
+}
+
+class StudentQuerySet(models.QuerySet):
+    def with_user(self):
+        return self.select_related('user')
+
+    def for_picker(self):
+        # Only what the admin dropdowns render: id and username
+        return self.select_related('user').only('id', 'user__username')
+
+class CourseQuerySet(models.QuerySet):
+    def with_program(self):
+        return self.select_related('program')
+
+    def for_picker(self):
+        # Only what the admin pickers render: id and name
+        return self.only('id', 'course_name')
+
+class EnrollmentQuerySet(models.QuerySet):
+    def for_student(self, student):
+        return self.filter(student=student)
+
+    def for_student_page(self):
+        # Dashboard rows: course, program and the copied schedule
+        return self.select_related('course__program').only(
+            'day_of_week', 'start_time', 'end_time',
+            'course__id', 'course__course_name',
+            'course__program__id', 'course__program__program_name',
+        )
+
+    def for_timetable(self):
+        return self.select_related('course').only(
+            'day_of_week', 'start_time', 'end_time', 'course__id', 'course__course_name',
+        )
+
+class GradeQuerySet(models.QuerySet):
+    def for_student(self, student):
+        return self.filter(student=student)
+
+    def for_student_page(self):
+        return self.select_related('course').only('grade', 'course__id', 'course__course_name')
+
 class StudentRequest(models.Model):
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
@@ -26,6 +77,9 @@ class StudentRequest(models.Model):
     date_of_birth = models.DateField()
     address = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # core.usernames.base_username of the request, set on save: kept in Python rather than
+    # rebuilt in SQL, where LOWER() on SQLite only folds ASCII
+    username_base = models.CharField(max_length=64, db_index=True, editable=False, default='')
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -38,6 +92,10 @@ class Student(models.Model):
     date_of_birth = models.DateField()
     address = models.TextField()
     program = models.ForeignKey('Program', on_delete=models.SET_NULL, null=True, blank=True)
+    # Secret for the timetable .ics feed, which calendar apps fetch without a session
+    calendar_token = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    objects = StudentQuerySet.as_manager()
 
     def __str__(self):
         return self.user.username
@@ -51,6 +109,17 @@ class Notification(models.Model):
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message}"
 
+    class Meta:
+        indexes = [
+            # Serves unread counts, "mark all read" and newest-first listing per user
+            models.Index(fields=['user', 'read', 'created_at'], name='notification_user_read_idx'),
+            # Newest-first listing of all of a user's notifications, read or not
+            models.Index(fields=['user', 'created_at'], name='notification_user_created_idx'),
+            # read=False compiles to NOT "read", which SQLite can't match against the index
+            # above but can against this partial one (MySQL ignores the condition)
+            models.Index(fields=['user'], condition=models.Q(read=False), name='notification_unread_idx'),
+        ]
+
 class Program(models.Model):
     program_name = models.CharField(max_length=100)
 
@@ -65,9 +134,19 @@ class Course(models.Model):
     end_time = models.TimeField(null=True, blank=True)
     semester = models.CharField(max_length=20, choices=SEMESTER_CHOICES, default='Semester 1')
 
+    objects = CourseQuerySet.as_manager()
+
     def __str__(self):
         return self.course_name
 
+    class Meta:
+        indexes = [
+            # Course list filters; both end in the implicit primary key, so keyset pages
+            # come straight off the index
+            models.Index(fields=['program', 'semester'], name='course_program_semester_idx'),
+            models.Index(fields=['semester'], name='course_semester_idx'),
+        ]
+
 class Enrollment(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
@@ -75,6 +154,8 @@ class Enrollment(models.Model):
     start_time = models.TimeField(blank=True, null=True)
     end_time = models.TimeField(blank=True, null=True)
 
+    objects = EnrollmentQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.day_of_week:
             self.day_of_week = self.course.day_of_week
@@ -87,20 +168,201 @@ class Enrollment(models.Model):
     def __str__(self):
         return f"{self.student.user.username} enrolled in {self.course.course_name}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='enrollment_student_course_uniq'),
+        ]
+        indexes = [
+            # A student's slots for timetable conflict checks, covering the course id too
+            models.Index(
+                fields=['student', 'day_of_week', 'start_time', 'end_time', 'course'], name='enrollment_schedule_idx',
+            ),
+        ]
+
 class Grade(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     grade = models.CharField(max_length=2)
 
+    objects = GradeQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.student.user.username} - {self.course.course_name}: {self.grade}"
 
     class Meta:
         unique_together = ('student', 'course')
+
+class GradeTotals(models.Model):
+    # Maintained by core.analytics from Grade changes; never edited directly.
+    # Points are stored in tenths so the running sums stay exact.
+    graded = models.PositiveIntegerField(default=0)
+    quality_points = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average(self):
+        if not self.graded:
+            return None
+        return round(self.quality_points / self.graded / 10, 2)
+
+class StudentGradeSummary(GradeTotals):
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, related_name='grade_summary')
+
+    def __str__(self):
+        return f"{self.student_id}: GPA {self.average}"
+
+class CourseGradeSummary(GradeTotals):
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='grade_summary')
+
+    def __str__(self):
+        return f"{self.course_id}: average {self.average}"
+
+class ProgramGradeSummary(GradeTotals):
+    program = models.OneToOneField(Program, on_delete=models.CASCADE, related_name='grade_summary')
+
+    def __str__(self):
+        return f"{self.program_id}: average {self.average}"
+
+class CourseGradeCount(models.Model):
+    # One row per (course, letter grade): the course's grade distribution
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='grade_counts')
+    grade = models.CharField(max_length=2)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.course_id} {self.grade}: {self.count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'grade'], name='coursegradecount_course_grade_uniq'),
+        ]
+
+class DocumentBlob(models.Model):
+    # Content-addressed file: identical uploads share one blob, named by their SHA-256
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs/')
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 class CourseDocument(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='documents')
     document = models.FileField(upload_to='course_documents/')
+    blob = models.ForeignKey(DocumentBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='documents')
+    original_name = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Filled in by core.processing after upload so listings never open the file
+    PROCESSING_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_CHOICES, default='pending')
+    size = models.BigIntegerField(null=True, blank=True)
+    mime_type = models.CharField(max_length=100, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)
+    thumbnail = models.FileField(upload_to='thumbnails/', blank=True)
+    text = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Document for {self.course.course_name} uploaded on {self.uploaded_at}"
+
+class Broadcast(models.Model):
+    # last_recipient_id is committed together with each chunk, so a reclaimed delivery
+    # resumes right after the last committed chunk; updated_at is the heartbeat a stale
+    # run is detected by
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    message = models.TextField()
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True)
+    program = models.ForeignKey(Program, on_delete=models.SET_NULL, null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total_recipients = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    last_recipient_id = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"Document for {self.course.course_name} uploaded on {self.uploaded_at}"
\ No newline at end of file
+        target = self.course or self.program
+        return f"Broadcast to {target}: {self.sent}/{self.total_recipients}"
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    document = models.ForeignKey(CourseDocument, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} for {self.course_id}"
+
+class RosterImport(models.Model):
+    # Progress of a bulk roster import; rows_processed is committed together with each
+    # chunk, so an interrupted import resumes right after the last committed chunk;
+    # updated_at is the heartbeat a stale run is detected by
+    KIND_CHOICES = [
+        ('students', 'Students'),
+        ('courses', 'Courses'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    source = models.CharField(max_length=500)
+    original_name = models.CharField(max_length=255, blank=True)
+    sha256 = models.CharField(max_length=64)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import {self.original_name or self.source}: {self.status}"
+
+class SearchEntry(models.Model):
+    # Denormalised search document; core.search keeps the full-text index over it in sync
+    KIND_CHOICES = [
+        ('course', 'Course'),
+        ('program', 'Program'),
+        ('document', 'Document'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    course_id = models.BigIntegerField(null=True, blank=True)
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.title}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='searchentry_kind_object_uniq'),
+        ]
@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification
+from .replicas import primary_reads
+
+NOTIFICATION_PAGE_SIZE = 10
+UNREAD_COUNT_TIMEOUT = 60 * 60
+RETENTION_DAYS = 90
+
+
+def _unread_key(user_id):
+    return f'notifications-unread:{user_id}'
+
+
+def unread_count(user):
+    count = cache.get(_unread_key(user.id))
+    if count is None:
+        with primary_reads():
+            count = Notification.objects.filter(user=user, read=False).count()
+        cache.set(_unread_key(user.id), count, UNREAD_COUNT_TIMEOUT)
+    return count
+
+
+def invalidate_unread_count(*user_ids):
+    keys = [_unread_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def latest_notifications(user, before=None, limit=NOTIFICATION_PAGE_SIZE):
+    """Newest-first page of a user's notifications; pass the last id seen as `before`
+    for the next page. Returns (notifications, has_more).
+
+    Pages are cut on (created_at, id), the sort order, so backdated or bulk-created rows
+    whose ids disagree with their timestamps are neither skipped nor repeated."""
+    notifications = Notification.objects.filter(user=user).order_by('-created_at', '-id')
+    if before is not None:
+        cursor = Notification.objects.filter(id=before, user=user).values_list('created_at', flat=True).first()
+        if cursor is None:
+            # The cursor row was purged in the meantime; its id is the best remaining guide
+            notifications = notifications.filter(id__lt=before)
+        else:
+            notifications = notifications.filter(Q(created_at__lt=cursor) | Q(created_at=cursor, id__lt=before))
+    rows = list(notifications.only('id', 'message', 'read', 'created_at')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def mark_read(user, notification_id):
+    """Returns False if the notification does not exist or belongs to someone else."""
+    updated = Notification.objects.filter(id=notification_id, user=user).update(read=True)
+    if updated:
+        invalidate_unread_count(user.id)
+    return bool(updated)
+
+
+def mark_all_read(user):
+    updated = Notification.objects.filter(user=user, read=False).update(read=True)
+    invalidate_unread_count(user.id)
+    return updated
+
+
+def purge_read_notifications(older_than_days=RETENTION_DAYS, batch_size=5000):
+    """Delete read notifications older than the retention window in id batches so no
+    single statement holds the table lock for long. Returns the number deleted."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    expired = Notification.objects.filter(read=True, created_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        # Read rows never count towards the unread counter, so no cache to touch
+        count, _ = Notification.objects.filter(id__in=ids).delete()
+        deleted += count
@@ -0,0 +1,59 @@
+PAGE_SIZE = 50
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """One page of an id-ordered queryset, addressed by ?after=<id> / ?before=<id>
+    instead of OFFSET so every page costs the same index range scan."""
+
+    def __init__(self, items, params, has_next, has_previous):
+        self.items = items
+        self.has_next = has_next and bool(items)
+        self.has_previous = has_previous and bool(items)
+        self._params = params.copy()
+        self._params.pop('after', None)
+        self._params.pop('before', None)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _query(self, key, value):
+        params = self._params.copy()
+        params[key] = value
+        return params.urlencode()
+
+    @property
+    def next_cursor(self):
+        return self.items[-1].id if self.has_next else None
+
+    @property
+    def next_query(self):
+        return self._query('after', self.items[-1].id) if self.has_next else ''
+
+    @property
+    def previous_query(self):
+        return self._query('before', self.items[0].id) if self.has_previous else ''
+
+
+def keyset_paginate(queryset, params, per_page=PAGE_SIZE):
+    """Paginate queryset by primary key using the after/before cursors in params (a QueryDict)."""
+    after = _parse_id(params.get('after'))
+    before = _parse_id(params.get('before'))
+    if before is not None:
+        rows = list(queryset.filter(id__lt=before).order_by('-id')[:per_page + 1])
+        items = rows[:per_page][::-1]
+        return KeysetPage(items, params, has_next=True, has_previous=len(rows) > per_page)
+    queryset = queryset.order_by('id')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    rows = list(queryset[:per_page + 1])
+    return KeysetPage(rows[:per_page], params, has_next=len(rows) > per_page, has_previous=after is not None)
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import CourseDocument
+from .search import index_document
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; image thumbnails are skipped without it
+    Image = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf is optional; pdftotext is used when it is on PATH
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+MAX_TEXT_LENGTH = 1024 * 1024
+TEXT_MIME_TYPES = {'text/plain', 'text/csv', 'text/markdown', 'text/html'}
+HASH_BLOCK_SIZE = 1024 * 1024
+TOOL_TIMEOUT = 60
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='documents')
+
+
+def queue_document_processing(document_id):
+    """Process the document in the background once the upload transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_run_processing, document_id))
+
+
+def _run_processing(document_id):
+    close_old_connections()
+    try:
+        process_document(document_id)
+    except Exception:
+        logger.exception("Processing document %s failed", document_id)
+    finally:
+        connection.close()
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _pdf_text(path):
+    if PdfReader is not None:
+        reader = PdfReader(path)
+        parts, length = [], 0
+        for page in reader.pages:
+            text = page.extract_text() or ''
+            parts.append(text)
+            length += len(text)
+            if length >= MAX_TEXT_LENGTH:
+                break
+        return '\n'.join(parts)
+    if shutil.which('pdftotext'):
+        result = subprocess.run(
+            ['pdftotext', '-enc', 'UTF-8', path, '-'], capture_output=True, timeout=TOOL_TIMEOUT, check=True
+        )
+        return result.stdout.decode('utf-8', errors='replace')
+    return ''
+
+
+def _plain_text(path):
+    with open(path, 'rb') as f:
+        return f.read(MAX_TEXT_LENGTH).decode('utf-8', errors='replace')
+
+
+def extract_text(path, mime_type):
+    if mime_type == 'application/pdf':
+        text = _pdf_text(path)
+    elif mime_type in TEXT_MIME_TYPES:
+        text = _plain_text(path)
+    else:
+        return ''
+    return text.replace('\x00', '')[:MAX_TEXT_LENGTH]
+
+
+def _image_thumbnail(path):
+    with Image.open(path) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        with tempfile.SpooledTemporaryFile() as out:
+            image.convert('RGB').save(out, format='PNG')
+            out.seek(0)
+            return out.read()
+
+
+def _pdf_thumbnail(path):
+    # First page only, scaled to fit the thumbnail box
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, 'page')
+        subprocess.run(
+            ['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+             '-scale-to', str(max(THUMBNAIL_SIZE)), path, prefix],
+            capture_output=True, timeout=TOOL_TIMEOUT, check=True,
+        )
+        with open(prefix + '.png', 'rb') as f:
+            return f.read()
+
+
+def make_thumbnail(path, mime_type):
+    """PNG bytes for the first page/frame, or None when no renderer is available."""
+    if mime_type == 'application/pdf' and shutil.which('pdftoppm'):
+        return _pdf_thumbnail(path)
+    if mime_type.startswith('image/') and Image is not None:
+        return _image_thumbnail(path)
+    return None
+
+
+def _copy_from_processed_twin(document):
+    """Documents sharing a content blob share their metadata, so process each blob once."""
+    if not document.blob_id:
+        return False
+    twin = CourseDocument.objects.filter(
+        blob_id=document.blob_id, processing_status='done'
+    ).exclude(id=document.id).first()
+    if twin is None:
+        return False
+    CourseDocument.objects.filter(id=document.id).update(
+        processing_status='done', size=twin.size, mime_type=twin.mime_type, checksum=twin.checksum,
+        thumbnail=twin.thumbnail.name, text=twin.text, processed_at=timezone.now(),
+    )
+    document.text = twin.text
+    index_document(document)
+    return True
+
+
+def process_document(document_id):
+    document = CourseDocument.objects.get(id=document_id)
+    if _copy_from_processed_twin(document):
+        return
+    try:
+        path = document.document.path
+        mime_type = mimetypes.guess_type(document.original_name or document.document.name)[0] or 'application/octet-stream'
+        size = os.path.getsize(path)
+        checksum = document.blob.sha256 if document.blob_id else _checksum(path)
+        text = extract_text(path, mime_type)
+        thumbnail_name = ''
+        thumbnail = make_thumbnail(path, mime_type)
+        if thumbnail:
+            thumbnail_name = document.thumbnail.storage.save(
+                f'thumbnails/{checksum}.png', ContentFile(thumbnail)
+            )
+    except Exception:
+        CourseDocument.objects.filter(id=document.id).update(
+            processing_status='failed', processed_at=timezone.now()
+        )
+        raise
+    CourseDocument.objects.filter(id=document.id).update(
+        processing_status='done', size=size, mime_type=mime_type, checksum=checksum,
+        thumbnail=thumbnail_name, text=text, processed_at=timezone.now(),
+    )
+    document.text = text
+    index_document(document)
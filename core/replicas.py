@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary_pin'
+DEFAULT_PIN_SECONDS = 10
+
+_use_replica = ContextVar('use_replica', default=False)
+_request_writes = ContextVar('request_writes', default=None)
+
+
+def replica_alias():
+    """The replica's DATABASES alias, or None when no replica is configured."""
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in connections.settings else None
+
+
+class ReplicaRouter:
+    """Reads inside a replica_reads view go to the replica; everything else, and every
+    write, goes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+
+def replica_reads(view):
+    """Serve a read-only view's queries from the replica.
+
+    Only GET and HEAD are routed, and not for a browser that wrote within the last
+    REPLICA_PIN_SECONDS: it reads from the primary until the replica has caught up.
+    Use on class-based views with method_decorator(replica_reads, name='dispatch')."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or PIN_COOKIE in request.COOKIES:
+            return view(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapped
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside a replica_reads view.
+
+    For data cached beyond the request: the pin cookie only covers the browser that wrote,
+    so a cache entry dropped after someone else's write and refilled from a lagging
+    replica would keep the stale value until it expires."""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaPinMiddleware:
+    """Pin a browser to the primary for REPLICA_PIN_SECONDS after any request that wrote,
+    session saves included, so it reads its own writes despite replication lag."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = {'wrote': False}
+        token = _request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+        if writes['wrote'] and replica_alias():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS),
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+        return response
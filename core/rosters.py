@@ -0,0 +1,388 @@
+import csv
+import datetime
+import hashlib
+import itertools
+import logging
+import operator
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import validate_email
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import search
+from .approvals import hash_passwords, hashing_pool
+from .models import DAYS_OF_WEEK, SEMESTER_CHOICES, Course, Program, RosterImport, Student
+from .stats import invalidate_dashboard_stats
+
+logger = logging.getLogger(__name__)
+
+ROSTER_CHUNK_SIZE = 500
+ROSTER_DIR = 'rosters'
+MAX_STORED_ERRORS = 500
+HASH_BLOCK_SIZE = 1024 * 1024
+LOOKUP_QUERY_CHUNK = 200
+DEFAULT_STALE_SECONDS = 600
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rosters')
+
+
+class RosterError(Exception):
+    pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _taken_ignoring_case(field, values):
+    """Lower-cased values of a User field matching any of values case-insensitively, in a
+    few OR-ed iexact queries. MySQL's default collation treats 'Ann' and 'ann' as the
+    same username, so a case-sensitive lookup would let the insert fail instead."""
+    values = sorted({value for value in values if value})
+    taken = set()
+    for offset in range(0, len(values), LOOKUP_QUERY_CHUNK):
+        condition = reduce(operator.or_, (
+            Q(**{f'{field}__iexact': value}) for value in values[offset:offset + LOOKUP_QUERY_CHUNK]
+        ))
+        taken.update(value.lower() for value in User.objects.filter(condition).values_list(field, flat=True))
+    return taken
+
+
+class StudentRoster:
+    required = {'username', 'email', 'phone', 'date_of_birth'}
+    username_validator = UnicodeUsernameValidator()
+
+    def __init__(self, max_workers=1):
+        self.programs = dict(Program.objects.values_list('program_name', 'id'))
+        self.seen_usernames, self.seen_emails = set(), set()
+        self.max_workers = max_workers
+        self.pool = None
+
+    def __enter__(self):
+        # Only the import_roster command asks for worker processes; uploads queued from the
+        # web hash in the background thread. One pool serves the whole file.
+        if self.max_workers != 1:
+            self.pool = hashing_pool(self.max_workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def _clean(self, row, taken_usernames, taken_emails):
+        username, email = row.get('username', ''), row.get('email', '').lower()
+        try:
+            self.username_validator(username)
+        except ValidationError:
+            return f"Invalid username '{username}'."
+        if username.lower() in taken_usernames or username.lower() in self.seen_usernames:
+            return f"Username '{username}' is already taken."
+        try:
+            validate_email(email)
+        except ValidationError:
+            return f"Invalid email '{email}'."
+        if email in taken_emails or email in self.seen_emails:
+            return f"Email '{email}' is already in use."
+        if not row.get('phone') or len(row['phone']) > 15:
+            return "Phone is required (at most 15 characters)."
+        try:
+            row['date_of_birth'] = datetime.date.fromisoformat(row.get('date_of_birth', ''))
+        except ValueError:
+            return "date_of_birth must be YYYY-MM-DD."
+        if len(row.get('first_name', '')) > 50 or len(row.get('last_name', '')) > 50:
+            return "Names are limited to 50 characters."
+        program = row.get('program', '')
+        if program and program not in self.programs:
+            return f"Unknown program '{program}'."
+        row['email'] = email
+        row['program_id'] = self.programs.get(program)
+        self.seen_usernames.add(username.lower())
+        self.seen_emails.add(email)
+        return None
+
+    def validate(self, chunk):
+        taken_usernames = _taken_ignoring_case('username', [row.get('username', '') for _, row in chunk])
+        taken_emails = _taken_ignoring_case('email', [row.get('email', '') for _, row in chunk])
+        valid, errors = [], []
+        for line, row in chunk:
+            error = self._clean(row, taken_usernames, taken_emails)
+            if error:
+                errors.append([line, error])
+            else:
+                valid.append(row)
+        return valid, errors
+
+    def write(self, rows):
+        # Rows without a password get an unusable one; staff can reset it later
+        passwords = [row.get('password', '') for row in rows]
+        to_hash = [password for password in passwords if password]
+        hashes = iter(hash_passwords(to_hash, max_workers=self.max_workers, pool=self.pool))
+        password_hashes = [next(hashes) if password else make_password(None) for password in passwords]
+        User.objects.bulk_create([
+            User(
+                username=row['username'], email=row['email'], password=password_hash,
+                first_name=row.get('first_name', ''), last_name=row.get('last_name', ''),
+            )
+            for row, password_hash in zip(rows, password_hashes)
+        ])
+        users = User.objects.in_bulk([row['username'] for row in rows], field_name='username')
+        Student.objects.bulk_create([
+            Student(
+                user=users[row['username']],
+                first_name=row.get('first_name', ''),
+                last_name=row.get('last_name', ''),
+                phone=row['phone'],
+                date_of_birth=row['date_of_birth'],
+                address=row.get('address', ''),
+                program_id=row['program_id'],
+            )
+            for row in rows
+        ])
+        return len(rows)
+
+
+class CourseRoster:
+    required = {'course_name', 'program'}
+    days = {day for day, _ in DAYS_OF_WEEK}
+    semesters = {semester for semester, _ in SEMESTER_CHOICES}
+
+    def __init__(self, max_workers=1):
+        self.programs = dict(Program.objects.values_list('program_name', 'id'))
+        self.seen = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    @staticmethod
+    def _time(value):
+        return datetime.time.fromisoformat(value) if value else None
+
+    def _clean(self, row, existing):
+        name, program = row.get('course_name', ''), row.get('program', '')
+        if not name or len(name) > 100:
+            return "course_name is required (at most 100 characters)."
+        if program not in self.programs:
+            return f"Unknown program '{program}'."
+        row['day_of_week'] = row.get('day_of_week') or 'Monday'
+        row['semester'] = row.get('semester') or 'Semester 1'
+        if row['day_of_week'] not in self.days:
+            return f"Invalid day_of_week '{row['day_of_week']}'."
+        if row['semester'] not in self.semesters:
+            return f"Invalid semester '{row['semester']}'."
+        try:
+            row['start_time'] = self._time(row.get('start_time'))
+            row['end_time'] = self._time(row.get('end_time'))
+        except ValueError:
+            return "Times must be HH:MM."
+        if row['start_time'] and row['end_time'] and row['end_time'] <= row['start_time']:
+            return "end_time must be after start_time."
+        key = (name, self.programs[program], row['semester'])
+        if key in existing or key in self.seen:
+            return f"{name} already exists in {program} for {row['semester']}."
+        row['program_id'] = self.programs[program]
+        self.seen.add(key)
+        return None
+
+    def validate(self, chunk):
+        names = {row.get('course_name', '') for _, row in chunk}
+        existing = set(Course.objects.filter(course_name__in=names).values_list('course_name', 'program_id', 'semester'))
+        valid, errors = [], []
+        for line, row in chunk:
+            error = self._clean(row, existing)
+            if error:
+                errors.append([line, error])
+            else:
+                valid.append(row)
+        return valid, errors
+
+    def write(self, rows):
+        Course.objects.bulk_create([
+            Course(
+                course_name=row['course_name'], program_id=row['program_id'], day_of_week=row['day_of_week'],
+                start_time=row['start_time'], end_time=row['end_time'], semester=row['semester'],
+            )
+            for row in rows
+        ])
+        # bulk_create sends no post_save, so index the new courses for search here. Not every
+        # backend returns ids from bulk_create; (name, program, semester) is unique per import.
+        keys = {(row['course_name'], row['program_id'], row['semester']) for row in rows}
+        created = Course.objects.filter(
+            course_name__in={name for name, _, _ in keys}, program_id__in={program for _, program, _ in keys},
+        ).select_related('program')
+        search.index_courses(
+            course for course in created if (course.course_name, course.program_id, course.semester) in keys
+        )
+        return len(rows)
+
+
+ROSTERS = {'students': StudentRoster, 'courses': CourseRoster}
+
+
+def create_roster_import(kind, path, original_name='', created_by=None, restart=False):
+    """Return the unfinished import of this exact file to resume it, or start a new one."""
+    sha256 = file_sha256(path)
+    if not restart:
+        unfinished = RosterImport.objects.filter(
+            kind=kind, sha256=sha256, status__in=['pending', 'running', 'failed'],
+        ).order_by('-id').first()
+        if unfinished is not None:
+            return unfinished
+    return RosterImport.objects.create(
+        kind=kind, source=path, original_name=original_name or os.path.basename(path),
+        sha256=sha256, created_by=created_by,
+    )
+
+
+def store_roster_upload(kind, uploaded_file, created_by=None):
+    """Save an uploaded roster and queue its import once the row is committed.
+
+    Returns the import and whether this upload queued it: an unfinished import of the
+    same file that is still running elsewhere is left to that worker."""
+    name = default_storage.save(f'{ROSTER_DIR}/{uploaded_file.name}', uploaded_file)
+    roster_import = create_roster_import(
+        kind, default_storage.path(name), original_name=uploaded_file.name, created_by=created_by,
+    )
+    if roster_import.source != default_storage.path(name):
+        # Resuming an earlier upload of the same file; the new copy isn't needed
+        default_storage.delete(name)
+    if not claim_roster_import(roster_import.id, stale_before=stale_cutoff()):
+        return roster_import, False
+    queue_roster_import(roster_import.id)
+    return roster_import, True
+
+
+def stale_cutoff():
+    seconds = getattr(settings, 'ROSTER_STALE_SECONDS', DEFAULT_STALE_SECONDS)
+    return timezone.now() - datetime.timedelta(seconds=seconds)
+
+
+def claim_roster_import(roster_import_id, claim_running=False, stale_before=None):
+    """Mark a pending or failed import running for the caller. With `claim_running` a
+    running import is taken over too, or, given `stale_before`, one whose last heartbeat
+    is older than that: an import whose worker died. Returns whether it was claimed."""
+    claimable = Q(status__in=['pending', 'failed'])
+    if claim_running:
+        claimable |= Q(status='running')
+    elif stale_before is not None:
+        claimable |= Q(status='running', updated_at__lt=stale_before)
+    return bool(RosterImport.objects.filter(claimable, id=roster_import_id).update(
+        status='running', last_error='', updated_at=timezone.now(),
+    ))
+
+
+def queue_roster_import(roster_import_id):
+    """Run an import claimed by this request in the background once the request commits."""
+    transaction.on_commit(lambda: _executor.submit(_run_in_background, roster_import_id))
+
+
+def _run_in_background(roster_import_id):
+    close_old_connections()
+    try:
+        run_roster_import(RosterImport.objects.get(id=roster_import_id), claimed=True)
+    except Exception:
+        logger.exception("Roster import %s failed", roster_import_id)
+    finally:
+        connection.close()
+
+
+def _rows(source, required):
+    with open(source, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        try:
+            header = [column.strip().lower() for column in next(reader)]
+        except StopIteration:
+            raise RosterError("The file is empty.")
+        missing = required - set(header)
+        if missing:
+            raise RosterError(f"Missing column(s): {', '.join(sorted(missing))}.")
+        for values in reader:
+            if any(value.strip() for value in values):
+                # line_num is the source line, which stays right for quoted multi-line fields
+                yield reader.line_num, dict(zip(header, (value.strip() for value in values)))
+
+
+def _chunks(rows, chunk_size):
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_roster_import(roster_import, chunk_size=ROSTER_CHUNK_SIZE, max_workers=1,
+                      claim_running=False, claimed=False, progress=None):
+    """Import the roster from where the last committed chunk left off.
+
+    Each chunk is validated against preloaded and per-chunk lookups, then its valid rows
+    are written with bulk_create in one transaction together with the progress counters.
+    `claimed` skips the claim for an import already claimed with claim_roster_import.
+    """
+    if not claimed and not claim_roster_import(roster_import.id, claim_running=claim_running):
+        return roster_import
+    roster_import.refresh_from_db()
+    roster_class = ROSTERS[roster_import.kind]
+    try:
+        rows = _rows(roster_import.source, roster_class.required)
+        # Rows up to the last committed chunk were already imported (or reported)
+        rows = itertools.islice(rows, roster_import.rows_processed, None)
+        with roster_class(max_workers=max_workers) as roster:
+            for chunk in _chunks(rows, chunk_size):
+                valid, errors = roster.validate(chunk)
+                with transaction.atomic():
+                    try:
+                        with transaction.atomic():
+                            created = roster.write(valid) if valid else 0
+                    except IntegrityError as e:
+                        # A duplicate the lookups could not see, e.g. one inserted meanwhile:
+                        # report the chunk's rows rather than fail on them at every resume
+                        invalid = {line for line, _ in errors}
+                        errors += [[line, f"Not imported: {e}"] for line, _ in chunk if line not in invalid]
+                        errors.sort()
+                        created = 0
+                    roster_import.rows_processed += len(chunk)
+                    roster_import.created_count += created
+                    roster_import.error_count += len(errors)
+                    roster_import.errors.extend(errors[:MAX_STORED_ERRORS - len(roster_import.errors)])
+                    roster_import.save(update_fields=[
+                        'rows_processed', 'created_count', 'error_count', 'errors', 'updated_at',
+                    ])
+                if created:
+                    invalidate_dashboard_stats()
+                if progress:
+                    progress(roster_import)
+    except Exception as e:
+        roster_import.status = 'failed'
+        roster_import.last_error = str(e)
+        roster_import.save(update_fields=['status', 'last_error', 'updated_at'])
+        if isinstance(e, (RosterError, OSError, UnicodeDecodeError)):
+            return roster_import
+        raise
+    roster_import.status = 'done'
+    roster_import.finished_at = timezone.now()
+    roster_import.save(update_fields=['status', 'finished_at', 'updated_at'])
+    _delete_uploaded_source(roster_import)
+    return roster_import
+
+
+def _delete_uploaded_source(roster_import):
+    # A stored upload may carry plaintext passwords and is only kept to resume from;
+    # files imported from the command line belong to whoever ran the command
+    if os.path.dirname(roster_import.source) == default_storage.path(ROSTER_DIR):
+        default_storage.delete(f'{ROSTER_DIR}/{os.path.basename(roster_import.source)}')
@@ -0,0 +1,97 @@
+import bisect
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Enrollment
+from .replicas import primary_reads
+
+SCHEDULE_CACHE_TIMEOUT = 60 * 60
+
+
+class ScheduleIndex:
+    """Per-day interval index over a student's enrolled time slots.
+
+    Each day keeps its slots sorted by start time together with a running maximum of
+    end times, so an overlap check is a single bisect: a slot [start, end) clashes if
+    any enrolled slot starting before `end` finishes after `start`.
+    """
+
+    def __init__(self, slots=(), course_ids=()):
+        self.course_ids = set(course_ids)
+        self._starts = defaultdict(list)
+        self._ends = defaultdict(list)
+        self._max_end = defaultdict(list)
+        for day, start, end in slots:
+            self.add(day, start, end)
+
+    @classmethod
+    def for_student(cls, student):
+        rows = Enrollment.objects.filter(student=student).values_list(
+            'course_id', 'day_of_week', 'start_time', 'end_time'
+        )
+        course_ids, slots = [], []
+        for course_id, day, start, end in rows:
+            course_ids.append(course_id)
+            slots.append((day, start, end))
+        return cls(slots, course_ids)
+
+    def add(self, day, start, end, course_id=None):
+        if course_id is not None:
+            self.course_ids.add(course_id)
+        # Slots without times never clash, matching the SQL comparison against NULL
+        if start is None or end is None:
+            return
+        starts, ends, max_end = self._starts[day], self._ends[day], self._max_end[day]
+        i = bisect.bisect_right(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        del max_end[i:]
+        running = max_end[-1] if max_end else end
+        for slot_end in ends[i:]:
+            running = max(running, slot_end)
+            max_end.append(running)
+
+    def add_course(self, course):
+        self.add(course.day_of_week, course.start_time, course.end_time, course_id=course.id)
+
+    def conflicts(self, day, start, end):
+        if start is None or end is None:
+            return False
+        starts = self._starts.get(day)
+        if not starts:
+            return False
+        i = bisect.bisect_left(starts, end)
+        return i > 0 and self._max_end[day][i - 1] > start
+
+    def conflicts_with(self, course):
+        return self.conflicts(course.day_of_week, course.start_time, course.end_time)
+
+    def annotate(self, courses):
+        """Set `is_enrolled` and `has_conflict` on each course and return them as a list."""
+        courses = list(courses)
+        for course in courses:
+            course.is_enrolled = course.id in self.course_ids
+            course.has_conflict = not course.is_enrolled and self.conflicts_with(course)
+        return courses
+
+
+def _cache_key(student_id):
+    return f'schedule-index:{student_id}'
+
+
+def get_schedule_index(student):
+    index = cache.get(_cache_key(student.id))
+    if index is None:
+        with primary_reads():
+            index = ScheduleIndex.for_student(student)
+        cache.set(_cache_key(student.id), index, SCHEDULE_CACHE_TIMEOUT)
+    return index
+
+
+def invalidate_schedule_index(*student_ids):
+    keys = [_cache_key(student_id) for student_id in student_ids]
+    cache.delete_many(keys)
+    # Drop them again once the write is visible, in case a concurrent read re-cached stale slots
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,262 @@
+import os
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Course, CourseDocument, Program, SearchEntry
+
+DEFAULT_LIMIT = 20
+AUTOCOMPLETE_LIMIT = 10
+REBUILD_BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(query):
+    return _TOKEN_RE.findall(query or '')
+
+
+class BaseSearchBackend:
+    """Runs ranked and prefix queries against SearchEntry.
+
+    `course_ids`, when given, limits document hits to those courses; course and
+    program entries are visible to everyone."""
+
+    def search(self, query, limit=DEFAULT_LIMIT, course_ids=None):
+        raise NotImplementedError
+
+    def autocomplete(self, prefix, limit=AUTOCOMPLETE_LIMIT, course_ids=None):
+        raise NotImplementedError
+
+    def optimize(self):
+        pass
+
+    @staticmethod
+    def _visibility(course_ids, params):
+        if course_ids is None:
+            return ''
+        course_ids = list(course_ids)
+        if not course_ids:
+            return " AND e.kind <> 'document'"
+        params.extend(course_ids)
+        placeholders = ', '.join(['%s'] * len(course_ids))
+        return f" AND (e.kind <> 'document' OR e.course_id IN ({placeholders}))"
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    # Title hits weigh more than body hits in the bm25 ranking
+    RANK = 'bm25(core_searchentry_fts, 10.0, 1.0)'
+
+    @staticmethod
+    def match_expression(tokens, column=None):
+        # Quote every token so user input can't inject FTS5 syntax; the last one is a prefix
+        terms = [f'"{token}"' for token in tokens]
+        terms[-1] += '*'
+        expression = ' '.join(terms)
+        return f'{column} : ({expression})' if column else expression
+
+    def _query(self, match, limit, course_ids):
+        params = [match]
+        visibility = self._visibility(course_ids, params)
+        params.append(limit)
+        return SearchEntry.objects.raw(
+            f"SELECT e.id, e.kind, e.object_id, e.course_id, e.title, {self.RANK} AS score "
+            "FROM core_searchentry_fts JOIN core_searchentry e ON e.id = core_searchentry_fts.rowid "
+            f"WHERE core_searchentry_fts MATCH %s{visibility} ORDER BY score LIMIT %s",
+            params,
+        )
+
+    def search(self, query, limit=DEFAULT_LIMIT, course_ids=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        return list(self._query(self.match_expression(tokens), limit, course_ids))
+
+    def autocomplete(self, prefix, limit=AUTOCOMPLETE_LIMIT, course_ids=None):
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        return list(self._query(self.match_expression(tokens, column='title'), limit, course_ids))
+
+    def optimize(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO core_searchentry_fts(core_searchentry_fts) VALUES ('optimize')")
+
+
+class MySQLFulltextBackend(BaseSearchBackend):
+    @staticmethod
+    def match_expression(tokens):
+        # Boolean mode: every token required, the last one as a prefix
+        terms = [f'+{token}' for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def _query(self, columns, tokens, limit, course_ids):
+        match = self.match_expression(tokens)
+        params = [match, match]
+        visibility = self._visibility(course_ids, params)
+        params.append(limit)
+        against = f"MATCH({columns}) AGAINST (%s IN BOOLEAN MODE)"
+        return list(SearchEntry.objects.raw(
+            f"SELECT e.id, e.kind, e.object_id, e.course_id, e.title, {against} AS score "
+            f"FROM core_searchentry e WHERE {against}{visibility} ORDER BY score DESC LIMIT %s",
+            params,
+        ))
+
+    def search(self, query, limit=DEFAULT_LIMIT, course_ids=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        return self._query('e.title, e.body', tokens, limit, course_ids)
+
+    def autocomplete(self, prefix, limit=AUTOCOMPLETE_LIMIT, course_ids=None):
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        return self._query('e.title', tokens, limit, course_ids)
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Unindexed fallback for databases without a full-text backend."""
+
+    def _queryset(self, course_ids, tokens, fields):
+        entries = SearchEntry.objects.defer('body')
+        if course_ids is not None:
+            entries = entries.filter(~Q(kind='document') | Q(course_id__in=list(course_ids)))
+        for token in tokens:
+            match = Q()
+            for field in fields:
+                match |= Q(**{f'{field}__icontains': token})
+            entries = entries.filter(match)
+        return entries
+
+    def search(self, query, limit=DEFAULT_LIMIT, course_ids=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        return list(self._queryset(course_ids, tokens, ('title', 'body')).order_by('kind', 'title')[:limit])
+
+    def autocomplete(self, prefix, limit=AUTOCOMPLETE_LIMIT, course_ids=None):
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        return list(self._queryset(course_ids, tokens, ('title',)).order_by('title')[:limit])
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'mysql': MySQLFulltextBackend,
+}
+
+
+def get_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connection.vendor, LikeSearchBackend)()
+
+
+def search(query, limit=DEFAULT_LIMIT, course_ids=None):
+    return get_backend().search(query, limit=limit, course_ids=course_ids)
+
+
+def autocomplete(prefix, limit=AUTOCOMPLETE_LIMIT, course_ids=None):
+    return get_backend().autocomplete(prefix, limit=limit, course_ids=course_ids)
+
+
+# Indexing. The full-text index itself is maintained by the database (FTS5 triggers or a
+# FULLTEXT index), so keeping SearchEntry rows current is all that is needed here.
+
+def _document_title(document):
+    return document.original_name or os.path.basename(document.document.name)
+
+
+def _course_entry(course, program_name):
+    return SearchEntry(
+        kind='course', object_id=course.id, course_id=course.id,
+        title=course.course_name, body=program_name,
+    )
+
+
+def _program_entry(program):
+    return SearchEntry(kind='program', object_id=program.id, title=program.program_name)
+
+
+def _document_entry(document):
+    return SearchEntry(
+        kind='document', object_id=document.id, course_id=document.course_id,
+        title=_document_title(document), body=document.text,
+    )
+
+
+def _save(entry):
+    SearchEntry.objects.update_or_create(
+        kind=entry.kind, object_id=entry.object_id,
+        defaults={'course_id': entry.course_id, 'title': entry.title, 'body': entry.body},
+    )
+
+
+def index_course(course):
+    program_name = Program.objects.filter(id=course.program_id).values_list('program_name', flat=True).first()
+    _save(_course_entry(course, program_name or ''))
+
+
+def index_courses(courses):
+    """Index many courses at once, e.g. after a bulk_create that sent no signals.
+
+    Each course needs `program` loaded."""
+    SearchEntry.objects.bulk_create(
+        [_course_entry(course, course.program.program_name) for course in courses],
+        batch_size=REBUILD_BATCH_SIZE, update_conflicts=True,
+        unique_fields=['kind', 'object_id'], update_fields=['course_id', 'title', 'body'],
+    )
+
+
+def index_program(program):
+    with transaction.atomic():
+        _save(_program_entry(program))
+        # Course entries carry the program name so "<program> <course>" queries match
+        SearchEntry.objects.filter(
+            kind='course', object_id__in=Course.objects.filter(program=program).values('id')
+        ).update(body=program.program_name)
+
+
+def index_document(document):
+    _save(_document_entry(document))
+
+
+def remove(kind, object_id):
+    SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            SearchEntry.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        SearchEntry.objects.bulk_create(batch)
+
+
+def rebuild():
+    """Re-create every entry from the source tables and return how many were written."""
+    programs = Program.objects.only('id', 'program_name').order_by('id')
+    courses = Course.objects.select_related('program').only(
+        'id', 'course_name', 'program__program_name'
+    ).order_by('id')
+    documents = CourseDocument.objects.only('id', 'course_id', 'original_name', 'document', 'text').order_by('id')
+    with transaction.atomic():
+        SearchEntry.objects.all().delete()
+        _bulk_insert(_program_entry(program) for program in programs.iterator(chunk_size=REBUILD_BATCH_SIZE))
+        _bulk_insert(
+            _course_entry(course, course.program.program_name)
+            for course in courses.iterator(chunk_size=REBUILD_BATCH_SIZE)
+        )
+        _bulk_insert(_document_entry(document) for document in documents.iterator(chunk_size=REBUILD_BATCH_SIZE))
+    get_backend().optimize()
+    return SearchEntry.objects.count()
@@ -0,0 +1,93 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import search
+from .analytics import apply_grade_changes
+from .models import Course, CourseDocument, Enrollment, Grade, Notification, Program, Student, StudentRequest
+from .notifications import invalidate_unread_count
+from .schedule import invalidate_schedule_index
+from .stats import invalidate_dashboard_stats
+from .timetable import invalidate_timetable
+from .usernames import base_username_for
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    invalidate_schedule_index(instance.student_id)
+    invalidate_timetable(instance.student_id)
+
+
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Program)
+@receiver([post_save, post_delete], sender=StudentRequest)
+@receiver([post_save, post_delete], sender=Enrollment)
+@receiver([post_save, post_delete], sender=Grade)
+def dashboard_data_changed(sender, **kwargs):
+    invalidate_dashboard_stats()
+
+
+# post_save only: a post_delete receiver would stop Notification deletes from being
+# fast bulk deletes, and deleted rows are almost always read ones (see purge_read_notifications)
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, **kwargs):
+    invalidate_unread_count(instance.user_id)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    search.index_course(instance)
+    if not created:
+        # Timetables show the course name; the schedule itself is copied onto each enrollment
+        invalidate_timetable(*Enrollment.objects.filter(course=instance).values_list('student_id', flat=True))
+
+
+@receiver(post_save, sender=Program)
+def program_saved(sender, instance, **kwargs):
+    search.index_program(instance)
+
+
+# Extracted text is written by core.processing with .update(), which re-indexes explicitly
+@receiver(post_save, sender=CourseDocument)
+def document_saved(sender, instance, **kwargs):
+    search.index_document(instance)
+
+
+SEARCH_KINDS = {Course: 'course', Program: 'program', CourseDocument: 'document'}
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Program)
+@receiver(post_delete, sender=CourseDocument)
+def search_source_deleted(sender, instance, **kwargs):
+    search.remove(SEARCH_KINDS[sender], instance.pk)
+
+
+@receiver(pre_save, sender=StudentRequest)
+def student_request_saving(sender, instance, **kwargs):
+    instance.username_base = base_username_for(instance)
+
+
+@receiver(pre_save, sender=Grade)
+def grade_saving(sender, instance, **kwargs):
+    # Remember what is being overwritten so the aggregates can take it back out
+    instance._previous_grade = None
+    if instance.pk:
+        instance._previous_grade = Grade.objects.filter(pk=instance.pk).values_list(
+            'student_id', 'course_id', 'grade'
+        ).first()
+
+
+@receiver(post_save, sender=Grade)
+def grade_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_grade', None)
+    apply_grade_changes(
+        removed=[previous] if previous else [],
+        added=[(instance.student_id, instance.course_id, instance.grade)],
+    )
+
+
+@receiver(post_delete, sender=Grade)
+def grade_deleted(sender, instance, **kwargs):
+    apply_grade_changes(removed=[(instance.student_id, instance.course_id, instance.grade)])
+
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Func, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Course, Enrollment, Grade, Program, Student, StudentRequest
+
+DASHBOARD_STATS_KEY = 'dashboard-stats'
+DASHBOARD_STATS_TIMEOUT = 60 * 15
+
+
+class _Count(Func):
+    # COUNT as a plain function so the subquery stays a scalar without GROUP BY
+    function = 'COUNT'
+
+
+def _total(queryset):
+    return Subquery(queryset.order_by().annotate(n=_Count('pk')).values('n'))
+
+
+def _per_program(queryset, program_path):
+    return Coalesce(Subquery(
+        queryset.filter(**{program_path: OuterRef('pk')}).order_by().annotate(n=_Count('pk')).values('n')
+    ), 0)
+
+
+def compute_dashboard_stats():
+    """All admin dashboard aggregates in one query: one row per program, with the
+    table-wide totals repeated on each row as scalar subqueries."""
+    rows = list(
+        Program.objects.order_by('program_name').annotate(
+            student_count=_per_program(Student.objects, 'program'),
+            course_count=_per_program(Course.objects, 'program'),
+            enrollment_count=_per_program(Enrollment.objects, 'course__program'),
+            grade_count=_per_program(Grade.objects, 'course__program'),
+            total_students=_total(Student.objects),
+            total_student_requests=_total(StudentRequest.objects),
+        ).values(
+            'id', 'program_name', 'student_count', 'course_count', 'enrollment_count', 'grade_count',
+            'total_students', 'total_student_requests',
+        )
+    )
+    if rows:
+        total_students = rows[0]['total_students']
+        total_student_requests = rows[0]['total_student_requests']
+    else:
+        total_students = Student.objects.count()
+        total_student_requests = StudentRequest.objects.count()
+    programs = [
+        {key: row[key] for key in (
+            'id', 'program_name', 'student_count', 'course_count', 'enrollment_count', 'grade_count'
+        )}
+        for row in rows
+    ]
+    return {
+        'programs': programs,
+        'total_students': total_students,
+        # Every course belongs to exactly one program
+        'total_courses': sum(program['course_count'] for program in programs),
+        'total_programs': len(programs),
+        'total_student_requests': total_student_requests,
+    }
+
+
+def get_dashboard_stats():
+    stats = cache.get(DASHBOARD_STATS_KEY)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        cache.set(DASHBOARD_STATS_KEY, stats, DASHBOARD_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_dashboard_stats():
+    cache.delete(DASHBOARD_STATS_KEY)
+    transaction.on_commit(lambda: cache.delete(DASHBOARD_STATS_KEY))
@@ -1,3 +1,1472 @@
-from django.test import TestCase
+import datetime
+import fcntl
+import io
+import json
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import search, usernames
+from .analytics import rebuild_grade_aggregates
+from .approvals import APPROVAL_MESSAGE
+from .approvals import APPROVAL_MESSAGE, approve_requests, reject_requests
+from .benchmarks import BENCHMARKS, compare, run_benchmarks, seed
+from .broadcasts import deliver_broadcast, resume_stale_broadcasts
+from .downloads import parse_range
+from .enrollment import enroll_cohort, enroll_in_courses, plan_enrollments
+from .forms import BroadcastForm
+from .grades import upsert_grades
+from .metrics import QueryRecorder, registry, sql_shape, view_label
+from .notifications import latest_notifications, mark_all_read, mark_read, purge_read_notifications, unread_count
+from .pagination import keyset_paginate
+from .processing import process_document
+from .replicas import PIN_COOKIE
+from .schedule import ScheduleIndex, get_schedule_index
+from .stats import compute_dashboard_stats, get_dashboard_stats
+from .uploads import (
+    UPLOAD_DIR, append_chunk, finish_upload, purge_stale_uploads, received_bytes, start_upload, store_uploaded_file,
+)
+from .usernames import create_user_with_unique_username, next_free_username, preview_usernames
+from .views import BulkApproveRejectView, MetricsView
+from .rosters import StudentRoster, create_roster_import, run_roster_import, store_roster_upload
+from .models import (
+    Broadcast, Course, CourseDocument, CourseGradeCount, CourseGradeSummary, DocumentBlob, Enrollment, Grade,
+    Notification, Program, ProgramGradeSummary, RosterImport, Student, StudentGradeSummary, StudentRequest,
+    UploadSession,
+)
+
+
+class QueryCountTests(TestCase):
+    """Each list page must run the same number of queries however many rows it renders."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(program_name="Computing")
+        cls.staff = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        cls.student_user = User.objects.create_user(username="student", password="pass")
+        cls.student = Student.objects.create(
+            user=cls.student_user, phone="0", date_of_birth=datetime.date(2000, 1, 1),
+            address="-", program=cls.program,
+        )
+
+    def add_rows(self, count):
+        start = Course.objects.count()
+        for i in range(start, start + count):
+            course = Course.objects.create(
+                course_name=f"Course {i}", program=self.program, day_of_week="Monday",
+                start_time=datetime.time(i % 24), end_time=datetime.time(i % 24, 30),
+            )
+            Enrollment.objects.create(student=self.student, course=course)
+            Grade.objects.create(student=self.student, course=course, grade="A")
+            user = User.objects.create_user(username=f"user{i}")
+            Student.objects.create(user=user, phone="0", date_of_birth=datetime.date(2000, 1, 1), address="-")
+            Notification.objects.create(user=self.student_user, message=f"Message {i}")
+            StudentRequest.objects.create(
+                first_name="Jo", last_name=f"Doe{i}", email=f"jo{i}@example.com", phone="0",
+                date_of_birth=datetime.date(2000, 1, 1), address="-",
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertFlatQueries(self, user, url_name, expected):
+        self.client.force_login(user)
+        url = reverse(url_name)
+        self.add_rows(1)
+        self.assertEqual(self.count_queries(url), expected)
+        self.add_rows(5)
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_student_dashboard(self):
+        self.assertFlatQueries(self.student_user, "student_dashboard", 7)
+
+    def test_timetable(self):
+        self.assertFlatQueries(self.student_user, "timetable", 5)
+
+    def test_grades(self):
+        self.assertFlatQueries(self.student_user, "grades", 5)
+
+    def test_student_courses(self):
+        self.assertFlatQueries(self.student_user, "courses", 7)
+
+    def test_admin_course_list(self):
+        self.assertFlatQueries(self.staff, "admin_course_list", 4)
+
+    def test_course_list(self):
+        self.assertFlatQueries(self.staff, "course_list", 4)
+
+    def test_reset_student_password(self):
+        self.assertFlatQueries(self.staff, "reset_student_password", 3)
+
+    def test_update_grades(self):
+        self.assertFlatQueries(self.staff, "update_grades", 5)
+
+    def test_student_request_list(self):
+        self.assertFlatQueries(self.staff, "student_request_list", 5)
+
+    def test_admin_dashboard(self):
+        self.assertFlatQueries(self.staff, "admin_dashboard", 3)
+        # Served from the cached snapshot until something changes
+        self.assertEqual(self.count_queries(reverse("admin_dashboard")), 2)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(program_name="Computing")
+        cls.algorithms = Course.objects.create(course_name="Algorithms and Data Structures", program=cls.program)
+        cls.db_course = Course.objects.create(course_name="Databases", program=cls.program)
+        cls.notes = CourseDocument.objects.create(
+            course=cls.db_course, document="course_documents/notes.txt", original_name="week1.txt",
+            text="B-tree indexes and query planning",
+        )
+
+    def titles(self, entries):
+        return [entry.title for entry in entries]
+
+    def test_index_follows_signals(self):
+        self.assertEqual(self.titles(search.search("algorithms")), ["Algorithms and Data Structures"])
+        self.algorithms.course_name = "Graph Theory"
+        self.algorithms.save()
+        self.assertEqual(search.search("algorithms"), [])
+        self.db_course.delete()
+        self.assertEqual(search.search("planning"), [])
+
+    def test_program_name_matches_its_courses(self):
+        self.assertIn("Databases", self.titles(search.search("computing databases")))
+        self.program.program_name = "Informatics"
+        self.program.save()
+        self.assertIn("Databases", self.titles(search.search("informatics databases")))
+
+    def test_prefix_and_autocomplete(self):
+        self.assertEqual(self.titles(search.search("plan")), ["week1.txt"])
+        self.assertEqual(self.titles(search.autocomplete("data")), ["Databases", "Algorithms and Data Structures"])
+
+    def test_documents_limited_to_enrolled_courses(self):
+        self.assertEqual(search.search("btree index", course_ids=set()), [])
+        self.assertEqual(self.titles(search.search("tree index", course_ids={self.db_course.id})), ["week1.txt"])
+
+    def test_rebuild(self):
+        from .models import SearchEntry
+        SearchEntry.objects.all().delete()
+        self.assertEqual(search.rebuild(), 4)
+        self.assertEqual(self.titles(search.search("query")), ["week1.txt"])
+
+
+class TimetableTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(program_name="Computing")
+        cls.user = User.objects.create_user(username="student", password="pass")
+        cls.student = Student.objects.create(
+            user=cls.user, phone="0", date_of_birth=datetime.date(2000, 1, 1), address="-", program=cls.program,
+        )
+        cls.late = Course.objects.create(
+            course_name="Late", program=cls.program, day_of_week="Monday",
+            start_time=datetime.time(14), end_time=datetime.time(15),
+        )
+        cls.early = Course.objects.create(
+            course_name="Early", program=cls.program, day_of_week="Monday",
+            start_time=datetime.time(9), end_time=datetime.time(10),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        Enrollment.objects.create(student=self.student, course=self.late)
+        Enrollment.objects.create(student=self.student, course=self.early)
+
+    def test_grid_groups_by_day_sorted_by_start(self):
+        response = self.client.get(reverse("timetable"))
+        monday = dict(response.context["timetable"].days)["Monday"]
+        self.assertEqual([slot.course_name for slot in monday], ["Early", "Late"])
+
+    def test_etag_changes_with_enrollments(self):
+        etag = self.client.get(reverse("timetable"))["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("timetable"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any("core_enrollment" in q["sql"] for q in ctx.captured_queries))
+        Enrollment.objects.filter(course=self.late).delete()
+        response = self.client.get(reverse("timetable"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Late")
+
+    def test_calendar_feed(self):
+        self.client.post(reverse("calendar_feed_token"))
+        self.student.refresh_from_db()
+        url = reverse("timetable_feed", args=[self.student.calendar_token])
+        self.client.logout()
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        body = response.content.decode()
+        self.assertEqual(body.count("BEGIN:VEVENT"), 2)
+        self.assertIn("RRULE:FREQ=WEEKLY;BYDAY=MO;UNTIL=", body)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        Enrollment.objects.filter(course=self.late).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.content.decode().count("BEGIN:VEVENT"), 1)
+        self.assertEqual(self.client.get(reverse("timetable_feed", args=["nope"])).status_code, 404)
+
+
+class GradeImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(program_name="Computing")
+        cls.staff = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        cls.course = Course.objects.create(course_name="Algorithms", program=cls.program)
+        cls.students = []
+        for name in ("ann", "bob"):
+            user = User.objects.create_user(username=name)
+            student = Student.objects.create(user=user, phone="0", date_of_birth=datetime.date(2000, 1, 1), address="-")
+            Enrollment.objects.create(student=student, course=cls.course)
+            cls.students.append(student)
+        User.objects.create_user(username="carl")
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def upload(self, content, **data):
+        data["file"] = SimpleUploadedFile("grades.csv", content.encode())
+        return self.client.post(reverse("import_grades"), data)
+
+    def test_import_upserts_existing_grades(self):
+        Grade.objects.create(student=self.students[0], course=self.course, grade="C")
+        response = self.upload(f"username,course_id,grade\nann,{self.course.id},a\nbob,{self.course.id},B+\n")
+        self.assertRedirects(response, reverse("update_grades"))
+        self.assertEqual(
+            dict(Grade.objects.values_list("student__user__username", "grade")), {"ann": "A", "bob": "B+"}
+        )
+
+    def test_row_errors_abort_the_import(self):
+        response = self.upload(
+            "username,grade\nann,A\ncarl,A\nbob,Z\nann,B\n", course=self.course.id,
+        )
+        self.assertEqual(
+            [row for row, _ in response.context["import_result"].errors], [3, 4, 5]
+        )
+        self.assertFalse(Grade.objects.exists())
+
+    def test_grade_sheet(self):
+        url = reverse("course_grade_sheet", args=[self.course.id])
+        ann, bob = self.students
+        self.client.post(url, {f"grade_{ann.id}": "b", f"grade_{bob.id}": ""})
+        self.client.post(url, {f"grade_{ann.id}": "A-", f"grade_{bob.id}": "F"})
+        self.assertEqual(dict(Grade.objects.values_list("student_id", "grade")), {ann.id: "A-", bob.id: "F"})
+
+
+class GradeAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(program_name="Computing")
+        cls.staff = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        cls.courses = [Course.objects.create(course_name=f"Course {i}", program=cls.program) for i in range(2)]
+        cls.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f"s{i}"), phone="0",
+                date_of_birth=datetime.date(2000, 1, 1), address="-", program=cls.program,
+            )
+            for i in range(2)
+        ]
+
+    def snapshot(self):
+        return (
+            sorted(StudentGradeSummary.objects.values_list("student_id", "graded", "quality_points")),
+            sorted(CourseGradeSummary.objects.values_list("course_id", "graded", "quality_points")),
+            sorted(ProgramGradeSummary.objects.values_list("program_id", "graded", "quality_points")),
+            sorted(CourseGradeCount.objects.filter(count__gt=0).values_list("course_id", "grade", "count")),
+        )
+
+    def test_incremental_updates_match_a_rebuild(self):
+        (s0, s1), (c0, c1) = self.students, self.courses
+        grade = Grade.objects.create(student=s0, course=c0, grade="A")
+        Grade.objects.create(student=s0, course=c1, grade="B-")
+        self.assertEqual(s0.grade_summary.average, 3.35)
+        grade.grade = "C"
+        grade.save()
+        upsert_grades({(s1.id, c0.id): "B", (s0.id, c1.id): "A-"})
+        Grade.objects.filter(student=s1).delete()
+        incremental = self.snapshot()
+        self.assertEqual(incremental[0], [(s0.id, 2, 57)])
+        self.assertEqual(incremental[2], [(self.program.id, 2, 57)])
+        rebuild_grade_aggregates()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_reports_read_the_aggregates(self):
+        Grade.objects.create(student=self.students[0], course=self.courses[0], grade="A")
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("grade_report"))
+        self.assertContains(response, "A: 1")
+        response = self.client.get(reverse("grade_report_export", args=["students"]))
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[1], f"{self.students[0].id},s0,Computing,1,4.0")
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        cls.programs = [Program.objects.create(program_name=name) for name in ("Computing", "Maths")]
+        for i, program in enumerate(cls.programs):
+            user = User.objects.create_user(username=f"s{i}")
+            student = Student.objects.create(
+                user=user, phone="0", date_of_birth=datetime.date(2000, 1, 1), address="-", program=program,
+            )
+            for semester in ("Semester 1", "Semester 2"):
+                course = Course.objects.create(course_name=f"{program} {semester}", program=program, semester=semester)
+                Enrollment.objects.create(student=student, course=course)
+                Grade.objects.create(student=student, course=course, grade="B")
+
+    def export(self, kind, export_format, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("data_export", args=[kind, export_format]), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_filters(self):
+        rows = self.export("grades", "csv", program=self.programs[0].id, semester="Semester 2").splitlines()
+        self.assertEqual(rows[0], "id,username,course_id,course_name,program,semester,grade")
+        self.assertEqual(len(rows), 2)
+        self.assertIn("Computing Semester 2", rows[1])
+
+    def test_json_is_chunked_by_id(self):
+        from .exports import export_queryset, iter_rows
+        self.assertEqual(len(list(iter_rows(export_queryset("enrollments"), chunk_size=1))), 4)
+        students = json.loads(self.export("students", "json", semester="Semester 1"))
+        self.assertEqual([student["username"] for student in students], ["s0", "s1"])
+        self.assertEqual(students[0]["date_of_birth"], "2000-01-01")
+
+
+class RosterImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(program_name="Computing")
+        User.objects.create_user(username="taken", email="taken@example.com")
+
+    def write_csv(self, content):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_students_with_row_errors(self):
+        path = self.write_csv(
+            "username,email,phone,date_of_birth,program,password\n"
+            "ann,ann@example.com,1,2000-01-01,Computing,secret123\n"
+            "taken,new@example.com,1,2000-01-01,,\n"
+            "bob,bob@example.com,1,01/01/2000,,\n"
+            "cat,ANN@example.com,1,2000-01-01,,\n"
+            "dan,dan@example.com,1,2000-01-01,Unknown,\n"
+            "eve,eve@example.com,1,2000-01-01,,\n"
+        )
+        call_command("import_roster", "students", path, "--chunk-size", "2", "--workers", "1", stdout=open(os.devnull, "w"), stderr=open(os.devnull, "w"))
+        self.assertEqual(
+            sorted(Student.objects.values_list("user__username", "program__program_name")),
+            [("ann", "Computing"), ("eve", None)],
+        )
+        self.assertTrue(User.objects.get(username="ann").check_password("secret123"))
+        self.assertFalse(User.objects.get(username="eve").has_usable_password())
+        roster_import = RosterImport.objects.get()
+        self.assertEqual((roster_import.status, roster_import.rows_processed, roster_import.error_count), ("done", 6, 4))
+        self.assertEqual([line for line, _ in roster_import.errors], [3, 4, 5, 6])
+
+    def test_username_and_email_collisions_ignore_case(self):
+        path = self.write_csv(
+            "username,email,phone,date_of_birth\n"
+            "Taken,new@example.com,1,2000-01-01\n"
+            "fay,TAKEN@Example.com,1,2000-01-01\n"
+            "Gus,gus@example.com,1,2000-01-01\n"
+            "gus,gus2@example.com,1,2000-01-01\n"
+        )
+        roster_import = run_roster_import(create_roster_import("students", path), chunk_size=10)
+        self.assertEqual([line for line, _ in roster_import.errors], [2, 3, 5])
+        self.assertEqual(list(Student.objects.values_list("user__username", flat=True)), ["Gus"])
+
+    def test_integrity_error_reports_the_chunk_and_carries_on(self):
+        path = self.write_csv(
+            "username,email,phone,date_of_birth\n"
+            "ann,ann@example.com,1,2000-01-01\n"
+            "bob,bob@example.com,1,01/01/2000\n"
+            "cat,cat@example.com,1,2000-01-01\n"
+            "dan,dan@example.com,1,2000-01-01\n"
+        )
+        real_write = StudentRoster.write
+
+        def write(roster, rows):
+            if rows[0]["username"] == "ann":
+                # As if another process inserted ann after the chunk was validated
+                raise IntegrityError("UNIQUE constraint failed: auth_user.username")
+            return real_write(roster, rows)
+
+        with mock.patch.object(StudentRoster, "write", autospec=True, side_effect=write):
+            roster_import = run_roster_import(create_roster_import("students", path), chunk_size=2)
+        self.assertEqual((roster_import.status, roster_import.created_count, roster_import.error_count), ("done", 2, 2))
+        self.assertEqual([line for line, _ in roster_import.errors], [2, 3])
+        self.assertIn("Not imported", roster_import.errors[0][1])
+        self.assertEqual(sorted(Student.objects.values_list("user__username", flat=True)), ["cat", "dan"])
+
+    def test_resume_after_last_committed_chunk(self):
+        path = self.write_csv(
+            "course_name,program,day_of_week,start_time,end_time,semester\n"
+            "Algorithms,Computing,Tuesday,09:00,10:30,Semester 2\n"
+            "Databases,Computing,,,,\n"
+        )
+        roster_import = create_roster_import("courses", path)
+        # As if a first run committed one chunk and then died
+        Course.objects.create(course_name="Algorithms", program=self.program, semester="Semester 2")
+        RosterImport.objects.filter(id=roster_import.id).update(status="failed", rows_processed=1)
+        self.assertEqual(create_roster_import("courses", path).id, roster_import.id)
+        run_roster_import(roster_import, chunk_size=1)
+        roster_import.refresh_from_db()
+        self.assertEqual((roster_import.status, roster_import.created_count, roster_import.error_count), ("done", 1, 0))
+        self.assertEqual(sorted(Course.objects.values_list("course_name", flat=True)), ["Algorithms", "Databases"])
+        self.assertEqual([entry.title for entry in search.search("databases")], ["Databases"])
+
+    def start_web_import(self, content, **fields):
+        # An earlier web upload of `content` whose worker got as far as the first row
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(User.objects.create_user(username="admin", is_staff=True))
+        roster_import = create_roster_import("students", self.write_csv(content))
+        RosterImport.objects.filter(id=roster_import.id).update(rows_processed=1, **fields)
+        return roster_import
+
+    def upload(self, content):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse("roster_import"), {
+                "kind": "students", "file": SimpleUploadedFile("roster.csv", content.encode()),
+            }, follow=True)
+        return [str(message) for message in response.context["messages"]], callbacks
+
+    def test_upload_resumes_an_import_whose_worker_died(self):
+        content = "username,email,phone,date_of_birth\nann,ann@example.com,1,2000-01-01\n"
+        roster_import = self.start_web_import(
+            content, status="running", updated_at=timezone.now() - timedelta(hours=1),
+        )
+        messages, callbacks = self.upload(content)
+        self.assertEqual(messages, ["Resuming the earlier import of this file from row 2."])
+        self.assertEqual(len(callbacks), 1)
+        roster_import.refresh_from_db()
+        self.assertEqual(roster_import.status, "running")
+        self.assertGreater(roster_import.updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_upload_leaves_a_running_import_to_its_worker(self):
+        content = "username,email,phone,date_of_birth\nann,ann@example.com,1,2000-01-01\n"
+        self.start_web_import(content, status="running")
+        messages, callbacks = self.upload(content)
+        self.assertEqual(messages, ["An earlier import of this file is still running; its progress is shown below."])
+        self.assertEqual(callbacks, [])
+
+    def test_finished_upload_is_deleted(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        upload = SimpleUploadedFile(
+            "roster.csv", b"username,email,phone,date_of_birth,password\nann,ann@example.com,1,2000-01-01,secret123\n",
+        )
+        with self.captureOnCommitCallbacks():
+            roster_import, queued = store_roster_upload("students", upload)
+        self.assertTrue(queued)
+        self.assertTrue(os.path.exists(roster_import.source))
+        roster_import = run_roster_import(roster_import, claimed=True)
+        self.assertEqual((roster_import.status, roster_import.created_count), ("done", 1))
+        self.assertFalse(os.path.exists(roster_import.source))
+
+    def test_resume_only_takes_over_a_stalled_running_import(self):
+        roster_import = self.start_web_import("username,email,phone,date_of_birth\n", status="running")
+        url = reverse("resume_roster_import", args=[roster_import.id])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(url, follow=True)
+        self.assertContains(response, "Only failed or stalled imports can be resumed.")
+        self.assertNotContains(response, ">Resume</button>")
+        self.assertEqual(callbacks, [])
+
+        RosterImport.objects.filter(id=roster_import.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertContains(self.client.get(reverse("roster_import")), ">Resume</button>")
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(url, follow=True)
+        self.assertContains(response, f"Resuming {roster_import.original_name} after row 1.")
+        self.assertEqual(len(callbacks), 1)
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed('tiny')
+
+    def test_every_path_runs_and_regressions_are_reported(self):
+        results = run_benchmarks(iterations=1, warmup=0)
+        self.assertEqual([r.name for r in results], [b.name for b in BENCHMARKS])
+        self.assertTrue(all(r.queries > 0 and r.median_ms > 0 for r in results))
+        baseline = {r.name: {'queries': r.queries, 'median_ms': r.median_ms * 10, 'peak_kib': r.peak_kib * 10} for r in results}
+        self.assertEqual(compare(results, baseline), [])
+        baseline['timetable']['queries'] -= 1
+        self.assertEqual(len(compare(results, baseline)), 1)
+        self.assertEqual(compare(results, baseline, query_threshold=1), [])
+        # Latency varies between machines and is reported, not gated on
+        baseline['timetable']['median_ms'] = results[0].median_ms / 100
+        baseline['admin_dashboard']['peak_kib'] = 1
+        self.assertEqual(len(compare(results, baseline, query_threshold=1)), 1)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username="staff", password="pw", is_staff=True)
+
+    def setUp(self):
+        registry.reset()
+
+    def test_repeated_sql_shapes_are_detected(self):
+        self.assertEqual(
+            sql_shape("SELECT 1 FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            "SELECT ? FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for program_id in range(3):
+                Course.objects.filter(program_id=program_id).exists()
+            User.objects.count()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(len(recorder.repeated_shapes(3)), 1)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse("admin_dashboard"))
+        self.client.logout()
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        body = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('whiteboard_request_duration_seconds_count{view="admin_dashboard"} 1', body)
+        self.assertIn('whiteboard_db_queries_bucket{view="admin_dashboard",le="+Inf"} 1', body)
+        self.assertNotIn('view="metrics"', body)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_only_record_wall_time(self):
+        self.client.get(reverse("login"))
+        self.assertEqual(registry.durations["login"].count, 1)
+        self.assertNotIn("login", registry.queries)
+
+    def test_streamed_body_queries_are_recorded(self):
+        self.client.force_login(self.staff)
+        Course.objects.create(course_name="Databases", program=Program.objects.create(program_name="Computing"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("data_export", args=["courses", "csv"]))
+            self.assertNotIn("data_export", registry.durations)
+            before_body = len(ctx.captured_queries)
+            self.assertIn(b"Databases", b"".join(response.streaming_content))
+        self.assertGreater(len(ctx.captured_queries), before_body)
+        self.assertEqual(registry.durations["data_export"].count, 1)
+        self.assertEqual(registry.queries["data_export"].sum, len(ctx.captured_queries))
+
+    def test_unnamed_views_are_labelled_by_their_class(self):
+        match = mock.Mock(view_name="", func=MetricsView.as_view())
+        self.assertEqual(view_label(match), "core.views.MetricsView")
+        self.assertEqual(view_label(None), "unresolved")
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_connections_are_tuned(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with tempfile.TemporaryDirectory() as directory:
+            other = type(connections["default"])(
+                {**connection.settings_dict, "NAME": os.path.join(directory, "profile.sqlite3")}, alias="profile",
+            )
+            try:
+                with other.cursor() as cursor:
+                    pragmas = {}
+                    for name in ("journal_mode", "synchronous", "busy_timeout"):
+                        cursor.execute(f"PRAGMA {name}")
+                        pragmas[name] = cursor.fetchone()[0]
+            finally:
+                other.close()
+        # synchronous=NORMAL reads back as 1
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 20000})
+
+
+class IndexUsageTests(TestCase):
+    """The hot queries behind the student and admin pages must be answered from an index.
+    Plans are SQLite's; without ANALYZE statistics it picks indexes on their shape alone."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed('tiny')
+        cls.student = Student.objects.exclude(program=None).select_related('user').first()
+
+    def assertIndexed(self, queryset, index=None):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            self.assertNotRegex(line, r"SCAN core_\w+$", plan)
+        if index:
+            self.assertIn(f"INDEX {index} ", plan)
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite query plans")
+        student, user = self.student, self.student.user
+        self.assertIndexed(
+            Enrollment.objects.filter(student=student).values_list("course_id", "day_of_week", "start_time", "end_time"),
+            "enrollment_schedule_idx",
+        )
+        self.assertIndexed(Enrollment.objects.filter(student=student, course_id=1))
+        self.assertIndexed(Enrollment.objects.for_student(student).for_student_page())
+        self.assertIndexed(Notification.objects.filter(user=user, read=False), "notification_unread_idx")
+        self.assertIndexed(
+            Notification.objects.filter(user=user).order_by("-created_at", "-id")[:10], "notification_user_created_idx",
+        )
+        self.assertIndexed(
+            Course.objects.with_program().filter(program=student.program, semester="Semester 1").order_by("id")[:20],
+            "course_program_semester_idx",
+        )
+        self.assertIndexed(
+            Course.objects.with_program().filter(semester="Semester 1").order_by("id")[:20], "course_semester_idx",
+        )
+        self.assertIndexed(Grade.objects.for_student(student).for_student_page())
+        self.assertIndexed(StudentRequest.objects.filter(id__gt=10).order_by("id")[:20])
+
+    def test_duplicate_enrollment_is_rejected(self):
+        enrollment = Enrollment.objects.filter(student=self.student).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Enrollment.objects.create(student=self.student, course=enrollment.course)
+
+
+# The stand-in replica declared by whiteboard.test_settings (SQLite only)
+REPLICA_TEST_ALIAS = "test_replica"
+
+
+@override_settings(REPLICA_DATABASE=REPLICA_TEST_ALIAS)
+class ReplicaRoutingTests(TestCase):
+    databases = {"default", REPLICA_TEST_ALIAS} if REPLICA_TEST_ALIAS in connections.settings else {"default"}
+
+    @classmethod
+    def setUpTestData(cls):
+        if REPLICA_TEST_ALIAS not in connections.settings:
+            return
+        program = Program.objects.create(program_name="Computing")
+        cls.user = User.objects.create_user(username="ann", password="pw")
+        student = Student.objects.create(
+            user=cls.user, phone="111-primary", date_of_birth=datetime.date(2000, 1, 1), address="x", program=program,
+        )
+        # "Replicate", then let the replica fall behind on the phone number
+        for obj in (program, cls.user, student):
+            obj.save(using=REPLICA_TEST_ALIAS, force_insert=True)
+        Student.objects.filter(id=student.id).update(phone="222-primary")
+
+    def setUp(self):
+        if REPLICA_TEST_ALIAS not in connections.settings:
+            self.skipTest("Needs SQLite")
+        self.client.force_login(self.user)
+        Session.objects.get(session_key=self.client.session.session_key).save(using=REPLICA_TEST_ALIAS)
+
+    def test_reads_go_to_replica_until_the_session_writes(self):
+        self.assertContains(self.client.get(reverse("profile")), "111-primary")
+        response = self.client.post(reverse("mark_all_notifications_read"))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertContains(self.client.get(reverse("profile")), "222-primary")
+        # Once the pin expires the replica serves reads again
+        del self.client.cookies[PIN_COOKIE]
+        self.assertContains(self.client.get(reverse("profile")), "111-primary")
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse("profile")).cookies)
+
+    def test_cache_fills_read_the_primary(self):
+        student = Student.objects.get(user=self.user)
+        course = Course.objects.create(
+            course_name="Added by an admin", program=student.program, day_of_week="Monday",
+            start_time=datetime.time(9), end_time=datetime.time(10),
+        )
+        # Written by someone else, so this browser is not pinned and its pages read the
+        # lagging replica; the caches they fill must still come from the primary
+        Enrollment.objects.create(student=student, course=course)
+        Notification.objects.create(user=self.user, message="Exam moved")
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.assertContains(self.client.get(reverse("timetable")), "Added by an admin")
+        self.client.get(reverse("student_dashboard"))
+        self.client.get(reverse("courses"))
+        self.assertEqual(unread_count(self.user), 1)
+        self.assertEqual(get_schedule_index(student).course_ids, {course.id})
+
+
+class EnrollmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.program = Program.objects.create(program_name="Computing")
+        cls.other = Program.objects.create(program_name="Maths")
+        cls.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=name), phone="0", date_of_birth=datetime.date(2000, 1, 1),
+                address="-", program=cls.other,
+            )
+            for name in ("ann", "bob")
+        ]
+
+    def course(self, name, day, start, end, program=None):
+        return Course.objects.create(
+            course_name=name, program=program or self.program, day_of_week=day,
+            start_time=datetime.time(*start), end_time=datetime.time(*end),
+        )
+
+    def test_requested_courses_conflicting_with_each_other(self):
+        first = self.course("First", "Monday", (9,), (10,))
+        clash = self.course("Clash", "Monday", (9, 30), (10, 30))
+        adjacent = self.course("Adjacent", "Monday", (10,), (11,))
+        result = enroll_in_courses(self.students[0], [first, clash, adjacent])
+        self.assertEqual(result.enrolled, [first, adjacent])
+        self.assertEqual(result.conflicts, [clash])
+        self.assertEqual(Enrollment.objects.filter(student=self.students[0]).count(), 2)
+
+    def test_already_enrolled_courses_are_skipped(self):
+        course = self.course("Algorithms", "Tuesday", (9,), (10,))
+        enroll_in_courses(self.students[0], [course])
+        result = enroll_in_courses(self.students[0], [course])
+        self.assertEqual((result.enrolled, result.already_enrolled), ([], [course]))
+        self.assertEqual(Enrollment.objects.filter(student=self.students[0]).count(), 1)
+
+    def test_enrollments_made_after_the_plan_are_reported_as_skipped(self):
+        algorithms = self.course("Algorithms", "Tuesday", (9,), (10,))
+        databases = self.course("Databases", "Wednesday", (9,), (10,))
+        real_plan = plan_enrollments
+
+        def plan_then_race(index, courses):
+            planned = real_plan(index, courses)
+            # Other requests enroll both students in Algorithms between the plan and the write
+            for student in self.students:
+                Enrollment.objects.get_or_create(student=student, course=algorithms)
+            return planned
+
+        with mock.patch("core.enrollment.plan_enrollments", side_effect=plan_then_race):
+            result = enroll_in_courses(self.students[0], [algorithms, databases])
+            self.assertEqual((result.enrolled, result.already_enrolled), ([databases], [algorithms]))
+            Enrollment.objects.filter(student=self.students[1]).delete()
+            results = enroll_cohort(self.students, [algorithms, databases])
+        self.assertEqual((results[self.students[0].id].enrolled, results[self.students[0].id].already_enrolled),
+                         ([], [algorithms, databases]))
+        self.assertEqual((results[self.students[1].id].enrolled, results[self.students[1].id].already_enrolled),
+                         ([databases], [algorithms]))
+        self.assertEqual(Enrollment.objects.filter(course=algorithms).count(), 2)
+
+    def test_enroll_cohort_command_with_students(self):
+        self.course("Algorithms", "Tuesday", (9,), (10,))
+        self.course("Databases", "Tuesday", (9, 30), (10, 30))
+        with self.assertRaises(CommandError):
+            call_command("enroll_cohort", "Computing", "--student", "ann", "--student", "nobody")
+        self.assertFalse(Student.objects.filter(program=self.program).exists())
+        call_command("enroll_cohort", "Computing", "--student", "ann", "--student", "bob", stdout=open(os.devnull, "w"))
+        for student in self.students:
+            student.refresh_from_db()
+            self.assertEqual(student.program, self.program)
+            self.assertEqual(
+                list(Enrollment.objects.filter(student=student).values_list("course__course_name", flat=True)),
+                ["Algorithms"],
+            )
+
+
+class ScheduleIndexTests(TestCase):
+    def t(self, hour, minute=0):
+        return datetime.time(hour, minute)
+
+    def test_conflicts(self):
+        index = ScheduleIndex([
+            ("Monday", self.t(8), self.t(12)),
+            ("Monday", self.t(9), self.t(10)),
+            ("Tuesday", self.t(13), self.t(14)),
+        ])
+        # Adjacent slots don't clash
+        self.assertFalse(index.conflicts("Tuesday", self.t(14), self.t(15)))
+        self.assertFalse(index.conflicts("Tuesday", self.t(12), self.t(13)))
+        # 10:30 starts after the 9-10 slot but inside the earlier, longer 8-12 one
+        self.assertTrue(index.conflicts("Monday", self.t(10, 30), self.t(11)))
+        self.assertFalse(index.conflicts("Monday", self.t(12), self.t(13)))
+        self.assertFalse(index.conflicts("Wednesday", self.t(9), self.t(10)))
+        self.assertFalse(index.conflicts("Monday", None, None))
+
+    def test_cached_index_is_invalidated_by_enrollment_changes(self):
+        program = Program.objects.create(program_name="Computing")
+        student = Student.objects.create(
+            user=User.objects.create_user(username="ann"), phone="0", date_of_birth=datetime.date(2000, 1, 1),
+            address="-", program=program,
+        )
+        course = Course.objects.create(
+            course_name="Algorithms", program=program, day_of_week="Monday",
+            start_time=self.t(9), end_time=self.t(10),
+        )
+        self.assertEqual(get_schedule_index(student).course_ids, set())
+        enrollment = Enrollment.objects.create(student=student, course=course)
+        index = get_schedule_index(student)
+        self.assertEqual(index.course_ids, {course.id})
+        self.assertTrue(index.conflicts("Monday", self.t(9, 30), self.t(11)))
+        enrollment.delete()
+        self.assertEqual(get_schedule_index(student).course_ids, set())
+
+
+class UsernameTests(TestCase):
+    def make_request(self, first, last, email):
+        return StudentRequest.objects.create(
+            first_name=first, last_name=last, email=email, phone="0",
+            date_of_birth=datetime.date(2000, 1, 1), address="-",
+        )
+
+    def test_same_name_requests_preview_distinct_usernames(self):
+        User.objects.create_user(username="johnd01")
+        self.make_request("Other", "Person", "o@example.com")
+        first = self.make_request("John", "Doe", "j1@example.com")
+        second = self.make_request("John", "Dunn", "j2@example.com")
+        # Preview the second page on its own: the earlier namesake still counts
+        data = preview_usernames([second])
+        self.assertEqual(data[0]["preview_username"], "johnd0102")
+        self.assertTrue(data[0]["collides_with_pending"])
+        data = preview_usernames([first, second])
+        self.assertEqual([d["preview_username"] for d in data], ["johnd0101", "johnd0102"])
+        self.assertEqual([d["collides_with_pending"] for d in data], [False, True])
+
+    def test_non_ascii_namesakes_share_the_queue(self):
+        first = self.make_request("Élodie", "Ångström", "e1@example.com")
+        second = self.make_request("ÉLODIE", "ÅBERG", "e2@example.com")
+        data = preview_usernames([second])
+        self.assertEqual(data[0]["preview_username"], "élodieå0101")
+        self.assertTrue(data[0]["collides_with_pending"])
+        self.assertEqual(first.username_base, "élodieå01")
+
+    def test_requests_gone_from_the_queue_preview_distinct_usernames(self):
+        page = [self.make_request("John", "Doe", "j1@example.com"), self.make_request("John", "Dunn", "j2@example.com")]
+        # Both approved or rejected by someone else after the page was read
+        StudentRequest.objects.all().delete()
+        data = preview_usernames(page)
+        self.assertEqual([d["preview_username"] for d in data], ["johnd01", "johnd0101"])
+
+    def test_suffix_widens_when_two_digits_are_used_up(self):
+        taken = {"amyb03"} | {f"amyb03{n:02d}" for n in range(1, 100)}
+        self.assertEqual(next_free_username("amyb03", taken), "amyb03001")
+        self.assertEqual(next_free_username("amyb03", taken - {"amyb0342"}), "amyb0342")
+        self.assertEqual(next_free_username("amyb04", taken), "amyb04")
+
+    def test_collision_between_allocation_and_insert_is_retried(self):
+        real_allocate = usernames.allocate_username
+        calls = []
+
+        def racing_allocate(base):
+            username = real_allocate(base)
+            if not calls:
+                # Another approval takes the name after we picked it
+                User.objects.create_user(username=username)
+            calls.append(username)
+            return username
+
+        with mock.patch.object(usernames, "allocate_username", racing_allocate):
+            user = create_user_with_unique_username("annb05", "ann@example.com", "pw")
+        self.assertEqual(calls, ["annb05", "annb0501"])
+        self.assertEqual(user.username, "annb0501")
+        self.assertEqual(User.objects.filter(username__startswith="annb05").count(), 2)
+
+
+class BulkApprovalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username="staff", password="pw", is_staff=True)
+
+    def setUp(self):
+        self.requests = [
+            StudentRequest.objects.create(
+                first_name=first, last_name=last, email=f"{first}{n}@example.com", phone="0",
+                date_of_birth=datetime.date(2000, 1, 1), address="-",
+            )
+            for n, (first, last) in enumerate([("John", "Doe"), ("John", "Dunn"), ("John", "Day"), ("Amy", "Bell")])
+        ]
+        self.client.force_login(self.staff)
+
+    def post(self, action, ids, **extra):
+        return self.client.post(
+            reverse("bulk_approve_reject_requests"), {"action": action, "request_ids": ids, **extra}, follow=True,
+        )
+
+    def test_approve_and_reject_outcomes(self):
+        john, john2, john3, amy = self.requests
+        response = self.post("approve", [john.id, john2.id, john3.id, 9999])
+        messages = [str(m) for m in response.context["messages"]]
+        self.assertIn("3 student request(s) approved.", messages)
+        self.assertIn("Request 9999: Request not found.", messages)
+        students = Student.objects.select_related("user").order_by("user__username")
+        self.assertEqual(
+            [(s.user.username, s.last_name, s.user.email) for s in students],
+            [("johnd01", "Doe", "John0@example.com"), ("johnd0101", "Dunn", "John1@example.com"),
+             ("johnd0102", "Day", "John2@example.com")],
+        )
+        for student in students:
+            self.assertEqual(
+                list(Notification.objects.filter(user=student.user).values_list("message", flat=True)),
+                [APPROVAL_MESSAGE.format(username=student.user.username)],
+            )
+            self.assertTrue(student.user.has_usable_password())
+        response = self.post("reject", [amy.id, john.id])
+        messages = [str(m) for m in response.context["messages"]]
+        self.assertIn("1 student request(s) rejected.", messages)
+        self.assertIn(f"Request {john.id}: Request not found.", messages)
+        self.assertFalse(StudentRequest.objects.exists())
+        self.assertEqual(Student.objects.count(), 3)
+
+    def test_web_approvals_are_capped(self):
+        with mock.patch.object(BulkApproveRejectView, "approval_limit", 3):
+            response = self.post("approve", [], all_pending="1")
+        self.assertIn("Approve at most 3", str(list(response.context["messages"])[0]))
+        self.assertEqual(StudentRequest.objects.count(), 4)
+
+    def test_approve_requests_command(self):
+        out = io.StringIO()
+        call_command("approve_requests", "--all", "--workers", "2", stdout=out)
+        self.assertIn("4 processed, 0 failed.", out.getvalue())
+        self.assertEqual(
+            sorted(User.objects.filter(is_staff=False).values_list("username", flat=True)),
+            ["amyb01", "johnd01", "johnd0101", "johnd0102"],
+        )
+        self.assertEqual(Notification.objects.count(), 4)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [Program.objects.create(program_name=f"P{n}").id for n in range(7)]
+
+    def page(self, query=""):
+        return keyset_paginate(Program.objects.all(), QueryDict(query), per_page=3)
+
+    def ids_of(self, page):
+        return [program.id for program in page]
+
+    def test_forward_and_backward_pages_are_contiguous(self):
+        forward, page = [], self.page("q=x")
+        self.assertFalse(page.has_previous)
+        while True:
+            forward.append(self.ids_of(page))
+            if not page.has_next:
+                break
+            # Other filters ride along with the cursor
+            self.assertIn("q=x", page.next_query)
+            page = self.page(page.next_query)
+        self.assertEqual(forward, [self.ids[0:3], self.ids[3:6], self.ids[6:]])
+        self.assertEqual(page.next_query, "")
+
+        backward = []
+        while page.has_previous:
+            page = self.page(page.previous_query)
+            backward.append(self.ids_of(page))
+            self.assertTrue(page.has_next)
+        self.assertEqual(backward, [self.ids[3:6], self.ids[0:3]])
+        self.assertEqual(page.previous_query, "")
+
+    def test_cursors_past_either_end(self):
+        page = self.page(f"after={self.ids[-1]}")
+        self.assertEqual((page.items, page.has_next, page.has_previous), ([], False, False))
+        page = self.page(f"before={self.ids[0]}")
+        self.assertEqual((page.items, page.has_next, page.has_previous), ([], False, False))
+        # A short backward page at the start doesn't claim anything before it
+        page = self.page(f"before={self.ids[2]}")
+        self.assertEqual((self.ids_of(page), page.has_previous), (self.ids[0:2], False))
+        self.assertEqual(self.ids_of(self.page("after=junk")), self.ids[0:3])
+
+
+class NotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="ann")
+        cls.other = User.objects.create_user(username="bob")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_follow_created_at_even_when_ids_disagree(self):
+        now = timezone.now()
+        notifications = [Notification.objects.create(user=self.user, message=str(n)) for n in range(7)]
+        # Backdate some rows so id order and time order disagree, with a tie on created_at
+        for n, minutes in [(6, 50), (2, 5), (4, 5), (0, 1)]:
+            Notification.objects.filter(id=notifications[n].id).update(created_at=now - timedelta(minutes=minutes))
+        expected = list(Notification.objects.filter(user=self.user).order_by("-created_at", "-id"))
+        seen, before = [], None
+        while True:
+            page, more = latest_notifications(self.user, before=before, limit=2)
+            seen.extend(page)
+            if not more:
+                break
+            before = page[-1].id
+        self.assertEqual([n.id for n in seen], [n.id for n in expected])
+
+    def test_unread_count_is_cached_and_invalidated(self):
+        notification = Notification.objects.create(user=self.user, message="a")
+        Notification.objects.create(user=self.user, message="b")
+        Notification.objects.create(user=self.other, message="c")
+        self.assertEqual(unread_count(self.user), 2)
+        # bulk_create sends no signal, so the cached count stands
+        Notification.objects.bulk_create([Notification(user=self.user, message="d")])
+        self.assertEqual(unread_count(self.user), 2)
+        self.assertFalse(mark_read(self.other, notification.id))
+        self.assertTrue(mark_read(self.user, notification.id))
+        self.assertEqual(unread_count(self.user), 2)
+        self.assertEqual(mark_all_read(self.user), 2)
+        self.assertEqual(unread_count(self.user), 0)
+        self.assertEqual(unread_count(self.other), 1)
+
+    def test_purge_read_notifications(self):
+        old = timezone.now() - timedelta(days=100)
+        keep = [
+            Notification.objects.create(user=self.user, message="recent read", read=True),
+            Notification.objects.create(user=self.user, message="old unread"),
+        ]
+        Notification.objects.filter(id=keep[1].id).update(created_at=old)
+        for n in range(5):
+            purged = Notification.objects.create(user=self.user, message=f"old read {n}", read=True)
+            Notification.objects.filter(id=purged.id).update(created_at=old)
+        self.assertEqual(purge_read_notifications(batch_size=2), 5)
+        self.assertEqual(set(Notification.objects.values_list("id", flat=True)), {n.id for n in keep})
+
+
+class BroadcastTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", password="pw", is_staff=True)
+        cls.program = Program.objects.create(program_name="Computing")
+        cls.courses = [
+            Course.objects.create(
+                course_name=name, program=cls.program, day_of_week="Monday",
+                start_time=datetime.time(9), end_time=datetime.time(10),
+            )
+            for name in ("Algorithms", "Databases")
+        ]
+        cls.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f"student{n}"), phone="0",
+                date_of_birth=datetime.date(2000, 1, 1), address="-", program=cls.program,
+            )
+            for n in range(5)
+        ]
+        for student in cls.students:
+            Enrollment.objects.create(student=student, course=cls.courses[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def broadcast(self, **kwargs):
+        return Broadcast.objects.create(message="Exam moved", course=self.courses[0], created_by=self.admin, **kwargs)
+
+    def received(self, broadcast):
+        return sorted(Notification.objects.filter(message=broadcast.message).values_list("user_id", flat=True))
+
+    def test_chunked_delivery_records_progress_per_chunk(self):
+        broadcast = self.broadcast()
+        sent_before_chunk = []
+
+        def bulk_create(objs, *args, **kwargs):
+            sent_before_chunk.append(Broadcast.objects.get(id=broadcast.id).sent)
+            return real_bulk_create(objs, *args, **kwargs)
+
+        real_bulk_create = Notification.objects.bulk_create
+        with mock.patch.object(Notification.objects, "bulk_create", side_effect=bulk_create):
+            self.assertTrue(deliver_broadcast(broadcast.id, chunk_size=2))
+        self.assertEqual(sent_before_chunk, [0, 2, 4])
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent, broadcast.total_recipients), ("done", 5, 5))
+        self.assertEqual(broadcast.last_recipient_id, Enrollment.objects.order_by("-id").first().id)
+        self.assertEqual(self.received(broadcast), sorted(s.user_id for s in self.students))
+        # Only a pending broadcast is claimed
+        self.assertFalse(deliver_broadcast(broadcast.id))
+
+    def test_duplicate_recipients_get_one_notification(self):
+        for student in self.students[:3]:
+            Enrollment.objects.create(student=student, course=self.courses[1])
+        broadcast = self.broadcast()
+        rows = Enrollment.objects.values_list("id", "student__user_id")
+        with mock.patch("core.broadcasts._recipient_rows", return_value=rows):
+            deliver_broadcast(broadcast.id, chunk_size=3)
+        self.assertEqual(self.received(broadcast), sorted(s.user_id for s in self.students))
+        self.assertEqual(Broadcast.objects.get(id=broadcast.id).sent, 5)
+
+    def test_deleted_target_fails_without_sending(self):
+        Student.objects.create(
+            user=User.objects.create_user(username="no_program"), phone="0",
+            date_of_birth=datetime.date(2000, 1, 1), address="-",
+        )
+        course = Course.objects.create(course_name="Cancelled", program=self.program)
+        Enrollment.objects.create(student=self.students[0], course=course)
+        broadcast = Broadcast.objects.create(message="Cancelled", course=course, created_by=self.admin)
+        course.delete()
+        self.assertTrue(deliver_broadcast(broadcast.id))
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent), ("failed", 0))
+        self.assertIn("deleted", broadcast.error)
+        self.assertEqual(self.received(broadcast), [])
+
+    def test_delivery_invalidates_cached_unread_counts(self):
+        user = self.students[0].user
+        self.assertEqual(unread_count(user), 0)
+        deliver_broadcast(self.broadcast().id)
+        self.assertEqual(unread_count(user), 1)
+
+    def test_stale_running_broadcast_resumes_after_last_chunk(self):
+        enrollments = list(Enrollment.objects.order_by("id"))
+        stale = self.broadcast(status="running", sent=2, last_recipient_id=enrollments[1].id)
+        Notification.objects.bulk_create(
+            [Notification(user_id=e.student.user_id, message=stale.message) for e in enrollments[:2]]
+        )
+        fresh = Broadcast.objects.create(message="Still sending", course=self.courses[0], status="running")
+        queued = Broadcast.objects.create(message="Just queued", course=self.courses[0])
+        old = timezone.now() - timedelta(hours=1)
+        Broadcast.objects.filter(id=stale.id).update(updated_at=old)
+        self.assertEqual(resume_stale_broadcasts(), [stale.id])
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.sent), ("done", 5))
+        self.assertEqual(self.received(stale), sorted(s.user_id for s in self.students))
+        # A delivery still making progress, or one just queued, is left to its own worker
+        self.assertEqual(Broadcast.objects.get(id=fresh.id).status, "running")
+        self.assertEqual(Broadcast.objects.get(id=queued.id).status, "pending")
+        Broadcast.objects.filter(id=queued.id).update(updated_at=old)
+        call_command("resume_broadcasts", stdout=io.StringIO())
+        self.assertEqual(Broadcast.objects.get(id=queued.id).status, "done")
+
+    def test_form_renders_only_the_chosen_course(self):
+        self.assertEqual(len(BroadcastForm().fields["course"].widget.choices), 1)
+        form = BroadcastForm(data={"course": str(self.courses[1].id), "message": "Hi"})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(
+            list(form.fields["course"].widget.choices)[1:], [(self.courses[1].id, "Databases")]
+        )
+        self.assertFalse(BroadcastForm(data={"message": "Hi"}).is_valid())
+
+    def test_course_search_pages_by_name_prefix(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("course_search"), {"q": "data"})
+        self.assertEqual(response.json(), {"results": [{"id": self.courses[1].id, "name": "Databases"}], "next": None})
+        self.client.force_login(self.students[0].user)
+        self.assertEqual(self.client.get(reverse("course_search")).status_code, 403)
+
+
+@override_settings(DOCUMENT_SENDFILE_BACKEND='')
+class DocumentDownloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", is_staff=True)
+        course = Course.objects.create(course_name="Databases", program=Program.objects.create(program_name="Computing"))
+        cls.document = CourseDocument.objects.create(
+            course=course, document="course_documents/week 1%.txt", original_name="week1.txt",
+        )
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        os.makedirs(os.path.join(media.name, "course_documents"))
+        with open(os.path.join(media.name, self.document.document.name), "wb") as f:
+            f.write(b"0123456789")
+        self.client.force_login(self.admin)
+        self.url = reverse("download_course_document", args=[self.document.id])
+
+    def body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=2-4", 10), (2, 4))
+        self.assertEqual(parse_range("bytes=-3", 10), (7, 9))
+        self.assertEqual(parse_range("bytes=8-", 10), (8, 9))
+        self.assertIsNone(parse_range("bytes=0-1,4-5", 10))
+        self.assertIs(parse_range("bytes=10-", 10), False)
+        self.assertIs(parse_range("bytes=-5", 0), False)
+        self.assertIs(parse_range("bytes=0-", 0), False)
+
+    def test_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        self.assertEqual(self.body(response), b"234")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual((response.status_code, self.body(response)), (206, b"789"))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_if_range_ignores_range_for_a_changed_file(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, self.body(response)), (206, b"01"))
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, self.body(response)), (200, b"0123456789"))
+
+    @override_settings(DOCUMENT_SENDFILE_BACKEND="nginx", DOCUMENT_ACCEL_REDIRECT_PREFIX="/protected/")
+    def test_accel_redirect_path_is_quoted(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/course_documents/week%201%25.txt")
+
+
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", is_staff=True)
+        cls.course = Course.objects.create(course_name="Databases", program=Program.objects.create(program_name="Computing"))
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(self.admin)
+
+    def start(self, size=10):
+        response = self.client.post(
+            reverse("start_chunked_upload", args=[self.course.id]), {"filename": "notes.txt", "size": size}
+        )
+        return UploadSession.objects.get(id=response.json()["upload_id"])
+
+    def put(self, session, start, data, total=10):
+        return self.client.put(
+            reverse("upload_chunk", args=[session.id]), data, content_type="application/octet-stream",
+            headers={"Content-Range": f"bytes {start}-{start + len(data) - 1}/{total}"},
+        )
+
+    def test_resume_from_reported_offset(self):
+        session = self.start()
+        self.assertEqual(self.put(session, 0, b"0123").json()["offset"], 4)
+        # A chunk cut off mid-request keeps the bytes that arrived
+        self.assertEqual(append_chunk(session, io.BytesIO(b"45"), 4, 4), 6)
+        offset = self.client.get(reverse("upload_chunk", args=[session.id])).json()["offset"]
+        self.assertEqual(offset, 6)
+        with mock.patch("core.views.queue_finish_upload") as queue_finish:
+            response = self.put(session, offset, b"6789")
+        self.assertEqual(response.json(), {"upload_id": str(session.id), "offset": 10, "size": 10, "complete": False})
+        queue_finish.assert_called_once_with(session.id)
+        document = finish_upload(session.id)
+        self.assertEqual(document.document.read(), b"0123456789")
+        self.assertTrue(self.client.get(reverse("upload_chunk", args=[session.id])).json()["complete"])
+        # Finishing again does not store a second document
+        self.assertEqual(finish_upload(session.id), document)
+        self.assertEqual(CourseDocument.objects.count(), 1)
+
+    def test_wrong_offset_is_rejected(self):
+        session = self.start()
+        self.put(session, 0, b"0123")
+        response = self.put(session, 2, b"2345")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 4)
+        self.assertEqual(self.put(session, 4, b"45678901").status_code, 409)
+        self.assertEqual(received_bytes(session), 4)
+
+    def test_chunk_for_a_session_already_writing_is_turned_away(self):
+        session = self.start()
+        with open(default_storage.path(f"{UPLOAD_DIR}/{session.id}.part"), "rb") as part:
+            fcntl.flock(part, fcntl.LOCK_EX)
+            response = self.put(session, 0, b"0123")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.put(session, 0, b"0123").json()["offset"], 4)
+
+    def test_identical_uploads_share_one_blob(self):
+        session = self.start()
+        with mock.patch("core.views.queue_finish_upload"):
+            self.put(session, 0, b"0123456789")
+        chunked = finish_upload(session.id)
+        direct = store_uploaded_file(self.course, SimpleUploadedFile("copy.txt", b"0123456789"))
+        self.assertEqual(DocumentBlob.objects.count(), 1)
+        self.assertEqual(chunked.blob_id, direct.blob_id)
+        self.assertEqual(direct.original_name, "copy.txt")
+        self.assertEqual(os.listdir(default_storage.path(UPLOAD_DIR)), [])
+
+    def test_purge_stale_uploads(self):
+        old = timezone.now() - timedelta(days=2)
+        abandoned, complete, fresh = self.start(), self.start(), self.start()
+        self.put(abandoned, 0, b"0123")
+        with mock.patch("core.views.queue_finish_upload"):
+            self.put(complete, 0, b"0123456789")
+        UploadSession.objects.filter(id__in=[abandoned.id, complete.id]).update(created_at=old)
+        stray = default_storage.path(f"{UPLOAD_DIR}/{uuid.uuid4()}.part")
+        open(stray, "wb").close()
+        os.utime(stray, (old.timestamp(), old.timestamp()))
+        self.assertEqual(purge_stale_uploads(), (1, 1, 1))
+        self.assertFalse(UploadSession.objects.filter(id=abandoned.id).exists())
+        self.assertIsNotNone(UploadSession.objects.get(id=complete.id).document_id)
+        self.assertEqual(os.listdir(default_storage.path(UPLOAD_DIR)), [f"{fresh.id}.part"])
+
+
+class ChunkInFlightTests(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        course = Course.objects.create(course_name="Databases", program=Program.objects.create(program_name="Computing"))
+        self.session = start_upload(course, "notes.txt", 10)
+
+    def test_other_connections_can_write_while_a_chunk_streams(self):
+        errors = []
+
+        def write_from_another_connection():
+            try:
+                User.objects.create_user(username="concurrent")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        class SlowBody(io.BytesIO):
+            def read(self, size=-1):
+                # A login or enrollment arriving while the client is still sending the chunk
+                writer = threading.Thread(target=write_from_another_connection)
+                writer.start()
+                writer.join()
+                return super().read(size)
+
+        self.assertEqual(append_chunk(self.session, SlowBody(b"0123"), 0, 4), 4)
+        self.assertEqual(errors, [])
+        self.assertTrue(User.objects.filter(username="concurrent").exists())
+
+
+class DocumentProcessingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        program = Program.objects.create(program_name="Computing")
+        cls.courses = [Course.objects.create(course_name=name, program=program) for name in ("Databases", "Networks")]
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def upload(self, course, name="notes.txt", content=b"B-tree indexes"):
+        return store_uploaded_file(course, SimpleUploadedFile(name, content))
+
+    def test_processing_records_metadata(self):
+        document = self.upload(self.courses[0])
+        self.assertEqual(document.processing_status, "pending")
+        process_document(document.id)
+        document.refresh_from_db()
+        self.assertEqual(document.processing_status, "done")
+        self.assertEqual((document.size, document.mime_type), (14, "text/plain"))
+        self.assertEqual((document.checksum, document.text), (document.blob.sha256, "B-tree indexes"))
+        self.assertIsNotNone(document.processed_at)
+
+    def test_failure_marks_document_failed(self):
+        document = self.upload(self.courses[0])
+        with mock.patch("core.processing.extract_text", side_effect=ValueError("bad file")):
+            with self.assertRaises(ValueError):
+                process_document(document.id)
+        document.refresh_from_db()
+        self.assertEqual(document.processing_status, "failed")
+        self.assertIsNotNone(document.processed_at)
+
+    def test_shared_blob_copies_processed_metadata(self):
+        first = self.upload(self.courses[0])
+        process_document(first.id)
+        second = self.upload(self.courses[1], name="copy.txt")
+        self.assertEqual(second.blob_id, first.blob_id)
+        with mock.patch("core.processing.extract_text") as extract_text:
+            process_document(second.id)
+        extract_text.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual(second.processing_status, "done")
+        self.assertEqual((second.size, second.checksum, second.text), (14, first.blob.sha256, "B-tree indexes"))
+        # The copied text is indexed for the second document too
+        self.assertEqual({entry.object_id for entry in search.search("indexes")}, {first.id, second.id})
+
+
+class DashboardStatsInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.program = Program.objects.create(program_name="Computing")
+        self.other_program = Program.objects.create(program_name="Design")
+
+    @contextmanager
+    def assertStatsChange(self):
+        # The cached stats must be dropped, not served stale for DASHBOARD_STATS_TIMEOUT
+        before = get_dashboard_stats()
+        yield
+        after = get_dashboard_stats()
+        self.assertNotEqual(after, before)
+        self.assertEqual(after, compute_dashboard_stats())
+
+    def make_student(self, username, program=None):
+        return Student.objects.create(
+            user=User.objects.create_user(username=username), phone="0",
+            date_of_birth=datetime.date(2000, 1, 1), address="-", program=program,
+        )
+
+    def make_request(self, email):
+        return StudentRequest.objects.create(
+            first_name="Jo", last_name="Doe", email=email, phone="0",
+            date_of_birth=datetime.date(2000, 1, 1), address="-",
+        )
+
+    def test_saves_and_deletes(self):
+        with self.assertStatsChange():
+            student = self.make_student("ann")
+        with self.assertStatsChange():
+            student.program = self.program
+            student.save()
+        with self.assertStatsChange():
+            student.delete()
+
+        with self.assertStatsChange():
+            course = Course.objects.create(course_name="Databases", program=self.program)
+        with self.assertStatsChange():
+            course.program = self.other_program
+            course.save()
+        with self.assertStatsChange():
+            course.delete()
+
+        with self.assertStatsChange():
+            program = Program.objects.create(program_name="Physics")
+        with self.assertStatsChange():
+            program.program_name = "Applied Physics"
+            program.save()
+        with self.assertStatsChange():
+            program.delete()
+
+        with self.assertStatsChange():
+            student_request = self.make_request("jo@example.com")
+        with self.assertStatsChange():
+            student_request.delete()
+
+    def test_bulk_writes(self):
+        student = self.make_student("ann", self.program)
+        cohort = [self.make_student("bob", self.program)]
+        course = Course.objects.create(course_name="Databases", program=self.program)
+        approved, rejected = self.make_request("jo@example.com"), self.make_request("jo2@example.com")
+        with self.assertStatsChange():
+            enroll_in_courses(student, [course])
+        with self.assertStatsChange():
+            enroll_cohort(cohort, [course])
+        with self.assertStatsChange():
+            upsert_grades({(student.id, course.id): "A"})
+        with self.assertStatsChange():
+            approve_requests([approved.id])
+        with self.assertStatsChange():
+            reject_requests([rejected.id])
+
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write("username,email,phone,date_of_birth,program\ncat,cat@example.com,1,2000-01-01,Design\n")
+        self.addCleanup(os.remove, path)
+        with self.assertStatsChange():
+            run_roster_import(create_roster_import("students", path))
@@ -0,0 +1,86 @@
+import hashlib
+import uuid
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import DAYS_OF_WEEK, Enrollment
+from .replicas import primary_reads
+
+TIMETABLE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+@dataclass
+class Slot:
+    course_id: int
+    course_name: str
+    start_time: object
+    end_time: object
+
+
+@dataclass
+class Timetable:
+    """A student's week: one (day, slots) pair per day of DAYS_OF_WEEK, slots sorted by start time."""
+    version: str
+    days: list = field(default_factory=list)
+
+    def __bool__(self):
+        return any(slots for _, slots in self.days)
+
+
+def build_timetable(student, version=''):
+    by_day = {day: [] for day, _ in DAYS_OF_WEEK}
+    for enrollment in Enrollment.objects.for_student(student).for_timetable():
+        by_day.setdefault(enrollment.day_of_week, []).append(Slot(
+            enrollment.course.id, enrollment.course.course_name, enrollment.start_time, enrollment.end_time,
+        ))
+    for slots in by_day.values():
+        # Slots without a time go to the bottom of their day
+        slots.sort(key=lambda slot: (slot.start_time is None, slot.start_time or 0, slot.course_name))
+    return Timetable(version, list(by_day.items()))
+
+
+def _version_key(student_id):
+    return f'timetable-version:{student_id}'
+
+
+def _timetable_key(student_id, version):
+    return f'timetable:{student_id}:{version}'
+
+
+def timetable_version(student_id):
+    """Opaque token that changes whenever the student's enrollments do.
+
+    Versions are random rather than counters so an evicted version key can never
+    bring back a token a client already holds for an older timetable."""
+    version = cache.get(_version_key(student_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(student_id), version, TIMETABLE_CACHE_TIMEOUT):
+            version = cache.get(_version_key(student_id), version)
+    return version
+
+
+def timetable_etag(version, session_key=''):
+    # The page embeds a CSRF token, which login rotates along with the session key
+    digest = hashlib.sha256(f'{version}:{session_key}'.encode()).hexdigest()[:32]
+    return f'"timetable-{digest}"'
+
+
+def get_timetable(student, version=None):
+    version = version or timetable_version(student.id)
+    key = _timetable_key(student.id, version)
+    timetable = cache.get(key)
+    if timetable is None:
+        with primary_reads():
+            timetable = build_timetable(student, version)
+        cache.set(key, timetable, TIMETABLE_CACHE_TIMEOUT)
+    return timetable
+
+
+def invalidate_timetable(*student_ids):
+    # Dropping the version retires every artefact cached under it; they simply expire
+    keys = [_version_key(student_id) for student_id in student_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
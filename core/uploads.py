@@ -0,0 +1,219 @@
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import CourseDocument, DocumentBlob, UploadSession
+from .processing import queue_document_processing
+
+UPLOAD_DIR = 'uploads'
+BLOB_DIR = 'blobs'
+READ_BLOCK_SIZE = 64 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+# Unfinished uploads (and stray part files) older than this are discarded by purge_uploads
+STALE_UPLOAD_HOURS = 24
+
+logger = logging.getLogger(__name__)
+
+# Hashing and storing a completed upload runs here, not in the last chunk's request
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='uploads')
+
+
+class UploadError(Exception):
+    pass
+
+
+def _part_path(name):
+    path = default_storage.path(f'{UPLOAD_DIR}/{name}.part')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_blob_document(course, temp_path, sha256, size, filename):
+    """Turn an assembled temp file into a CourseDocument, reusing the blob when the same
+    content was uploaded before. The temp file is consumed either way."""
+    blob = DocumentBlob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        name = f'{BLOB_DIR}/{sha256[:2]}/{sha256}'
+        destination = default_storage.path(name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(temp_path, destination)
+        try:
+            with transaction.atomic():
+                blob = DocumentBlob.objects.create(sha256=sha256, file=name, size=size)
+        except IntegrityError:
+            # A concurrent upload of the same content won; the file we moved is identical
+            blob = DocumentBlob.objects.get(sha256=sha256)
+    else:
+        os.remove(temp_path)
+    document = CourseDocument.objects.create(
+        course=course, blob=blob, document=blob.file.name, original_name=filename
+    )
+    queue_document_processing(document.id)
+    return document
+
+
+def store_uploaded_file(course, uploaded_file):
+    """Store a multipart upload, hashing it while it is copied chunk by chunk."""
+    temp_path = _part_path(uuid.uuid4())
+    digest = hashlib.sha256()
+    size = 0
+    with open(temp_path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return store_blob_document(course, temp_path, digest.hexdigest(), size, uploaded_file.name)
+
+
+def start_upload(course, filename, total_size, user=None):
+    session = UploadSession.objects.create(
+        course=course, created_by=user, filename=os.path.basename(filename), total_size=total_size
+    )
+    open(_part_path(session.id), 'wb').close()
+    return session
+
+
+def received_bytes(session):
+    # The part file is the source of truth, so a chunk cut off mid-request resumes cleanly
+    try:
+        return os.path.getsize(_part_path(session.id))
+    except FileNotFoundError:
+        return session.total_size if session.document_id else 0
+
+
+def parse_content_range(header):
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError("A 'Content-Range: bytes start-end/total' header is required.")
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise UploadError("Invalid Content-Range.")
+    return start, end - start + 1, total
+
+
+def _open_part(session_id):
+    # No O_CREAT: once finish_upload has moved the part file away, writers must not recreate it
+    try:
+        return open(_part_path(session_id), 'r+b')
+    except FileNotFoundError:
+        raise UploadError("This upload is no longer accepting chunks.")
+
+
+def append_chunk(session, stream, start, length):
+    """Append `length` bytes read from stream at `start`, which must be the current
+    offset. Reads in small blocks so a chunk is never held in memory. Returns the new offset.
+
+    Writers are serialised by an exclusive lock on the part file, not by a database
+    transaction, so a slow client holds no database lock while its body streams in. The
+    offset is checked once the lock is held; a second request for the same session while
+    a chunk is being written is turned away rather than queued."""
+    if session.document_id:
+        raise UploadError("Upload already completed.")
+    with _open_part(session.id) as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError("Another chunk of this upload is still being written.")
+        if UploadSession.objects.filter(id=session.id).exclude(document=None).exists():
+            raise UploadError("Upload already completed.")
+        offset = f.seek(0, os.SEEK_END)
+        if start != offset:
+            raise UploadError(f"Expected a chunk starting at byte {offset}.")
+        if start + length > session.total_size:
+            raise UploadError("Chunk extends past the declared file size.")
+        remaining = length
+        while remaining:
+            data = stream.read(min(READ_BLOCK_SIZE, remaining))
+            if not data:
+                break
+            f.write(data)
+            remaining -= len(data)
+    return offset + length - remaining
+
+
+def finish_upload(session_id):
+    """Hash the assembled part file and store it as a CourseDocument, once: a session
+    that is already finished, or whose part file is incomplete, is left alone.
+
+    Holds the part file's lock, not a database transaction, while hashing and moving it."""
+    session = UploadSession.objects.select_related('course').get(id=session_id)
+    if session.document_id:
+        return session.document
+    try:
+        f = _open_part(session.id)
+    except UploadError:
+        return None
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        session.refresh_from_db(fields=['document'])
+        if session.document_id or os.fstat(f.fileno()).st_size != session.total_size:
+            return session.document
+        temp_path = _part_path(session.id)
+        session.document = store_blob_document(
+            session.course, temp_path, _hash_file(temp_path), session.total_size, session.filename
+        )
+        session.save(update_fields=['document'])
+    return session.document
+
+
+def queue_finish_upload(session_id):
+    transaction.on_commit(lambda: _executor.submit(_finish_in_background, session_id))
+
+
+def _finish_in_background(session_id):
+    close_old_connections()
+    try:
+        finish_upload(session_id)
+    except Exception:
+        logger.exception("Finishing upload %s failed", session_id)
+    finally:
+        connection.close()
+
+
+def purge_stale_uploads(hours=STALE_UPLOAD_HOURS):
+    """Finish uploads whose last chunk arrived but whose background finish was lost,
+    then delete unfinished sessions older than `hours` with their part files, and part
+    files no session owns (multipart uploads cut off mid-copy). Returns
+    (finished, deleted sessions, deleted part files)."""
+    cutoff = timezone.now() - timedelta(hours=hours)
+    finished = 0
+    for session in UploadSession.objects.filter(document=None, created_at__lt=cutoff).iterator():
+        if received_bytes(session) == session.total_size and finish_upload(session.id) is not None:
+            finished += 1
+    stale = UploadSession.objects.filter(document=None, created_at__lt=cutoff)
+    for session_id in stale.values_list('id', flat=True).iterator():
+        try:
+            os.remove(_part_path(session_id))
+        except FileNotFoundError:
+            pass
+    deleted, _ = stale.delete()
+
+    live = {str(session_id) for session_id in UploadSession.objects.filter(document=None).values_list('id', flat=True)}
+    removed = 0
+    directory = default_storage.path(UPLOAD_DIR)
+    if os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            name, ext = os.path.splitext(entry.name)
+            if ext == '.part' and name not in live and entry.stat().st_mtime < time.time() - hours * 3600:
+                os.remove(entry.path)
+                removed += 1
+    return finished, deleted, removed
@@ -11,21 +11,44 @@ urlpatterns = [
     path('admin-dashboard/', views.AdminDashboardView.as_view(), name='admin_dashboard'),
     path('student-requests/', views.StudentRequestListView.as_view(), name='student_request_list'),
     path('approve-reject/<int:request_id>/', views.ApproveRejectRequestView.as_view(), name='approve_reject_request'),
+    path('approve-reject/bulk/', views.BulkApproveRejectView.as_view(), name='bulk_approve_reject_requests'),
     path('add-student/', views.AddStudentView.as_view(), name='add_student'),
+    path('roster-imports/', views.RosterImportView.as_view(), name='roster_import'),
+    path('roster-imports/<int:import_id>/resume/', views.ResumeRosterImportView.as_view(), name='resume_roster_import'),
     path('create-course/', views.CreateCourseView.as_view(), name='create_course'),
     path('create-program/', views.CreateProgramView.as_view(), name='create_program'),
     path('admin-course-list/', views.AdminCourseListView.as_view(), name='admin_course_list'),
     path('update-grades/', views.UpdateGradesView.as_view(), name='update_grades'),
+    path('reports/grades/', views.GradeReportView.as_view(), name='grade_report'),
+    path('reports/grades/students/', views.StudentGpaReportView.as_view(), name='student_gpa_report'),
+    path('reports/grades/<str:scope>.csv', views.GradeReportExportView.as_view(), name='grade_report_export'),
+    path('exports/<str:kind>.<str:export_format>', views.DataExportView.as_view(), name='data_export'),
+    path('update-grades/import/', views.ImportGradesView.as_view(), name='import_grades'),
+    path('update-grades/course/<int:course_id>/', views.CourseGradeSheetView.as_view(), name='course_grade_sheet'),
     path('reset-student-password/', views.ResetStudentPasswordView.as_view(), name='reset_student_password'),
+    path('student-search/', views.StudentSearchView.as_view(), name='student_search'),
+    path('course-search/', views.CourseSearchView.as_view(), name='course_search'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('search/autocomplete/', views.SearchAutocompleteView.as_view(), name='search_autocomplete'),
+    path('broadcast/', views.BroadcastView.as_view(), name='broadcast'),
+    path('broadcast/<int:broadcast_id>/status/', views.BroadcastStatusView.as_view(), name='broadcast_status'),
     path('courses/', views.StudentCoursesView.as_view(), name='courses'),
     path('enroll/<int:course_id>/', views.EnrollCourseView.as_view(), name='enroll_course'),
     path('timetable/', views.TimetableView.as_view(), name='timetable'),
+    path('timetable/calendar-link/', views.CalendarFeedTokenView.as_view(), name='calendar_feed_token'),
+    path('timetable/feed/<str:token>.ics', views.TimetableFeedView.as_view(), name='timetable_feed'),
     path('grades/', views.GradesView.as_view(), name='grades'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     path('profile/', views.ProfileView.as_view(), name='profile'),
     path('mark-notification-read/<int:notification_id>/', views.MarkNotificationReadView.as_view(), name='mark_notification_read'),
+    path('mark-all-notifications-read/', views.MarkAllNotificationsReadView.as_view(), name='mark_all_notifications_read'),
     path('course-list/', views.CourseListView.as_view(), name='course_list'),
     path('upload-document/<int:course_id>/', views.UploadDocumentView.as_view(), name='upload_document'),
+    path('upload-document/<int:course_id>/chunked/', views.StartChunkedUploadView.as_view(), name='start_chunked_upload'),
+    path('uploads/<uuid:upload_id>/', views.UploadChunkView.as_view(), name='upload_chunk'),
     path('view-course-documents/<int:course_id>/', views.ViewCourseDocumentsView.as_view(), name='view_course_documents'),
+    path('documents/<int:document_id>/download/', views.DownloadCourseDocumentView.as_view(), name='download_course_document'),
+    path('documents/<int:document_id>/thumbnail/', views.CourseDocumentThumbnailView.as_view(), name='course_document_thumbnail'),
     path('register-program/', views.RegisterProgramView.as_view(), name='register_program'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,119 @@
+import operator
+from collections import defaultdict
+from functools import reduce
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import StudentRequest
+
+PREFIX_QUERY_CHUNK = 200
+
+
+def base_username(first_name, last_name, date_of_birth):
+    """firstname + first letter of lastname + two-digit birth month, e.g. "johnd01"."""
+    first = first_name.lower().replace(" ", "")
+    last_initial = last_name[0].lower() if last_name else ""
+    return f"{first}{last_initial}{date_of_birth.month:02d}"
+
+
+def base_username_for(student_request):
+    return base_username(student_request.first_name, student_request.last_name, student_request.date_of_birth)
+
+
+def next_free_username(base, taken):
+    """Return base if free, else base + the smallest free numeric suffix.
+
+    Suffixes start two digits wide (johnd0101 .. johnd0199) and widen by one digit
+    whenever the current width is exhausted.
+    """
+    if base not in taken:
+        return base
+    used = {name[len(base):] for name in taken if name.startswith(base) and name[len(base):].isdigit()}
+    width = 2
+    while True:
+        for number in range(1, 10 ** width):
+            suffix = f"{number:0{width}d}"
+            if suffix not in used:
+                return f"{base}{suffix}"
+        width += 1
+
+
+def taken_usernames(bases):
+    """Every existing username that starts with one of bases, in a few OR-ed prefix queries."""
+    bases = sorted(set(bases))
+    taken = set()
+    for offset in range(0, len(bases), PREFIX_QUERY_CHUNK):
+        chunk = bases[offset:offset + PREFIX_QUERY_CHUNK]
+        condition = reduce(operator.or_, (Q(username__startswith=base) for base in chunk))
+        taken.update(User.objects.filter(condition).values_list('username', flat=True))
+    return taken
+
+
+def allocate_username(base):
+    """Pick a free username for base with a single query over every base% username."""
+    taken = set(User.objects.filter(username__startswith=base).values_list('username', flat=True))
+    return next_free_username(base, taken)
+
+
+def create_user_with_unique_username(base, email, password, attempts=5):
+    """Create a user under the next free username for base.
+
+    A concurrent approval can claim the same name between allocation and insert; the
+    unique constraint on username then raises IntegrityError and we allocate again.
+    """
+    for attempt in range(attempts):
+        username = allocate_username(base)
+        try:
+            with transaction.atomic():
+                return User.objects.create_user(username=username, email=email, password=password)
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+
+
+def _earlier_requests_sharing(page_requests, bases):
+    """(id, base) of pending requests up to the page's last one whose base is among bases.
+
+    Only requests whose stored username_base matches are fetched, so the work grows
+    with the page and its namesakes rather than with the whole queue."""
+    return StudentRequest.objects.filter(
+        username_base__in=bases, id__lte=max(req.id for req in page_requests),
+    ).order_by('id').values_list('id', 'username_base')
+
+
+def preview_usernames(page_requests):
+    """Preview the username each request on a page would be approved under.
+
+    Approval goes in request id order, so a request gets the next free name for its base
+    after existing users and every earlier pending request with the same base.
+    """
+    page_requests = list(page_requests)
+    if not page_requests:
+        return []
+    page_bases = {req.id: base_username_for(req) for req in page_requests}
+    queue = defaultdict(list)
+    for request_id, base in _earlier_requests_sharing(page_requests, set(page_bases.values())):
+        queue[base].append(request_id)
+    taken = taken_usernames(page_bases.values())
+    previews = {}
+    for base, request_ids in queue.items():
+        for request_id in request_ids:
+            previews[request_id] = next_free_username(base, taken)
+            taken.add(previews[request_id])
+    request_data = []
+    for req in page_requests:
+        base = page_bases[req.id]
+        username = previews.get(req.id)
+        if username is None:
+            # No longer pending, e.g. approved meanwhile: preview it after the others
+            username = next_free_username(base, taken)
+            taken.add(username)
+        request_data.append({
+            'request': req,
+            'preview_username': username,
+            'is_duplicate': username != base,
+            'collides_with_pending': bool(queue[base]) and queue[base][0] != req.id,
+        })
+    return request_data
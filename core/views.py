@@ -3,15 +3,41 @@ import random
 import string
 from datetime import datetime
 from .forms import StudentRequestForm
-from django.db.models import Count
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 from django.views import View
-from .models import StudentRequest, Student, Notification, Course, Program, Enrollment, Grade, CourseDocument
-from .forms import StudentRequestForm, CourseForm, GradeForm, EnrollmentForm
+from .models import SEMESTER_CHOICES, StudentRequest, Student, Notification, Course, Program, Enrollment, Grade, CourseDocument, Broadcast, UploadSession, CourseGradeSummary, ProgramGradeSummary, StudentGradeSummary, RosterImport
+from .forms import StudentRequestForm, CourseForm, GradeForm, GradeImportForm, EnrollmentForm, CourseFilterForm, BroadcastForm, RosterImportForm
+from .analytics import EXPORT_SCOPES, export_rows, grade_distributions
+from .approvals import APPROVAL_MESSAGE, approve_requests, reject_requests
+from .broadcasts import start_broadcast
+from .downloads import can_access_document, serve_document
+from .enrollment import enroll_in_courses, register_program
+from .exports import EXPORT_FORMATS, EXPORTS, stream_csv, stream_export
+from .grades import GradeImportError, import_grades, normalize_grade, upsert_grades
+from .metrics import render_metrics
+from .ical import get_calendar, reset_calendar_token, student_for_token
+from .notifications import latest_notifications, mark_all_read, mark_read, unread_count
+from .pagination import keyset_paginate
+from .replicas import replica_reads
+from .rosters import claim_roster_import, queue_roster_import, stale_cutoff, store_roster_upload
+from . import search
+from .schedule import get_schedule_index
+from .stats import get_dashboard_stats
+from .timetable import get_timetable, timetable_etag, timetable_version
+from .uploads import UploadError, append_chunk, parse_content_range, queue_finish_upload, received_bytes, start_upload, store_uploaded_file
+from .usernames import base_username_for, create_user_with_unique_username, preview_usernames
+from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 
 
@@ -91,23 +117,12 @@ class RegisterProgramView(LoginRequiredMixin, View):
             return redirect('student_dashboard')
         program_id = request.POST.get('program')
         program = get_object_or_404(Program, id=program_id)
-        student.program = program
-        student.save()
-        # Automatically enroll in all courses in the program
-        courses = Course.objects.filter(program=program)
-        for course in courses:
-            # Check for scheduling conflicts before enrolling
-            existing_enrollments = Enrollment.objects.filter(
-                student=student,
-                day_of_week=course.day_of_week,
-                start_time__lt=course.end_time,
-                end_time__gt=course.start_time
-            )
-            if not existing_enrollments.exists():
-                Enrollment.objects.create(student=student, course=course)
+        # Register and enroll in all conflict-free courses of the program in one transaction
+        register_program(student, program)
         messages.success(request, f"You have been registered for {program.program_name} and enrolled in its courses.")
         return redirect('student_dashboard')
 
+@method_decorator(replica_reads, name='dispatch')
 class StudentDashboardView(LoginRequiredMixin, View):
     login_url = 'login'
 
@@ -124,11 +139,17 @@ class StudentDashboardView(LoginRequiredMixin, View):
         if not student.program:
             return redirect('register_program')
         
-        notifications = Notification.objects.filter(user=request.user)
-        enrollments = Enrollment.objects.filter(student=student)
+        # Newest notifications only; older ones are paged with ?notifications_before=<id>
+        before = request.GET.get('notifications_before')
+        notifications, more_notifications = latest_notifications(
+            request.user, before=int(before) if before and before.isdigit() else None
+        )
+        enrollments = Enrollment.objects.for_student(student).for_student_page()
         return render(request, 'core/student_dashboard.html', {
             'student': student,
             'notifications': notifications,
+            'more_notifications': more_notifications,
+            'unread_notifications': unread_count(request.user),
             'enrollments': enrollments
         })
     
@@ -138,18 +159,12 @@ class AdminDashboardView(LoginRequiredMixin, View):
     def get(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
-        # Fetch programs and annotate with student count
-        programs = Program.objects.all().annotate(student_count=Count('student'))
-        total_students = Student.objects.count()
-        total_courses = Course.objects.count()
-        total_programs = Program.objects.count()
-        total_student_requests = StudentRequest.objects.count()
+        # Per-program breakdown and totals from the cached snapshot
+        stats = get_dashboard_stats()
         return render(request, 'core/admin_dashboard.html', {
-            'programs': programs,
-            'total_students': total_students,
-            'total_courses': total_courses,
-            'total_programs': total_programs,
-            'total_student_requests': total_student_requests
+            **stats,
+            'export_kinds': list(EXPORTS),
+            'semester_choices': SEMESTER_CHOICES,
         })
 class StudentRequestListView(LoginRequiredMixin, View):
     login_url = 'login'
@@ -157,24 +172,13 @@ class StudentRequestListView(LoginRequiredMixin, View):
     def get(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
-        requests = StudentRequest.objects.all()
-        # Create a list of dictionaries with request data and previewed username
-        request_data = []
-        for req in requests:
-            # Generate base username: firstname + first letter of lastname + month of birth
-            first_name = req.first_name.lower().replace(" ", "")  # e.g., "Venky" → "venky"
-            last_name_initial = req.last_name[0].lower() if req.last_name else ""  # e.g., "Verma" → "v"
-            birth_month = req.date_of_birth.month  # e.g., May → 5
-            birth_month_str = f"{birth_month:02d}"  # e.g., 5 → "05"
-            base_username = f"{first_name}{last_name_initial}{birth_month_str}"  # e.g., "venkyv05"
-            # Check if the base username already exists
-            is_duplicate = User.objects.filter(username=base_username).exists()
-            request_data.append({
-                'request': req,
-                'preview_username': base_username,
-                'is_duplicate': is_duplicate
-            })
-        return render(request, 'core/student_request_list.html', {'request_data': request_data})
+        page = keyset_paginate(StudentRequest.objects.all(), request.GET)
+        # Previewed usernames for the page, checked against existing users in one query
+        request_data = preview_usernames(page.items)
+        return render(request, 'core/student_request_list.html', {
+            'request_data': request_data,
+            'page': page
+        })
 class ApproveRejectRequestView(LoginRequiredMixin, View):
     login_url = 'login'
 
@@ -184,41 +188,71 @@ class ApproveRejectRequestView(LoginRequiredMixin, View):
         student_request = get_object_or_404(StudentRequest, id=request_id)
         action = request.POST.get('action')
         if action == 'approve':
-            # Generate base username: firstname + first letter of lastname + month of birth
-            first_name = student_request.first_name.lower().replace(" ", "")  # e.g., "John" → "john"
-            last_name_initial = student_request.last_name[0].lower() if student_request.last_name else ""  # e.g., "Doe" → "d"
-            birth_month = student_request.date_of_birth.month  # e.g., January → 1
-            birth_month_str = f"{birth_month:02d}"  # e.g., 1 → "01"
-            username = f"{first_name}{last_name_initial}{birth_month_str}"  # e.g., "johnd01"
-
-            # Check if username already exists, append a random two-digit number if necessary
-            base_username = username
-            while User.objects.filter(username=username).exists():
-                random_suffix = random.randint(0, 99)  # Generate a random number between 00 and 99
-                random_suffix_str = f"{random_suffix:02d}"  # Ensure it's two digits (e.g., 5 → "05")
-                username = f"{base_username}{random_suffix_str}"  # e.g., "johnd0105"
-
             password = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-            user = User.objects.create_user(
-                username=username,
-                email=student_request.email,
-                password=password
-            )
-            Student.objects.create(
-                user=user,
-                first_name=student_request.first_name,
-                last_name=student_request.last_name,
-                phone=student_request.phone,
-                date_of_birth=student_request.date_of_birth,
-                address=student_request.address
-            )
-            Notification.objects.create(
-                user=user,
-                message=f"Your student account has been approved. Username: {user.username}. Please contact the admin to obtain your password."
-            )
+            with transaction.atomic():
+                # Next free "johnd01", "johnd0101", ... picked in one query; retried if a concurrent approval wins
+                user = create_user_with_unique_username(
+                    base_username_for(student_request),
+                    email=student_request.email,
+                    password=password
+                )
+                Student.objects.create(
+                    user=user,
+                    first_name=student_request.first_name,
+                    last_name=student_request.last_name,
+                    phone=student_request.phone,
+                    date_of_birth=student_request.date_of_birth,
+                    address=student_request.address
+                )
+                Notification.objects.create(
+                    user=user,
+                    message=APPROVAL_MESSAGE.format(username=user.username)
+                )
             messages.success(request, "Student request approved and account created.")
         student_request.delete()
         return redirect('student_request_list')
+
+class BulkApproveRejectView(LoginRequiredMixin, View):
+    login_url = 'login'
+    # Passwords are hashed in the request; larger approvals belong to the approve_requests command
+    approval_limit = 50
+
+    def post(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        action = request.POST.get('action')
+        # "all_pending" covers every request, not only the ones on the current page
+        request_ids = None if request.POST.get('all_pending') else [
+            request_id for request_id in request.POST.getlist('request_ids') if request_id.isdigit()
+        ]
+        if request_ids == []:
+            messages.error(request, "Select at least one request.")
+            return redirect('student_request_list')
+        if action == 'approve':
+            if request_ids is None:
+                request_ids = list(
+                    StudentRequest.objects.order_by('id').values_list('id', flat=True)[:self.approval_limit + 1]
+                )
+            if len(request_ids) > self.approval_limit:
+                messages.error(
+                    request,
+                    f"Approve at most {self.approval_limit} requests at a time here; "
+                    "use the approve_requests management command for larger batches.",
+                )
+                return redirect('student_request_list')
+            outcomes = approve_requests(request_ids)
+        elif action == 'reject':
+            outcomes = reject_requests(request_ids)
+        else:
+            messages.error(request, "Unknown action.")
+            return redirect('student_request_list')
+        done = [o for o in outcomes if o.status in ('approved', 'rejected')]
+        if done:
+            messages.success(request, f"{len(done)} student request(s) {'approved' if action == 'approve' else 'rejected'}.")
+        for outcome in outcomes:
+            if outcome.error:
+                messages.error(request, f"Request {outcome.request_id}: {outcome.error}")
+        return redirect('student_request_list')
     
 class AddStudentView(LoginRequiredMixin, View):
     login_url = 'login'
@@ -250,6 +284,51 @@ class AddStudentView(LoginRequiredMixin, View):
             messages.error(request, f"Error adding student: {str(e)}")
         return redirect('admin_dashboard')
 
+class RosterImportView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def render_page(self, request, form):
+        imports = RosterImport.objects.select_related('created_by').order_by('-id')[:20]
+        return render(request, 'core/roster_import.html', {
+            'form': form, 'imports': imports, 'stale_before': stale_cutoff(),
+        })
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        return self.render_page(request, RosterImportForm())
+
+    def post(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        form = RosterImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Validated and written in chunks by a background worker, not in this request
+            roster_import, queued = store_roster_upload(form.cleaned_data['kind'], request.FILES['file'], request.user)
+            if not queued:
+                messages.info(request, "An earlier import of this file is still running; its progress is shown below.")
+            elif roster_import.rows_processed:
+                messages.success(request, f"Resuming the earlier import of this file from row {roster_import.rows_processed + 1}.")
+            else:
+                messages.success(request, "Roster import started.")
+            return redirect('roster_import')
+        return self.render_page(request, form)
+
+class ResumeRosterImportView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def post(self, request, import_id):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        roster_import = get_object_or_404(RosterImport, id=import_id)
+        # A running import is only taken over once its worker has stopped reporting progress
+        if claim_roster_import(roster_import.id, stale_before=stale_cutoff()):
+            queue_roster_import(roster_import.id)
+            messages.success(request, f"Resuming {roster_import.original_name} after row {roster_import.rows_processed}.")
+        else:
+            messages.error(request, "Only failed or stalled imports can be resumed.")
+        return redirect('roster_import')
+
 class CreateCourseView(LoginRequiredMixin, View):
     login_url = 'login'
 
@@ -291,27 +370,104 @@ class AdminCourseListView(LoginRequiredMixin, View):
     def get(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
-        courses = Course.objects.all()
-        return render(request, 'core/admin_course_list.html', {'courses': courses})
+        filter_form = CourseFilterForm(request.GET)
+        courses = keyset_paginate(filter_form.filter(Course.objects.with_program()), request.GET)
+        return render(request, 'core/admin_course_list.html', {'courses': courses, 'filter_form': filter_form})
 
 class UpdateGradesView(LoginRequiredMixin, View):
     login_url = 'login'
 
+    def render_page(self, request, form=None, import_form=None, import_result=None):
+        return render(request, 'core/update_grades.html', {
+            'form': form or GradeForm(),
+            'import_form': import_form or GradeImportForm(),
+            'import_result': import_result,
+        })
+
     def get(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
-        form = GradeForm()
-        return render(request, 'core/update_grades.html', {'form': form})
+        return self.render_page(request)
 
     def post(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
         form = GradeForm(request.POST)
         if form.is_valid():
-            form.save()
+            student, course = form.cleaned_data['student'], form.cleaned_data['course']
+            upsert_grades({(student.id, course.id): form.cleaned_data['grade']})
             messages.success(request, "Grade updated successfully.")
             return redirect('update_grades')
-        return render(request, 'core/update_grades.html', {'form': form})
+        return self.render_page(request, form=form)
+
+class ImportGradesView(UpdateGradesView):
+    def post(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        import_form = GradeImportForm(request.POST, request.FILES)
+        if not import_form.is_valid():
+            return self.render_page(request, import_form=import_form)
+        try:
+            result = import_grades(request.FILES['file'], course=import_form.cleaned_data['course'])
+        except GradeImportError as e:
+            messages.error(request, str(e))
+            return self.render_page(request, import_form=import_form)
+        if result.error_count:
+            messages.error(request, f"No grades were imported: {result.error_count} row(s) have errors.")
+            return self.render_page(request, import_form=import_form, import_result=result)
+        messages.success(request, f"Imported {result.saved} grades.")
+        return redirect('update_grades')
+
+class CourseGradeSheetView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def render_sheet(self, request, course, values, errors):
+        enrollments = Enrollment.objects.filter(course=course).select_related('student__user').only(
+            'student__id', 'student__user__username', 'student__first_name', 'student__last_name',
+        ).order_by('student__user__username')
+        rows = [
+            {
+                'student': enrollment.student,
+                'value': values.get(enrollment.student_id, ''),
+                'error': errors.get(enrollment.student_id),
+            }
+            for enrollment in enrollments
+        ]
+        return render(request, 'core/grade_sheet.html', {'course': course, 'rows': rows})
+
+    def get(self, request, course_id):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        course = get_object_or_404(Course, id=course_id)
+        values = dict(Grade.objects.filter(course=course).values_list('student_id', 'grade'))
+        return self.render_sheet(request, course, values, {})
+
+    def post(self, request, course_id):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        course = get_object_or_404(Course, id=course_id)
+        enrolled = set(Enrollment.objects.filter(course=course).values_list('student_id', flat=True))
+        values, errors, grades = {}, {}, {}
+        for name, value in request.POST.items():
+            if not name.startswith('grade_') or not name[6:].isdigit():
+                continue
+            student_id, value = int(name[6:]), value.strip()
+            values[student_id] = value
+            if not value:
+                continue
+            grade = normalize_grade(value)
+            if student_id not in enrolled:
+                errors[student_id] = "Not enrolled in this course."
+            elif grade is None:
+                errors[student_id] = "Invalid grade."
+            else:
+                grades[(student_id, course.id)] = grade
+        if errors:
+            messages.error(request, "Some grades are invalid; nothing was saved.")
+            return self.render_sheet(request, course, values, errors)
+        saved = upsert_grades(grades)
+        messages.success(request, f"Saved {saved} grades for {course.course_name}.")
+        return redirect('course_grade_sheet', course_id=course.id)
 
 class ResetStudentPasswordView(LoginRequiredMixin, View):
     login_url = 'login'
@@ -319,15 +475,16 @@ class ResetStudentPasswordView(LoginRequiredMixin, View):
     def get(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
-        students = Student.objects.all()
-        return render(request, 'core/reset_student_password.html', {'students': students})
+        query = request.GET.get('q', '').strip()
+        students = keyset_paginate(search_students(query), request.GET)
+        return render(request, 'core/reset_student_password.html', {'students': students, 'query': query})
 
     def post(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
         student_id = request.POST.get('student')
         new_password = request.POST.get('new_password')
-        student = get_object_or_404(Student, id=student_id)
+        student = get_object_or_404(Student.objects.with_user(), id=student_id)
         student.user.set_password(new_password)
         student.user.save()
         # Update the notification message to exclude the password
@@ -337,7 +494,135 @@ class ResetStudentPasswordView(LoginRequiredMixin, View):
         )
         messages.success(request, "Password reset successfully.")
         return redirect('reset_student_password')
+
+def search_students(query):
+    students = Student.objects.for_picker()
+    if query:
+        students = students.filter(user__username__istartswith=query)
+    return students
+
+class StudentSearchView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        page = keyset_paginate(search_students(request.GET.get('q', '').strip()), request.GET)
+        return JsonResponse({
+            'results': [{'id': student.id, 'username': student.user.username} for student in page],
+            'next': page.next_cursor
+        })
+
+def search_courses(query):
+    courses = Course.objects.for_picker()
+    if query:
+        courses = courses.filter(course_name__istartswith=query)
+    return courses
+
+class CourseSearchView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        page = keyset_paginate(search_courses(request.GET.get('q', '').strip()), request.GET)
+        return JsonResponse({
+            'results': [{'id': course.id, 'name': course.course_name} for course in page],
+            'next': page.next_cursor
+        })
     
+def _search_scope(user):
+    """Course ids whose documents the user may find, or None for no restriction."""
+    if user.is_staff:
+        return None
+    student = Student.objects.filter(user=user).first()
+    if student is None:
+        return set()
+    return get_schedule_index(student).course_ids
+
+
+def _search_result_url(entry, is_staff, enrolled_ids):
+    if entry.kind == 'document':
+        return reverse('download_course_document', args=[entry.object_id])
+    if entry.kind == 'program':
+        return reverse('admin_course_list' if is_staff else 'courses') + f'?program={entry.object_id}'
+    if is_staff:
+        return reverse('upload_document', args=[entry.object_id])
+    if entry.object_id in enrolled_ids:
+        return reverse('view_course_documents', args=[entry.object_id])
+    return reverse('courses')
+
+class SearchView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        course_ids = _search_scope(request.user)
+        results = search.search(query, course_ids=course_ids) if query else []
+        for entry in results:
+            entry.url = _search_result_url(entry, request.user.is_staff, course_ids or ())
+        return render(request, 'core/search.html', {'query': query, 'results': results})
+
+class SearchAutocompleteView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request):
+        course_ids = _search_scope(request.user)
+        entries = search.autocomplete(request.GET.get('q', '').strip(), course_ids=course_ids)
+        return JsonResponse({
+            'results': [
+                {
+                    'kind': entry.kind,
+                    'title': entry.title,
+                    'url': _search_result_url(entry, request.user.is_staff, course_ids or ()),
+                }
+                for entry in entries
+            ]
+        })
+
+class BroadcastView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def render_page(self, request, form):
+        broadcasts = Broadcast.objects.select_related('course', 'program').order_by('-id')[:20]
+        return render(request, 'core/broadcast.html', {'form': form, 'broadcasts': broadcasts})
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        return self.render_page(request, BroadcastForm())
+
+    def post(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        form = BroadcastForm(request.POST)
+        if form.is_valid():
+            # Recipients are written by a background worker, not in this request
+            start_broadcast(
+                form.cleaned_data['message'],
+                created_by=request.user,
+                course=form.cleaned_data['course'],
+                program=form.cleaned_data['program']
+            )
+            messages.success(request, "Broadcast queued. Progress is shown below.")
+            return redirect('broadcast')
+        return self.render_page(request, form)
+
+class BroadcastStatusView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request, broadcast_id):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        broadcast = get_object_or_404(Broadcast, id=broadcast_id)
+        return JsonResponse({
+            'status': broadcast.status,
+            'sent': broadcast.sent,
+            'total': broadcast.total_recipients,
+            'error': broadcast.error
+        })
+
+@method_decorator(replica_reads, name='dispatch')
 class StudentCoursesView(LoginRequiredMixin, View):
     login_url = 'login'
 
@@ -349,9 +634,13 @@ class StudentCoursesView(LoginRequiredMixin, View):
             return redirect('logout')
         if not student.program:
             return redirect('register_program')
-        enrolled_courses = Enrollment.objects.filter(student=student).values_list('course_id', flat=True)
-        available_courses = Course.objects.exclude(id__in=enrolled_courses)
-        return render(request, 'core/courses.html', {'courses': available_courses})
+        # Flag courses that clash with the student's timetable so the page can grey them out
+        schedule = get_schedule_index(student)
+        filter_form = CourseFilterForm(request.GET)
+        courses = filter_form.filter(Course.objects.with_program().exclude(id__in=schedule.course_ids))
+        page = keyset_paginate(courses, request.GET)
+        schedule.annotate(page.items)
+        return render(request, 'core/courses.html', {'courses': page, 'filter_form': filter_form})
 
 class EnrollCourseView(LoginRequiredMixin, View):
     login_url = 'login'
@@ -367,19 +656,17 @@ class EnrollCourseView(LoginRequiredMixin, View):
             return redirect('register_program')
         course = get_object_or_404(Course, id=course_id)
         # Check for scheduling conflicts
-        existing_enrollments = Enrollment.objects.filter(
-            student=student,
-            day_of_week=course.day_of_week,
-            start_time__lt=course.end_time,
-            end_time__gt=course.start_time
-        )
-        if existing_enrollments.exists():
+        result = enroll_in_courses(student, [course])
+        if result.already_enrolled:
+            messages.info(request, f"You are already enrolled in {course.course_name}.")
+            return redirect('courses')
+        if result.conflicts:
             messages.error(request, f"Cannot enroll in {course.course_name}. It conflicts with your existing schedule on {course.day_of_week} from {course.start_time} to {course.end_time}.")
             return redirect('courses')
-        Enrollment.objects.create(student=student, course=course)
         messages.success(request, f"Enrolled in {course.course_name} successfully.")
         return redirect('courses')
 
+@method_decorator(replica_reads, name='dispatch')
 class TimetableView(LoginRequiredMixin, View):
     login_url = 'login'
 
@@ -391,23 +678,164 @@ class TimetableView(LoginRequiredMixin, View):
             return redirect('logout')
         if not student.program:
             return redirect('register_program')
-        enrollments = Enrollment.objects.filter(student=student)
-        return render(request, 'core/timetable.html', {'enrollments': enrollments})
+        # The version changes with the student's enrollments, so it doubles as the ETag and
+        # a repeat visit is answered from the cache without loading the timetable at all
+        version = timetable_version(student.id)
+        etag = timetable_etag(version, request.session.session_key or '')
+        if not len(messages.get_messages(request)):
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+        feed_url = None
+        if student.calendar_token:
+            feed_url = request.build_absolute_uri(reverse('timetable_feed', args=[student.calendar_token]))
+        response = render(request, 'core/timetable.html', {
+            'timetable': get_timetable(student, version),
+            'feed_url': feed_url,
+        })
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+class CalendarFeedTokenView(LoginRequiredMixin, View):
+    login_url = 'login'
 
+    def post(self, request):
+        try:
+            student = Student.objects.get(user=request.user)
+        except Student.DoesNotExist:
+            messages.error(request, "Student profile not found.")
+            return redirect('logout')
+        had_token = bool(student.calendar_token)
+        reset_calendar_token(student)
+        if had_token:
+            messages.success(request, "Your calendar link has been replaced. Update your calendar subscription.")
+        else:
+            messages.success(request, "Your calendar link is ready. Add it to your calendar app as a subscription.")
+        return redirect('timetable')
+
+class TimetableFeedView(View):
+    # No session: calendar apps authenticate with the secret token in the URL
+
+    def get(self, request, token):
+        student = student_for_token(token)
+        if student is None:
+            raise Http404
+        version, generated_at, body = get_calendar(student)
+        etag = f'"timetable-ics-{version}"'
+        last_modified = int(generated_at.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, max-age=900'
+        response['Content-Disposition'] = 'inline; filename="timetable.ics"'
+        return response
+
+@method_decorator(replica_reads, name='dispatch')
 class GradesView(LoginRequiredMixin, View):
     login_url = 'login'
 
     def get(self, request):
         try:
-            student = Student.objects.get(user=request.user)
+            # The GPA comes from the precomputed summary, joined in rather than recomputed
+            student = Student.objects.select_related('grade_summary').get(user=request.user)
         except Student.DoesNotExist:
             messages.error(request, "Student profile not found.")
             return redirect('logout')
         if not student.program:
             return redirect('register_program')
-        grades = Grade.objects.filter(student=student)
-        return render(request, 'core/grades.html', {'grades': grades})
+        grades = Grade.objects.for_student(student).for_student_page()
+        summary = getattr(student, 'grade_summary', None)
+        return render(request, 'core/grades.html', {'grades': grades, 'summary': summary})
+
+class GradeReportView(LoginRequiredMixin, View):
+    login_url = 'login'
 
+    def get(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        filter_form = CourseFilterForm(request.GET)
+        programs = ProgramGradeSummary.objects.select_related('program').filter(graded__gt=0).order_by('program__program_name')
+        courses = CourseGradeSummary.objects.select_related('course__program').filter(graded__gt=0)
+        if filter_form.is_valid():
+            for field in ('program', 'semester', 'day_of_week'):
+                if filter_form.cleaned_data[field]:
+                    courses = courses.filter(**{f'course__{field}': filter_form.cleaned_data[field]})
+        page = keyset_paginate(courses, request.GET)
+        distributions = grade_distributions([summary.course_id for summary in page])
+        for summary in page:
+            summary.distribution = distributions.get(summary.course_id, [])
+        return render(request, 'core/grade_report.html', {
+            'programs': programs, 'courses': page, 'filter_form': filter_form,
+        })
+
+class StudentGpaReportView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        summaries = StudentGradeSummary.objects.select_related('student__user', 'student__program').filter(graded__gt=0)
+        program_id = request.GET.get('program', '')
+        if program_id.isdigit():
+            summaries = summaries.filter(student__program_id=program_id)
+        page = keyset_paginate(summaries, request.GET)
+        programs = Program.objects.order_by('program_name')
+        return render(request, 'core/student_gpa_report.html', {
+            'students': page, 'programs': programs, 'program_id': program_id,
+        })
+
+class GradeReportExportView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request, scope):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        if scope not in EXPORT_SCOPES:
+            raise Http404
+        rows = export_rows(scope)
+        response = StreamingHttpResponse(stream_csv(next(rows), rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="grade-report-{scope}.csv"'
+        return response
+
+class DataExportView(LoginRequiredMixin, View):
+    login_url = 'login'
+    content_types = {'csv': 'text/csv', 'json': 'application/json'}
+
+    def get(self, request, kind, export_format):
+        if not request.user.is_staff:
+            return redirect('student_dashboard')
+        if kind not in EXPORTS or export_format not in EXPORT_FORMATS:
+            raise Http404
+        filter_form = CourseFilterForm(request.GET)
+        if not filter_form.is_valid():
+            return JsonResponse({'errors': filter_form.errors}, status=400)
+        program = filter_form.cleaned_data['program']
+        # Rows are fetched chunk by chunk while the response is being sent
+        response = StreamingHttpResponse(
+            stream_export(
+                kind, export_format,
+                program=program.id if program else None,
+                semester=filter_form.cleaned_data['semester'],
+            ),
+            content_type=self.content_types[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{export_format}"'
+        return response
+
+class MetricsView(View):
+    def get(self, request):
+        # Scrapers send METRICS_TOKEN as a bearer token; staff can look from the browser
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not (token and constant_time_compare(authorization, f'Bearer {token}')) and not request.user.is_staff:
+            return HttpResponse('Forbidden', status=403, content_type='text/plain')
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@method_decorator(replica_reads, name='dispatch')
 class ProfileView(LoginRequiredMixin, View):
     login_url = 'login'
 
@@ -425,19 +853,31 @@ class MarkNotificationReadView(LoginRequiredMixin, View):
     login_url = 'login'
 
     def post(self, request, notification_id):
-        notification = get_object_or_404(Notification, id=notification_id, user=request.user)
-        notification.read = True
-        notification.save()
+        if not mark_read(request.user, notification_id):
+            raise Http404("Notification not found.")
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'unread': unread_count(request.user)})
         messages.success(request, "Notification marked as read.")
         return redirect('student_dashboard')
+
+class MarkAllNotificationsReadView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def post(self, request):
+        updated = mark_all_read(request.user)
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'updated': updated, 'unread': 0})
+        messages.success(request, f"{updated} notification(s) marked as read.")
+        return redirect('student_dashboard')
 class CourseListView(LoginRequiredMixin, View):
     login_url = 'login'
 
     def get(self, request):
         if not request.user.is_staff:
             return redirect('student_dashboard')
-        courses = Course.objects.all()
-        return render(request, 'core/admin_course_list.html', {'courses': courses})
+        filter_form = CourseFilterForm(request.GET)
+        courses = keyset_paginate(filter_form.filter(Course.objects.with_program()), request.GET)
+        return render(request, 'core/admin_course_list.html', {'courses': courses, 'filter_form': filter_form})
     
 
 class UploadDocumentView(LoginRequiredMixin, View):
@@ -454,13 +894,61 @@ class UploadDocumentView(LoginRequiredMixin, View):
             return redirect('student_dashboard')
         course = get_object_or_404(Course, id=course_id)
         if 'document' in request.FILES:
-            document = request.FILES['document']
-            CourseDocument.objects.create(course=course, document=document)
+            # Stored content-addressed, so the same file uploaded to several courses is kept once
+            store_uploaded_file(course, request.FILES['document'])
             messages.success(request, f"Document uploaded successfully for {course.course_name}.")
             return redirect('course_list')
         else:
             messages.error(request, "Please select a file to upload.")
         return render(request, 'core/upload_document.html', {'course': course})
+class StartChunkedUploadView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def post(self, request, course_id):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        course = get_object_or_404(Course, id=course_id)
+        filename = request.POST.get('filename', '').strip()
+        size = request.POST.get('size', '')
+        if not filename or not size.isdigit():
+            return JsonResponse({'error': "filename and size are required."}, status=400)
+        session = start_upload(course, filename, int(size), request.user)
+        return JsonResponse({'upload_id': str(session.id), 'offset': 0}, status=201)
+
+class UploadChunkView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def status(self, session, status=200):
+        return JsonResponse({
+            'upload_id': str(session.id),
+            'offset': received_bytes(session),
+            'size': session.total_size,
+            'complete': session.document_id is not None
+        }, status=status)
+
+    def get(self, request, upload_id):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        # Clients resume an interrupted upload from the returned offset
+        return self.status(get_object_or_404(UploadSession, id=upload_id))
+
+    def put(self, request, upload_id):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        session = get_object_or_404(UploadSession.objects.select_related('course'), id=upload_id)
+        try:
+            start, length, total = parse_content_range(request.headers.get('Content-Range'))
+            if total != session.total_size:
+                raise UploadError("Content-Range total does not match the declared file size.")
+            offset = append_chunk(session, request, start, length)
+        except UploadError as e:
+            return JsonResponse({'error': str(e), 'offset': received_bytes(session)}, status=409)
+        if offset == session.total_size:
+            # Hashing a large file would hold this worker; 'complete' turns true once stored
+            queue_finish_upload(session.id)
+        return self.status(session)
+
+@method_decorator(replica_reads, name='dispatch')
 class ViewCourseDocumentsView(LoginRequiredMixin, View):
     login_url = 'login'
 
@@ -473,8 +961,34 @@ class ViewCourseDocumentsView(LoginRequiredMixin, View):
         if not Enrollment.objects.filter(student=student, course=course).exists():
             messages.error(request, "You are not enrolled in this course.")
             return redirect('student_dashboard')
-        documents = CourseDocument.objects.filter(course=course)
+        # Metadata and thumbnails come from processed fields; the extracted text is not needed here
+        documents = CourseDocument.objects.filter(course=course).defer('text').order_by('-uploaded_at')
         return render(request, 'core/view_course_documents.html', {
             'course': course,
             'documents': documents
-        })
\ No newline at end of file
+        })
+
+class DownloadCourseDocumentView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request, document_id):
+        document = get_object_or_404(CourseDocument.objects.defer('text'), id=document_id)
+        if not can_access_document(request.user, document):
+            messages.error(request, "You are not enrolled in this course.")
+            return redirect('student_dashboard')
+        try:
+            return serve_document(request, document)
+        except FileNotFoundError:
+            raise Http404("Document file not found.")
+
+class CourseDocumentThumbnailView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def get(self, request, document_id):
+        document = get_object_or_404(CourseDocument.objects.only('id', 'course_id', 'thumbnail'), id=document_id)
+        if not document.thumbnail or not can_access_document(request.user, document):
+            raise Http404("Thumbnail not found.")
+        response = FileResponse(document.thumbnail.open('rb'), content_type='image/png')
+        # Thumbnails are named by content hash, so they never change under the same URL for long
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
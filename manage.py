@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'whiteboard.settings')
+    # The test suite adds a stand-in read replica to the normal settings
+    settings_module = 'whiteboard.test_settings' if sys.argv[1:2] == ['test'] else 'whiteboard.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
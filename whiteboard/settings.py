@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,7 +42,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Outside SessionMiddleware, so session saves count as writes that pin to the primary
+    'core.replicas.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,11 +78,69 @@ WSGI_APPLICATION = 'whiteboard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=mysql for deployments with more than one replica, which can't share a SQLite
+# file; SQLite (the default) suits a single node.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'mysql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.environ.get('DB_NAME', 'whiteboard'),
+            'USER': os.environ.get('DB_USER', 'whiteboard'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '3306'),
+            # Each worker thread keeps its connection for CONN_MAX_AGE seconds and checks it
+            # is still alive before reusing it, instead of reconnecting on every request.
+            # Point DB_HOST at a pooler such as ProxySQL to share connections across pods.
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '300')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'charset': 'utf8mb4',
+                'isolation_level': 'read committed',
+                'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+            },
+        }
     }
+    # MySQL has no partial indexes; the unread-notification one is only needed on SQLite
+    SILENCED_SYSTEM_CHECKS = ['models.W037']
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Take the write lock at BEGIN, so concurrent writers queue on busy_timeout
+                # rather than failing when a read lock can't be upgraded mid-transaction
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Read replica for the read-only student views (core.replicas): DB_REPLICA_HOST for MySQL,
+# SQLITE_REPLICA_PATH for a replicated copy of the SQLite file. Tests use the primary.
+if DB_ENGINE == 'mysql' and os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {**DATABASES['default'], 'HOST': os.environ['DB_REPLICA_HOST'], 'TEST': {'MIRROR': 'default'}}
+elif DB_ENGINE != 'mysql' and os.environ.get('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        **DATABASES['default'], 'NAME': os.environ['SQLITE_REPLICA_PATH'], 'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+# How long a browser reads from the primary after it writes; keep above the replication lag
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
+# Applied to each new SQLite connection by core.db.configure_sqlite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '20000')),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
 }
 
 
@@ -121,6 +183,23 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+# Course document downloads: '' streams from Django, 'nginx' answers with
+# X-Accel-Redirect under DOCUMENT_ACCEL_REDIRECT_PREFIX, 'apache' with X-Sendfile
+DOCUMENT_SENDFILE_BACKEND = os.environ.get('DOCUMENT_SENDFILE_BACKEND', '')
+DOCUMENT_ACCEL_REDIRECT_PREFIX = os.environ.get('DOCUMENT_ACCEL_REDIRECT_PREFIX', '/protected/')
+
+# Request metrics served at /metrics: wall time of every request, queries and DB time
+# of a sampled fraction. Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1.0'))
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', '10'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# A broadcast delivery with no progress for this long is reclaimed by resume_broadcasts
+BROADCAST_STALE_SECONDS = int(os.environ.get('BROADCAST_STALE_SECONDS', '600'))
+
+# A web roster import with no progress for this long can be resumed from the import page
+ROSTER_STALE_SECONDS = int(os.environ.get('ROSTER_STALE_SECONDS', '600'))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
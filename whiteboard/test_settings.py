@@ -0,0 +1,9 @@
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, DB_ENGINE
+
+# A second SQLite database standing in for the read replica in core.tests.ReplicaRoutingTests.
+# It holds its own rows, so the tests can let it fall behind the primary; a real replica
+# (SQLITE_REPLICA_PATH / DB_REPLICA_HOST) is a TEST MIRROR of default instead. Without a
+# TEST NAME each alias gets its own in-memory test database.
+if DB_ENGINE != 'mysql':
+    DATABASES['test_replica'] = {**DATABASES['default'], 'TEST': {}}